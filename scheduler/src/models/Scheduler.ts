@@ -77,6 +77,46 @@ export class Scheduler implements SchedulerType {
 
     private statusCache = new Map<string, { ts: number; st: any }>();
 
+    // `systemctl show` text per unit, fetched for all tasks in one batch by
+    // get-task-instances.py (--status / --status-only) instead of two
+    // systemctl calls per task on every refresh.
+    private unitStateCache = new Map<string, { timer: string; service: string }>();
+    private unitStateCacheTs = 0;
+    private unitStateFetch: Promise<void> | null = null;
+
+    private storeUnitStates(states: Record<string, any>, ts = Date.now()) {
+        this.unitStateCache.clear();
+        for (const [unit, st] of Object.entries(states || {})) {
+            // service is null when systemd could not be queried for it
+            if (st && typeof st.service === 'string' && st.service) {
+                this.unitStateCache.set(unit, { timer: String(st.timer || ''), service: st.service });
+            }
+        }
+        this.unitStateCacheTs = ts;
+    }
+
+    private async batchedUnitState(unit: string): Promise<{ timer: string; service: string } | undefined> {
+        if (Date.now() - this.unitStateCacheTs >= 1000) { // same TTL as statusCache
+            if (!this.unitStateFetch) {
+                this.unitStateFetch = (async () => {
+                    try {
+                        const { stdout, exitStatus } = await runCommand(
+                            ['/usr/bin/env', 'python3', '-c', get_tasks_script, '--status-only'],
+                            { superuser: 'try' }
+                        );
+                        if (exitStatus === 0) this.storeUnitStates(JSON.parse(stdout || '{}'));
+                    } catch (e) {
+                        console.warn('batched unit status failed:', errorString(e));
+                    } finally {
+                        this.unitStateFetch = null;
+                    }
+                })();
+            }
+            await this.unitStateFetch;
+        }
+        return this.unitStateCache.get(unit);
+    }
+
     private async fetchStatus(ti: TaskInstanceType): Promise<any> {
         const tplKey = this.templateKey(ti, this.normalizeTemplateKey(ti.template.name));
         const key = `${tplKey}:${ti.name}`;
@@ -245,42 +285,49 @@ export class Scheduler implements SchedulerType {
             }
         }
 
-        // Legacy/direct path: query timer (optional) and service (required)
+        // Legacy/direct path: query timer (optional) and service (required),
+        // from the batched snapshot when it has this unit
         try {
-            // Timer is optional for manual-only tasks
-            try {
+            const batched = await this.batchedUnitState(unit);
+            if (batched) {
+                timerOut = batched.timer;
+                serviceOut = batched.service;
+            } else {
+                // Timer is optional for manual-only tasks
+                try {
+                    const { stdout, stderr, exitStatus } = await runCommand(
+                        [
+                            'systemctl', 'show', `${unit}.timer`, '--no-pager',
+                            '--property', 'LoadState,ActiveState,SubState,Result,LastTriggerUSec,NextElapseUSecRealtime,MergedUnit',
+                        ],
+                        { superuser: 'try' }
+                    );
+
+                    if (exitStatus === 0) {
+                        timerOut = stdout;
+                    } else if (!/not found/i.test(stdout) && !/not found/i.test(stderr)) {
+                        console.warn(`getDisplayMeta(timer ${unit}):`, stderr || stdout);
+                    }
+                } catch (e) {
+                    console.warn(`getDisplayMeta(timer ${unit}) error:`, errorString(e));
+                }
+
+                // Service is required
                 const { stdout, stderr, exitStatus } = await runCommand(
                     [
-                        'systemctl', 'show', `${unit}.timer`, '--no-pager',
-                        '--property', 'LoadState,ActiveState,SubState,Result,LastTriggerUSec,NextElapseUSecRealtime,MergedUnit',
+                        'systemctl', 'show', `${unit}.service`, '--no-pager',
+                        '--property', 'LoadState,ActiveState,SubState,Result,ActiveEnterTimestampUSec,ActiveEnterTimestamp,ExecMainStartTimestampUSec,ExecMainStartTimestamp,ExecMainExitTimestampUSec,ExecMainExitTimestamp,InactiveEnterTimestampUSec,InactiveEnterTimestamp,MergedUnit',
                     ],
                     { superuser: 'try' }
                 );
 
-                if (exitStatus === 0) {
-                    timerOut = stdout;
-                } else if (!/not found/i.test(stdout) && !/not found/i.test(stderr)) {
-                    console.warn(`getDisplayMeta(timer ${unit}):`, stderr || stdout);
+                if (exitStatus !== 0) {
+                    throw new Error(stderr || stdout || `systemctl show ${unit}.service failed with ${exitStatus}`);
                 }
-            } catch (e) {
-                console.warn(`getDisplayMeta(timer ${unit}) error:`, errorString(e));
-            }
-
-            // Service is required
-            const { stdout, stderr, exitStatus } = await runCommand(
-                [
-                    'systemctl', 'show', `${unit}.service`, '--no-pager',
-                    '--property', 'LoadState,ActiveState,SubState,Result,ActiveEnterTimestampUSec,ActiveEnterTimestamp,ExecMainStartTimestampUSec,ExecMainStartTimestamp,ExecMainExitTimestampUSec,ExecMainExitTimestamp,InactiveEnterTimestampUSec,InactiveEnterTimestamp,MergedUnit',
-                ],
-                { superuser: 'try' }
-            );
 
-            if (exitStatus !== 0) {
-                throw new Error(stderr || stdout || `systemctl show ${unit}.service failed with ${exitStatus}`);
+                serviceOut = stdout;
             }
 
-            serviceOut = stdout;
-
             const t = this.parseShow(timerOut);
             const s = this.parseShow(serviceOut);
 
@@ -618,10 +665,15 @@ export class Scheduler implements SchedulerType {
         // --- LEGACY backend ⇒ system tasks only
         try {
             const { stdout } = await runCommand(
-                ['/usr/bin/env', 'python3', '-c', get_tasks_script],
+                ['/usr/bin/env', 'python3', '-c', get_tasks_script, '--status'],
                 { superuser: 'try' }
             );
             const systemTasksData = safeParseItems(stdout);
+            const unitStates: Record<string, any> = {};
+            for (const task of systemTasksData) {
+                if (task?.unitState) unitStates[`houston_scheduler_${task.template}_${task.name}`] = task.unitState;
+            }
+            this.storeUnitStates(unitStates);
 
             for (const task of systemTasksData) {
                 try {
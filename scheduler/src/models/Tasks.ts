@@ -136,6 +136,7 @@ export class RsyncTaskTemplate extends TaskTemplate {
                 .addChild(new StringParameter('Additional Custom Arguments', 'custom_args', ''))
                 .addChild(new BoolParameter('Parallel Transfer', 'parallel_flag', false))
                 .addChild(new IntParameter('Threads', 'parallel_threads', 0))
+                .addChild(new BoolParameter('ZFS Incremental', 'zfs_diff_flag', false))
                 
             );
         super(name, parameterSchema);
@@ -259,6 +260,7 @@ export class CloudSyncTaskTemplate extends TaskTemplate {
                 .addChild(new StringParameter('Max Transfer Size Unit', 'max_transfer_size_unit', 'MiB'))
                 .addChild(new SelectionParameter('Cutoff Mode', 'cutoff_mode', 'HARD', cutoffModeSelection))
                 .addChild(new BoolParameter('No Traverse', 'no_traverse_flag', false))
+                .addChild(new BoolParameter('ZFS Incremental', 'zfs_diff_flag', false))
             )
 
         super(name, parameterSchema);
@@ -1,10 +1,26 @@
 import os
 import re
+import sys
 import json
+import argparse
 import subprocess
 
 currentTaskTemplates = ['ZfsReplicationTask', 'AutomatedSnapshotTask', 'ScrubTask', 'RsyncTask', 'SmartTest', 'CustomTask', 'CloudSyncTask']
 
+# Parsed task files, keyed by file name and validated by (mtime, size), so a
+# refresh only re-reads files that changed since the last one.
+CATALOG_PATH = '/var/cache/houston/scheduler/task-catalog.json'
+CATALOG_VERSION = 1
+
+# Everything the UI reads from `systemctl show` for a task's timer and service.
+UNIT_PROPERTIES = (
+    'LoadState,ActiveState,SubState,Result,LastTriggerUSec,LastTrigger,NextElapseUSecRealtime,'
+    'ActiveEnterTimestampUSec,ActiveEnterTimestamp,ExecMainStartTimestampUSec,ExecMainStartTimestamp,'
+    'ExecMainExitTimestampUSec,ExecMainExitTimestamp,InactiveEnterTimestampUSec,InactiveEnterTimestamp,MergedUnit'
+)
+# Units per `systemctl show` call; keeps argv well under the limit.
+SHOW_BATCH = 256
+
 
 class TaskScheduleInterval:
     def __init__(self, interval_data):
@@ -23,7 +39,7 @@ class TaskInstance:
         self.parameters = parameters
         self.schedule = schedule.__dict__
         self.notes = notes
-        
+
 
 def check_task_status(full_unit_name):
     # check the status of the timer
@@ -49,7 +65,7 @@ def read_json_schedule(json_path):
 
 def read_txt_notes(txt_path):
     with open(txt_path, 'r') as txt_file:
-        return txt_file.read() 
+        return txt_file.read()
 
 def find_template_basenames(template_dir):
     base_names = {}
@@ -57,81 +73,194 @@ def find_template_basenames(template_dir):
         if file.endswith('.service'):
             base_name = os.path.splitext(file)[0]
             base_names[base_name] = None  # Using None as a placeholder
-            
+
             # print(f"Loaded template basename: {base_name}")  # Debug: Check loaded template names
-            
+
     return base_names
 
 
-def find_valid_task_data_files(system_dir, template_basenames):
-    valid_files = {}
-    # Adjusted regex to match up to the last dot before extension
-    file_regex = re.compile(r"^houston_scheduler_([^_]+)_(.*)\.(env|json|txt)$")
+# Adjusted regex to match up to the last dot before extension
+TASK_FILE_REGEX = re.compile(r"^houston_scheduler_([^_]+)_(.*)\.(env|json|txt)$")
+
+READERS = {
+    'env': read_env_parameters,
+    'json': read_json_schedule,
+    'txt': read_txt_notes,
+}
+
+
+def load_catalog(path):
+    try:
+        with open(path, 'r') as f:
+            catalog = json.load(f)
+        if catalog.get('version') == CATALOG_VERSION:
+            return catalog.get('files', {})
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {}
+
+
+def save_catalog(path, files):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'w') as f:
+            json.dump({'version': CATALOG_VERSION, 'files': files}, f)
+        os.replace(tmp, path)
+    except OSError:
+        # Not running as root (or read-only cache): just skip the snapshot.
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+def scan_task_files(system_dir, template_basenames, catalog_path=CATALOG_PATH):
+    """Parsed contents of every task data file, from one directory scan.
+    Files whose mtime and size match the catalog are not opened again."""
+    cached = load_catalog(catalog_path) if catalog_path else {}
+    files = {}
+    changed = False
+
+    with os.scandir(system_dir) as entries:
+        for entry in entries:
+            match = TASK_FILE_REGEX.match(entry.name)
+            if not match or match.group(1) not in template_basenames:
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            stamp = [st.st_mtime_ns, st.st_size]
+            hit = cached.get(entry.name)
+            if hit and hit.get('stamp') == stamp:
+                files[entry.name] = hit
+                continue
+            try:
+                data = READERS[match.group(3)](entry.path)
+            except (OSError, UnicodeDecodeError):
+                continue
+            files[entry.name] = {'stamp': stamp, 'data': data}
+            changed = True
+
+    if catalog_path and (changed or len(files) != len(cached)):
+        save_catalog(catalog_path, files)
+    return files
 
-    for file in os.listdir(system_dir):
-        match = file_regex.match(file)
-        if match:
-            template_name, task_name_with_suffix, suffix = match.groups()
-            # Extract the task name correctly before appending the file to the list
-            if template_name in template_basenames:
-                if template_name not in valid_files:
-                    valid_files[template_name] = []
-                # Include the correct file format with the suffix
-                valid_files[template_name].append(file)
 
-    return valid_files
+def build_task_instances(task_files):
+    """TaskInstance per task that has an .env file, from scan_task_files()."""
+    paired_files = {}
+    for file, record in task_files.items():
+        template, task_name, suffix = TASK_FILE_REGEX.match(file).groups()
+        paired_files.setdefault((template, task_name), {})[suffix] = record['data']
 
-def create_task_instances(system_dir, valid_files):
     task_instances = []
+    for (template, task_name), file_dict in sorted(paired_files.items()):
+        if 'env' not in file_dict:
+            continue
+        schedule_data = file_dict.get('json')
+        if schedule_data:
+            schedule = TaskSchedule(schedule_data['enabled'], schedule_data['intervals'], schedule_data.get('runOnBoot', False))
+        else:
+            schedule = TaskSchedule(False, [])
+        notes = file_dict.get('txt') or ""
+        task_instances.append(TaskInstance(task_name, template, file_dict['env'], schedule, notes))
+    return task_instances
+
+
+def filter_task_instances(task_instances, templates=None, search=None, enabled=None):
+    out = []
+    search = (search or '').lower()
+    for instance in task_instances:
+        if templates and instance.template not in templates:
+            continue
+        if search and search not in instance.name.lower():
+            continue
+        if enabled is not None and bool(instance.schedule.get('enabled')) != enabled:
+            continue
+        out.append(instance)
+    return out
+
+
+def show_units(units):
+    """`systemctl show` output for each unit, from one call per SHOW_BATCH
+    units. Units systemd does not know map to ''; units missing from the
+    result could not be queried (the caller falls back to asking per unit)."""
+    shown = {}
+    for i in range(0, len(units), SHOW_BATCH):
+        batch = units[i:i + SHOW_BATCH]
+        try:
+            result = subprocess.run(
+                ['systemctl', 'show', '--no-pager', '--property', UNIT_PROPERTIES] + batch,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True,
+            )
+        except OSError:
+            break
+        # One block per unit, in argument order, separated by blank lines.
+        blocks = result.stdout.strip('\n').split('\n\n') if result.stdout.strip() else []
+        if len(blocks) != len(batch):
+            continue
+        for unit, block in zip(batch, blocks):
+            shown[unit] = '' if 'LoadState=not-found' in block else block + '\n'
+    return shown
+
+
+def unit_states(task_instances):
+    """{unit: {'timer': show text, 'service': show text}} for the tasks."""
+    bases = [f'houston_scheduler_{t.template}_{t.name}' for t in task_instances]
+    shown = show_units([f'{b}.{kind}' for b in bases for kind in ('timer', 'service')])
+    return {
+        base: {'timer': shown.get(f'{base}.timer', ''), 'service': shown.get(f'{base}.service')}
+        for base in bases
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='List scheduler task instances.')
+    parser.add_argument('--template', action='append', default=[], help='only these templates (repeatable, comma separated)')
+    parser.add_argument('--search', default='', help='task name contains this (case-insensitive)')
+    parser.add_argument('--enabled', choices=('yes', 'no'), help='only tasks whose schedule is (not) enabled')
+    parser.add_argument('--offset', type=int, help='skip this many tasks (returns a page object)')
+    parser.add_argument('--limit', type=int, help='at most this many tasks (returns a page object)')
+    parser.add_argument('--status', action='store_true', help="add each task's systemd timer/service state")
+    parser.add_argument('--status-only', action='store_true', help='print only {unit: state} for the selected tasks')
+    parser.add_argument('--no-cache', action='store_true', help='ignore and do not update the catalog snapshot')
+    return parser.parse_args(argv)
 
-    for template, files in valid_files.items():
-        paired_files = {}
-
-        for file in files:
-            full_base_name, ext = os.path.splitext(file)
-            # Remove the prefix and then split properly
-            task_name = full_base_name[len("houston_scheduler_" + template + "_"):]  # This strips the prefix and template
-
-            if task_name not in paired_files:
-                paired_files[task_name] = {}
-            paired_files[task_name][ext] = file
-
-        for task_name, file_dict in paired_files.items():
-            if '.env' in file_dict:
-                env_file_name = file_dict['.env']
-                parameters = read_env_parameters(os.path.join(system_dir, env_file_name))
-                
-                if '.json' in file_dict:
-                    json_file_name = file_dict['.json']
-                    schedule_data = read_json_schedule(os.path.join(system_dir, json_file_name))
-                    if schedule_data:
-                        schedule = TaskSchedule(schedule_data['enabled'], schedule_data['intervals'], schedule_data.get('runOnBoot', False))
-                    else:
-                        schedule = TaskSchedule(False, [])
-                else:
-                    schedule = TaskSchedule(False, [])
-                
-                if '.txt' in file_dict:
-                    notes_file_name = file_dict['.txt']
-                    notes_file_path = os.path.join(system_dir, notes_file_name)
-                    notes = read_txt_notes(notes_file_path)  # Read the notes from the .txt file
-                else:
-                    # notes = json.dumps(file_dict, indent=4)  # Convert dict to JSON string for readability
-                    notes = "" 
-
-                task_instance = TaskInstance(task_name, template, parameters, schedule, notes)
-                task_instances.append(task_instance)
-
-    return json.dumps([instance.__dict__ for instance in task_instances], indent=4)
 
 def main():
     system_dir = '/etc/systemd/system/'
+    args = parse_args(sys.argv[1:])
+
+    task_files = scan_task_files(system_dir, currentTaskTemplates, None if args.no_cache else CATALOG_PATH)
+    task_instances = build_task_instances(task_files)
+
+    templates = {t.strip() for arg in args.template for t in arg.split(',') if t.strip()}
+    enabled = None if args.enabled is None else args.enabled == 'yes'
+    task_instances = filter_task_instances(task_instances, templates, args.search, enabled)
+
+    if args.status_only:
+        print(json.dumps(unit_states(task_instances)))
+        return
+
+    total = len(task_instances)
+    paged = args.offset is not None or args.limit is not None
+    if paged:
+        start = max(0, args.offset or 0)
+        end = total if args.limit is None else start + max(0, args.limit)
+        task_instances = task_instances[start:end]
+
+    records = [instance.__dict__ for instance in task_instances]
+    if args.status:
+        states = unit_states(task_instances)
+        for instance, record in zip(task_instances, records):
+            record['unitState'] = states.get(f'houston_scheduler_{instance.template}_{instance.name}')
+
+    if paged:
+        print(json.dumps({'total': total, 'offset': start, 'limit': args.limit, 'tasks': records}, indent=4))
+    else:
+        print(json.dumps(records, indent=4))
 
-    # Check files in the system directory for those containing any of the task template names
-    valid_task_data_files = find_valid_task_data_files(system_dir, currentTaskTemplates)
-    
-    task_instances = create_task_instances(system_dir, valid_task_data_files)
-    print(task_instances)   
-    
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Admission control for scheduler tasks.
+
+Every task runs as its own systemd service, so when many timers fire at the
+same minute the replication, rsync, cloud sync and scrub jobs all start
+together and fight over the pools and the network. Tasks call admit() once
+at startup; it returns when a slot is free and holds that slot until the
+process exits.
+
+Limits live in scheduler.conf (0 or absent = unlimited):
+
+    [concurrency]
+    total = 6
+    per_pool = 2
+    replication = 2
+    rsync = 3
+    cloudsync = 2
+    scrub = 1
+    priority.replication = 20
+    pool.tank = 3
+
+A task needs one slot in each scope that applies to it: "total", its class
+and every pool it touches. Waiting tasks queue in priority order (higher
+first, then first come); a task is only admitted when no better-placed waiter
+needs one of the same scopes, so a stream of small jobs cannot starve a
+queued one. HOUSTON_TASK_PRIORITY in a task's environment overrides the
+class priority.
+
+State is a lock directory under /run: slot files held with flock (released
+by the kernel when a task exits or crashes, so nothing leaks) and one ticket
+file per waiting task. No daemon is involved.
+"""
+import configparser
+import fcntl
+import json
+import os
+import subprocess
+import time
+
+SCHEDULER_CONF_PATH = os.environ.get("HOUSTON_SCHEDULER_CONF", "/opt/45drives/houston/scheduler/scheduler.conf")
+ADMISSION_DIR = os.environ.get("HOUSTON_ADMISSION_DIR", "/run/houston/scheduler/admission")
+POLL_INTERVAL = 2.0
+
+
+class Limits:
+    """Concurrency limits and class priorities from [concurrency]."""
+
+    def __init__(self, total=0, per_pool=0, classes=None, pools=None, priorities=None):
+        self.total = total
+        self.per_pool = per_pool
+        self.classes = dict(classes or {})
+        self.pools = dict(pools or {})
+        self.priorities = dict(priorities or {})
+
+    def __bool__(self):
+        return bool(self.total or self.per_pool or any(self.classes.values()) or any(self.pools.values()))
+
+    def scopes(self, task_class, pools):
+        """{scope name: limit} for the scopes that constrain this task."""
+        out = {}
+        if self.total:
+            out["total"] = self.total
+        if self.classes.get(task_class):
+            out[f"class.{task_class}"] = self.classes[task_class]
+        for pool in pools:
+            limit = self.pools.get(pool, self.per_pool)
+            if limit:
+                out[f"pool.{pool}"] = limit
+        return out
+
+
+def _int(value):
+    try:
+        return max(0, int(str(value).strip()))
+    except (TypeError, ValueError):
+        return 0
+
+
+def load_limits(path=None):
+    path = path or SCHEDULER_CONF_PATH
+    config = configparser.ConfigParser(interpolation=None)
+    try:
+        if os.path.exists(path):
+            config.read(path)
+    except configparser.Error as e:
+        print(f"WARNING: {path}: {e}; task concurrency limits ignored")
+        return Limits()
+    if not config.has_section("concurrency"):
+        return Limits()
+    limits = Limits()
+    for key, value in config.items("concurrency"):
+        if key == "total":
+            limits.total = _int(value)
+        elif key == "per_pool":
+            limits.per_pool = _int(value)
+        elif key.startswith("pool."):
+            limits.pools[key[5:]] = _int(value)
+        elif key.startswith("priority."):
+            try:
+                limits.priorities[key[9:]] = int(value)
+            except ValueError:
+                pass
+        else:
+            limits.classes[key] = _int(value)
+    return limits
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Admission:
+    """Slots held by this process. They are flock()s, so they go away with
+    the process; release() just drops them early."""
+
+    def __init__(self, fds=(), waited=0.0):
+        self._fds = list(fds)
+        self.waited = waited
+
+    def release(self):
+        for fd in self._fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._fds = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _Queue:
+    def __init__(self, root):
+        self.root = root
+        self.tickets = os.path.join(root, "queue")
+        os.makedirs(self.tickets, exist_ok=True)
+        self._lock_path = os.path.join(root, "lock")
+
+    def locked(self):
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def enqueue(self, ticket):
+        name = f"{os.getpid()}.json"
+        path = os.path.join(self.tickets, name)
+        with open(path, "w") as f:
+            json.dump(ticket, f)
+        return path
+
+    def waiting(self):
+        """Live tickets in admission order; tickets of dead tasks are removed."""
+        out = []
+        for name in os.listdir(self.tickets):
+            path = os.path.join(self.tickets, name)
+            try:
+                with open(path) as f:
+                    ticket = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not _pid_alive(int(ticket.get("pid", 0))):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                continue
+            ticket["path"] = path
+            out.append(ticket)
+        out.sort(key=lambda t: (-t["priority"], t["since"], t["pid"]))
+        return out
+
+    def try_slots(self, scopes):
+        """One free slot per scope, all or nothing."""
+        fds = []
+        for scope, limit in sorted(scopes.items()):
+            scope_dir = os.path.join(self.root, scope)
+            os.makedirs(scope_dir, exist_ok=True)
+            got = None
+            for i in range(limit):
+                fd = os.open(os.path.join(scope_dir, f"slot-{i}"), os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    continue
+                got = fd
+                break
+            if got is None:
+                for fd in fds:
+                    os.close(fd)
+                return None
+            fds.append(got)
+        return fds
+
+
+def admit(task_class, pools=(), label="", notifier=None, limits=None, priority=None):
+    """Wait for a slot in every scope that limits this task and return the
+    Admission holding them. Queue position is reported as the systemd STATUS
+    while waiting. Returns immediately when no limit applies, and never
+    blocks a task on a broken admission directory."""
+    limits = load_limits() if limits is None else limits
+    pools = sorted({p for p in pools if p})
+    scopes = limits.scopes(task_class, pools)
+    if not scopes:
+        return Admission()
+    if priority is None:
+        env = os.environ.get("HOUSTON_TASK_PRIORITY", "").strip()
+        try:
+            priority = int(env) if env else limits.priorities.get(task_class, 0)
+        except ValueError:
+            priority = limits.priorities.get(task_class, 0)
+
+    try:
+        queue = _Queue(ADMISSION_DIR)
+    except OSError as e:
+        print(f"WARNING: admission directory {ADMISSION_DIR} unusable ({e}); starting without a slot")
+        return Admission()
+
+    label = label or task_class
+    start = time.time()
+    ticket = {"pid": os.getpid(), "class": task_class, "label": label,
+              "priority": priority, "since": start, "scopes": sorted(scopes)}
+    ticket_path = None
+    last_position = None
+    try:
+        while True:
+            lock_fd = queue.locked()
+            try:
+                if ticket_path is None:
+                    ticket_path = queue.enqueue(ticket)
+                waiting = queue.waiting()
+                mine = set(scopes)
+                ahead = []
+                for other in waiting:
+                    if other["pid"] == ticket["pid"]:
+                        break
+                    if mine.intersection(other["scopes"]):
+                        ahead.append(other)
+                fds = None if ahead else queue.try_slots(scopes)
+                if fds is not None:
+                    os.unlink(ticket_path)
+                    ticket_path = None
+                    waited = time.time() - start
+                    if last_position is not None:
+                        print(f"Admitted after waiting {int(waited)}s")
+                    return Admission(fds, waited)
+            finally:
+                os.close(lock_fd)
+
+            position = len(ahead) + 1
+            if position != last_position:
+                blocking = ", ".join(s.split(".", 1)[-1] for s in sorted(scopes))
+                if last_position is None:
+                    print(f"Waiting for a free {task_class} slot ({blocking}); position {position} in queue")
+                if notifier is not None:
+                    notifier.notify(f"STATUS=Queued: position {position} for {label} ({blocking})…")
+                last_position = position
+            time.sleep(POLL_INTERVAL)
+    except OSError as e:
+        print(f"WARNING: admission control failed ({e}); starting without a slot")
+        return Admission()
+    finally:
+        if ticket_path is not None:
+            try:
+                os.unlink(ticket_path)
+            except OSError:
+                pass
+
+
+def dataset_pool(path_or_dataset):
+    """Pool name for a dataset name or a path on a mounted ZFS dataset."""
+    value = (path_or_dataset or "").strip()
+    if not value:
+        return ""
+    if not value.startswith("/"):
+        return value.split("/", 1)[0]
+    try:
+        p = subprocess.run(["zfs", "list", "-H", "-o", "name", value],
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                           universal_newlines=True, timeout=30, check=False)
+    except (OSError, subprocess.TimeoutExpired):
+        return ""
+    name = p.stdout.strip().splitlines()[0] if p.returncode == 0 and p.stdout.strip() else ""
+    return name.split("/", 1)[0]
@@ -7,9 +7,12 @@ import os
 import re
 import time
 import traceback
-from typing import List, Optional, Tuple
+from typing import Iterator, List, Optional, Set, Tuple
 
 from notify import get_notifier
+from debuglog import get_debug_log
+from schedule_expr import match_current_tier
+from zfs_list import ZfsListStream
 
 
 class SafeStream:
@@ -57,15 +60,12 @@ notifier = get_notifier()
 DEBUG_LOG = os.environ.get("AUTOSNAP_DEBUG_LOG", "/tmp/autosnap_debug.log")
 DEBUG_ENABLED = os.environ.get("AUTOSNAP_DEBUG", "1").strip().lower() in ("1", "true", "yes", "on")
 
+_debug_log = get_debug_log(DEBUG_LOG) if DEBUG_ENABLED else None
+
 def dbg(msg: str):
     if not DEBUG_ENABLED:
         return
-    try:
-        line = f"{dt.datetime.now().isoformat()} {msg}\n"
-        with open(DEBUG_LOG, "a") as f:
-            f.write(line)
-    except Exception:
-        pass
+    _debug_log.write(f"{dt.datetime.now().isoformat()} {msg}")
 
 # Timeout (seconds) for a single `zfs destroy` call.  If a snapshot has
 # holds or clones the destroy can block indefinitely; this prevents that.
@@ -75,6 +75,10 @@ TASK_PROP = "com.45drives_scheduler:task_name"
 TIER_PROP = "com.45drives_scheduler:scheduler_interval_tier"
 
 class Snapshot:
+    # Recursive datasets can list hundreds of thousands of snapshots; keep
+    # records compact with no per-instance __dict__.
+    __slots__ = ("name", "guid", "creation_epoch", "task_tag", "tier_tag")
+
     def __init__(self, name: str, guid: str, creation_epoch: int, task_tag: Optional[str], tier_tag: Optional[str] = None):
         self.name = name
         self.guid = guid
@@ -148,6 +152,99 @@ def safe_destroy(snap_name: str) -> bool:
         return False
 
 
+# Upper bound (bytes) for snapshot names packed into one zfs argv, and on the
+# number of snapshots removed by a single `zfs destroy` call.
+ZFS_ARGV_BUDGET = int(os.environ.get("ZFS_ARGV_BUDGET", "65536"))
+ZFS_DESTROY_BATCH_MAX = int(os.environ.get("ZFS_DESTROY_BATCH", "500"))
+
+
+def _chunk_by_argv_budget(items: List[str], max_items: int = 0) -> Iterator[List[str]]:
+    """Yield lists of strings whose joined length stays within ZFS_ARGV_BUDGET."""
+    chunk: List[str] = []
+    size = 0
+    for item in items:
+        if chunk and (size + len(item) + 1 > ZFS_ARGV_BUDGET or (max_items and len(chunk) >= max_items)):
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(item)
+        size += len(item) + 1
+    if chunk:
+        yield chunk
+
+
+def _held_snapshots(names: List[str]) -> Tuple[Set[str], Set[str]]:
+    """
+    Check holds for many snapshots in as few `zfs holds` calls as possible.
+    Returns (held, unknown): names with user holds, and names whose hold state
+    could not be determined because their batch failed.
+    """
+    held: Set[str] = set()
+    unknown: Set[str] = set()
+    for chunk in _chunk_by_argv_budget(names):
+        try:
+            p = subprocess.run(
+                ["zfs", "holds", "-H"] + chunk,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True, timeout=ZFS_LIST_TIMEOUT,
+            )
+        except Exception as e:
+            dbg(f"holds check failed for {len(chunk)} snapshot(s): {e}")
+            unknown.update(chunk)
+            continue
+        for line in p.stdout.splitlines():
+            name = line.split("\t", 1)[0].strip()
+            if name:
+                held.add(name)
+        if p.returncode != 0:
+            dbg(f"holds check rc={p.returncode} for {len(chunk)} snapshot(s): {p.stderr.strip()}")
+            unknown.update(n for n in chunk if n not in held)
+    return held, unknown
+
+
+def bulk_destroy(snap_names: List[str]) -> Iterator[Tuple[str, bool]]:
+    """
+    Destroy many snapshots with a handful of processes: one hold check pass,
+    then one `zfs destroy ds@a,b,c` per dataset and batch. ZFS destroys such a
+    list atomically, so a failed batch is retried per snapshot via
+    safe_destroy(); held or undeterminable snapshots go that way directly.
+    Yields (name, destroyed) per snapshot as batches complete.
+    """
+    held, unknown = _held_snapshots(snap_names)
+    by_ds = {}
+    singles = []
+    for name in snap_names:
+        if name in held or name in unknown or "@" not in name:
+            singles.append(name)
+            continue
+        ds, suffix = name.split("@", 1)
+        by_ds.setdefault(ds, []).append(suffix)
+    dbg(f"bulk_destroy: {len(snap_names) - len(singles)} batched across {len(by_ds)} dataset(s), {len(held)} held, {len(unknown)} unknown")
+
+    for ds, suffixes in by_ds.items():
+        for chunk in _chunk_by_argv_budget(suffixes, max_items=ZFS_DESTROY_BATCH_MAX):
+            names = [f"{ds}@{suf}" for suf in chunk]
+            arg = f"{ds}@{','.join(chunk)}"
+            dbg(f"bulk_destroy: zfs destroy {arg}")
+            try:
+                subprocess.run(
+                    ["zfs", "destroy", arg],
+                    check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    universal_newlines=True, timeout=ZFS_DESTROY_TIMEOUT + len(chunk),
+                )
+            except (subprocess.TimeoutExpired, subprocess.CalledProcessError) as e:
+                detail = getattr(e, "stderr", None) or str(e)
+                dbg(f"bulk_destroy: batch of {len(chunk)} on {ds} failed ({detail.strip()}); retrying per snapshot")
+                for name in names:
+                    yield name, safe_destroy(name)
+                continue
+            for name in names:
+                yield name, True
+
+    for name in singles:
+        yield name, safe_destroy(name)
+
+
 def create_snapshot(filesystem: str, is_recursive: bool, task_name: str, custom_name: Optional[str], tier_idx=None) -> str:
     if not filesystem:
         print("ERROR: filesystem is empty", file=sys.stderr)
@@ -197,82 +294,50 @@ def create_snapshot(filesystem: str, is_recursive: bool, task_name: str, custom_
 
     return snapname
 
-def get_local_snapshots(filesystem: str) -> List[Snapshot]:
-    """
-    Use epoch for creation to avoid locale parsing.
-    We also fetch our user property to filter reliably.
-    """
-    snaps: List[Snapshot] = []
-    # names + GUIDs
-    try:
-        # -p makes numeric properties plain; list doesn't make creation epoch, so get via zfs get
-        names = run(["zfs", "list", "-H", "-t", "snapshot", "-r", "-o", "name,guid", filesystem], timeout=ZFS_LIST_TIMEOUT).stdout.splitlines()
-    except subprocess.TimeoutExpired:
-        print(f"ERROR: Timed out after {ZFS_LIST_TIMEOUT}s listing snapshots on {filesystem}. The pool may be degraded or unresponsive.", file=sys.stderr)
-        dbg(f"ERROR: Timed out listing snapshots on {filesystem}")
-        sys.exit(1)
-    except subprocess.CalledProcessError as e:
-        print(f"ERROR: zfs list failed: {e.stderr.strip()}", file=sys.stderr)
-        return snaps
-
-    if not names:
-        return snaps
+def _prop_value(raw: str) -> Optional[str]:
+    """Normalize a `zfs list -H` user property column ("-" means unset)."""
+    raw = raw.strip()
+    if not raw or raw == "-":
+        return None
+    return sys.intern(raw)
 
-    # Build name->guid
-    pairs: List[Tuple[str, str]] = []
-    for line in names:
-        parts = line.split("\t")
-        if len(parts) == 2:
-            pairs.append((parts[0], parts[1]))
 
-    # Batch get creation as epoch (-p) and our tag properties
+def _parse_snapshot_line(line: str) -> Optional[Snapshot]:
+    parts = line.rstrip("\n").split("\t")
+    if len(parts) < 5:
+        return None
     try:
-        props_out = run(["zfs", "get", "-H", "-p", "-r", "-o", "name,property,value", "creation", filesystem], timeout=ZFS_LIST_TIMEOUT).stdout.splitlines()
-        tag_out  = run(["zfs", "get", "-H", "-r", "-o", "name,property,value", TASK_PROP, filesystem], timeout=ZFS_LIST_TIMEOUT).stdout.splitlines()
-        tier_out = run(["zfs", "get", "-H", "-r", "-o", "name,property,value", TIER_PROP, filesystem], timeout=ZFS_LIST_TIMEOUT).stdout.splitlines()
-    except subprocess.TimeoutExpired:
-        print(f"ERROR: Timed out after {ZFS_LIST_TIMEOUT}s fetching snapshot properties on {filesystem}. The pool may be degraded or unresponsive.", file=sys.stderr)
-        dbg(f"ERROR: Timed out fetching snapshot properties on {filesystem}")
-        sys.exit(1)
-
-    creation_map = {}
-    for line in props_out:
-        try:
-            name, prop, value = line.split("\t")
-            if prop == "creation":
-                # value is epoch seconds with -p
-                creation_map[name] = int(value)
-        except ValueError:
-            continue
+        creation_epoch = int(parts[2])
+    except ValueError:
+        return None
+    return Snapshot(parts[0], parts[1], creation_epoch, _prop_value(parts[3]), _prop_value(parts[4]))
 
-    # Build tag map from ZFS properties
-    tag_map = {}
-    for line in tag_out:
-        try:
-            name, prop, value = line.split("\t")
-            if prop == TASK_PROP and value != "-":
-                tag_map[name] = value
-        except ValueError:
-            continue
 
-    # Build tier map from ZFS properties
-    tier_map = {}
-    for line in tier_out:
-        try:
-            name, prop, value = line.split("\t")
-            if prop == TIER_PROP and value != "-":
-                tier_map[name] = value
-        except ValueError:
-            continue
+def iter_local_snapshots(filesystem: str) -> ZfsListStream:
+    """
+    Stream snapshots of *filesystem* (recursive) straight from the `zfs list`
+    pipe. Creation is requested as epoch (-p) to avoid locale parsing, and our
+    ownership/tier user properties come in the same pass, so no separate
+    `zfs get` walks are needed. Check the exhausted stream with
+    _listing_failed().
+    """
+    cmd = ["zfs", "list", "-H", "-p", "-t", "snapshot", "-r",
+           "-o", f"name,guid,creation,{TASK_PROP},{TIER_PROP}", filesystem]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return ZfsListStream(proc, _parse_snapshot_line, timeout=ZFS_LIST_TIMEOUT)
 
-    for name, guid in pairs:
-        ce = creation_map.get(name)
-        if ce is None:
-            # fall back if missing
-            ce = int(dt.datetime.now().timestamp())
-        snaps.append(Snapshot(name, guid, ce, tag_map.get(name), tier_map.get(name)))
 
-    return snaps
+def _listing_failed(filesystem: str, listing: ZfsListStream) -> bool:
+    """Report a finished iter_local_snapshots() run. Exits on timeout; returns
+    True if the listing failed (callers treat that as no snapshots)."""
+    if listing.timed_out:
+        print(f"ERROR: Timed out after {ZFS_LIST_TIMEOUT}s listing snapshots on {filesystem}. The pool may be degraded or unresponsive.", file=sys.stderr)
+        dbg(f"ERROR: Timed out listing snapshots on {filesystem}")
+        sys.exit(1)
+    if listing.returncode != 0:
+        print(f"ERROR: zfs list failed: {listing.stderr_text().strip()}", file=sys.stderr)
+        return True
+    return False
 
 def _is_autosnap_task_snapshot(snap_name: str, task_name: str, custom_name: str = "") -> bool:
     """Check if a snapshot belongs to this task by name pattern (fallback).
@@ -325,11 +390,14 @@ def prune_snapshots_by_retention(filesystem: str, task_name: str, retention_time
         return
 
     cutoff = int(dt.datetime.now().timestamp()) - (retention_time * unit_seconds)
-    snaps = get_local_snapshots(filesystem)
-    dbg(f"prune: found {len(snaps)} total snapshots for {filesystem}")
 
+    # Stream the listing and keep only prune candidates, so memory does not
+    # grow with the number of snapshots on the dataset.
+    listing = iter_local_snapshots(filesystem)
+    seen = 0
     candidates = []
-    for s in snaps:
+    for s in listing:
+        seen += 1
         if s.name == exclude_snap:
             continue
 
@@ -352,7 +420,11 @@ def prune_snapshots_by_retention(filesystem: str, task_name: str, retention_time
         
         if s.creation_epoch <= cutoff:
             candidates.append(s)
-    
+
+    if _listing_failed(filesystem, listing):
+        candidates = []
+    dbg(f"prune: found {seen} total snapshots for {filesystem}")
+
     if not candidates:
         print("No snapshots to prune.")
         dbg("prune: no candidates")
@@ -367,16 +439,18 @@ def prune_snapshots_by_retention(filesystem: str, task_name: str, retention_time
     total = len(candidates)
     base = 20  # snapshot phase
     notifier.notify(f"STATUS=Pruning {total} old snapshot(s)… {base}% complete")
-    for idx, s in enumerate(candidates, start=1):
-        dbg(f"prune: destroying {s.name} ({idx}/{total})")
-        if safe_destroy(s.name):
+    last_pct = base
+    for idx, (name, ok) in enumerate(bulk_destroy([c.name for c in candidates]), start=1):
+        if ok:
             pruned += 1
-            print(f"Deleted snapshot: {s.name}")
+            print(f"Deleted snapshot: {name}")
         else:
             skipped += 1
 
         pct = 20 + int(idx * 80 / total)
-        notifier.notify(f"STATUS=Pruning {total} old snapshot(s)… {pct}% complete")
+        if pct != last_pct:
+            notifier.notify(f"STATUS=Pruning {total} old snapshot(s)… {pct}% complete")
+            last_pct = pct
 
     msg = f"Pruned {pruned} snapshot(s) older than {retention_time} {retention_unit}."
     if skipped:
@@ -397,80 +471,6 @@ def load_schedule_json(path: str):
         return None
 
 
-def _field_matches_value(pattern: str, current: int) -> bool:
-    """Check if a systemd calendar field pattern matches a value."""
-    pattern = str(pattern).strip()
-    if pattern == "*":
-        return True
-    if ".." in pattern:
-        parts = pattern.split("..")
-        try:
-            a, b = int(parts[0]), int(parts[1])
-            return a <= current <= b
-        except (ValueError, IndexError):
-            return False
-    if "/" in pattern:
-        parts = pattern.split("/")
-        try:
-            start, step = int(parts[0]), int(parts[1])
-            if step <= 0:
-                return False
-            return current >= start and (current - start) % step == 0
-        except (ValueError, IndexError):
-            return False
-    if "," in pattern:
-        try:
-            values = [int(v.strip()) for v in pattern.split(",")]
-            return current in values
-        except ValueError:
-            return False
-    # Single value — exact match
-    try:
-        return current == int(pattern)
-    except ValueError:
-        return False
-
-
-def _interval_matches_time(interval: dict, now) -> bool:
-    """Check if a schedule interval matches the current time."""
-    for field in ("minute", "hour", "day", "month", "year"):
-        val = interval.get(field, {}).get("value", "*")
-        if not _field_matches_value(val, getattr(now, field)):
-            return False
-    dow = interval.get("dayOfWeek", [])
-    if dow:
-        dow_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-        current_dow = dow_names[now.weekday()]
-        normalized_dow = [str(d).strip()[:3].title() for d in dow]
-        if current_dow not in normalized_dow:
-            return False
-    return True
-
-
-def _count_specificity(interval: dict) -> int:
-    count = 0
-    for field in ("minute", "hour", "day", "month", "year"):
-        val = str(interval.get(field, {}).get("value", "*")).strip()
-        if val != "*":
-            count += 1
-    if interval.get("dayOfWeek", []):
-        count += 1
-    return count
-
-
-def match_current_tier(intervals: list, now) -> int:
-    """Return index of best-matching interval for current time. Falls back to 0."""
-    matched = []
-    for idx, interval in enumerate(intervals):
-        if _interval_matches_time(interval, now):
-            matched.append((idx, _count_specificity(interval)))
-    if not matched:
-        return 0
-    # Most specific wins; on tie, prefer the lower index (more general / higher-priority)
-    matched.sort(key=lambda x: (x[1], -x[0]), reverse=True)
-    return matched[0][0]
-
-
 def main():
     try:
         filesystem = os.environ.get("autoSnapConfig_filesystem_dataset", "").strip()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""Time-of-day bandwidth limits shared by the replication, rsync and cloud
+sync scripts.
+
+The policy lives in scheduler.conf:
+
+    [bandwidth]
+    schedule = Mon-Fri 08:00-18:00 20M; 18:00-08:00 off
+
+    [bandwidth backup.example.com]
+    schedule = 08:00-18:00 5M
+
+A rule is `[days] HH:MM-HH:MM rate`. Days are `Mon-Fri`, `Sat,Sun` or a
+single day (default: every day); a window may run past midnight and belongs
+to the day it starts on. Rates are bytes per second with optional K/M/G
+(binary) suffix; `off`, `0` or `unlimited` lift the limit. The first rule
+that matches wins and no match means unlimited. A `[bandwidth <destination>]`
+section (remote host, or rclone remote name) replaces the global schedule
+for that destination.
+
+Each engine applies the policy natively: the replication copy loop via
+Throttle (follows window changes mid-transfer), pv/mbuffer rate flags on the
+direct-pipe paths, rsync --bwlimit, and an rclone --bwlimit timetable.
+"""
+import configparser
+import datetime
+import os
+import re
+import threading
+import time
+
+SCHEDULER_CONF_PATH = os.environ.get("HOUSTON_SCHEDULER_CONF", "/opt/45drives/houston/scheduler/scheduler.conf")
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+_RULE_RE = re.compile(
+    r"^(?:(?P<days>[A-Za-z]{3}(?:\s*[-,]\s*[A-Za-z]{3})*)\s+)?"
+    r"(?P<start>\d{1,2}:\d{2})\s*-\s*(?P<end>\d{1,2}:\d{2})\s*[= ]\s*(?P<rate>\S+)$"
+)
+# 2024-01-01 is a Monday; used to turn (weekday, minute) into a datetime.
+_MONDAY = datetime.datetime(2024, 1, 1)
+
+
+def parse_rate(text):
+    """Bytes/s from '20M', '512k', '1048576'; 0 for off/unlimited."""
+    t = str(text).strip().lower()
+    if t in ("", "off", "0", "none", "unlimited"):
+        return 0
+    m = re.match(r"^(\d+(?:\.\d+)?)\s*([bkmgt]?)(?:i?b)?(?:/s)?$", t)
+    if not m:
+        raise ValueError(f"bad rate {text!r}")
+    return int(float(m.group(1)) * _UNITS[m.group(2)])
+
+
+def format_rate(bps):
+    """Short human form used in logs and status lines."""
+    if not bps:
+        return "unlimited"
+    for unit, size in (("G", 1024 ** 3), ("M", 1024 ** 2), ("K", 1024)):
+        if bps >= size:
+            return f"{bps / size:.3g}{unit}/s"
+    return f"{bps}B/s"
+
+
+def _minutes(hhmm):
+    h, m = hhmm.split(":")
+    h, m = int(h), int(m)
+    if not (0 <= h <= 24 and 0 <= m < 60) or (h == 24 and m):
+        raise ValueError(f"bad time {hhmm!r}")
+    return h * 60 + m
+
+
+def _parse_days(text):
+    if not text:
+        return frozenset(range(7))
+    days = set()
+    for part in re.split(r"\s*,\s*", text.strip().lower()):
+        if "-" in part:
+            a, b = (DAYS.index(p.strip()[:3]) for p in part.split("-", 1))
+            d = a
+            while True:
+                days.add(d)
+                if d == b:
+                    break
+                d = (d + 1) % 7
+        else:
+            days.add(DAYS.index(part[:3]))
+    return frozenset(days)
+
+
+class BandwidthRule:
+    __slots__ = ("days", "start", "end", "rate")
+
+    def __init__(self, days, start, end, rate):
+        self.days = days
+        self.start = start
+        self.end = end
+        self.rate = rate
+
+    def matches(self, weekday, minute):
+        if self.start < self.end:
+            return weekday in self.days and self.start <= minute < self.end
+        # Runs past midnight (or all day when start == end).
+        return (weekday in self.days and minute >= self.start) or \
+            ((weekday - 1) % 7 in self.days and minute < self.end)
+
+    def __repr__(self):
+        return f"BandwidthRule({sorted(self.days)}, {self.start}, {self.end}, {self.rate})"
+
+
+def parse_rules(text):
+    """Rules from a `schedule` value (';' or newline separated)."""
+    rules = []
+    for raw in re.split(r"[;\n]", text or ""):
+        line = raw.strip()
+        if not line:
+            continue
+        m = _RULE_RE.match(line)
+        if not m:
+            raise ValueError(f"bad bandwidth rule {line!r}")
+        rules.append(BandwidthRule(
+            _parse_days(m.group("days")),
+            _minutes(m.group("start")),
+            _minutes(m.group("end")) % (24 * 60),
+            parse_rate(m.group("rate")),
+        ))
+    return rules
+
+
+class BandwidthPolicy:
+    """Rate in effect at a given time; cap (bytes/s) is a per-task limit
+    that tightens every window, including unlimited ones."""
+
+    def __init__(self, rules=(), cap=0, source=""):
+        self.rules = list(rules)
+        self.cap = int(cap or 0)
+        self.source = source
+
+    def __bool__(self):
+        return bool(self.rules) or bool(self.cap)
+
+    def with_cap(self, cap):
+        return BandwidthPolicy(self.rules, cap, self.source)
+
+    def _rate(self, weekday, minute):
+        rate = 0
+        for rule in self.rules:
+            if rule.matches(weekday, minute):
+                rate = rule.rate
+                break
+        if self.cap and (not rate or rate > self.cap):
+            rate = self.cap
+        return rate
+
+    def rate_at(self, when=None):
+        when = when or datetime.datetime.now()
+        return self._rate(when.weekday(), when.hour * 60 + when.minute)
+
+    def _boundaries(self):
+        points = {0}
+        for rule in self.rules:
+            points.add(rule.start)
+            points.add(rule.end)
+        return sorted(points)
+
+    def next_change(self, when=None):
+        """When the rate next differs from now (None if it never does)."""
+        when = (when or datetime.datetime.now()).replace(second=0, microsecond=0)
+        current = self.rate_at(when)
+        points = self._boundaries()
+        for day in range(8):
+            base = (when + datetime.timedelta(days=day)).replace(hour=0, minute=0)
+            for m in points:
+                t = base + datetime.timedelta(minutes=m)
+                if t > when and self.rate_at(t) != current:
+                    return t
+        return None
+
+    def rclone_timetable(self):
+        """--bwlimit value: a single rate, a daily timetable, or a weekly one
+        when rules are restricted to certain days."""
+        points = self._boundaries()
+        weekly = any(len(rule.days) < 7 for rule in self.rules)
+        entries = []
+        for day in (range(7) if weekly else (0,)):
+            for m in points:
+                if m >= 24 * 60:
+                    continue
+                rate = self._rate(day, m)
+                if entries and entries[-1][2] == rate:
+                    continue
+                entries.append((day, m, rate))
+        # The table wraps around: drop a leading entry that repeats the last.
+        if len(entries) > 1 and entries[0][2] == entries[-1][2]:
+            entries.pop(0)
+        if len({e[2] for e in entries}) <= 1:
+            return _rclone_rate(entries[0][2] if entries else 0)
+        out = []
+        for day, m, rate in entries:
+            stamp = f"{m // 60:02d}:{m % 60:02d}"
+            if weekly:
+                stamp = f"{DAYS[day].capitalize()}-{stamp}"
+            out.append(f"{stamp},{_rclone_rate(rate)}")
+        return " ".join(out)
+
+    def describe(self, when=None):
+        rate = self.rate_at(when)
+        nxt = self.next_change(when)
+        tail = f" until {nxt:%a %H:%M}" if nxt else ""
+        return f"{format_rate(rate)}{tail}"
+
+
+def _rclone_rate(bps):
+    return "off" if not bps else f"{max(1, bps // 1024)}K"
+
+
+def load_policy(destination=None, path=None):
+    """Policy for *destination* from scheduler.conf ([bandwidth <destination>]
+    if present, else [bandwidth]). Empty policy when nothing is configured or
+    the config is unreadable; a bad rule is reported and ignored."""
+    path = path or SCHEDULER_CONF_PATH
+    config = configparser.ConfigParser(interpolation=None)
+    try:
+        if os.path.exists(path):
+            config.read(path)
+    except configparser.Error as e:
+        print(f"WARNING: {path}: {e}; bandwidth schedule ignored")
+        return BandwidthPolicy()
+    for section in ([f"bandwidth {destination}"] if destination else []) + ["bandwidth"]:
+        if config.has_section(section):
+            try:
+                rules = parse_rules(config.get(section, "schedule", fallback=""))
+            except ValueError as e:
+                print(f"WARNING: [{section}] in {path}: {e}; bandwidth schedule ignored")
+                return BandwidthPolicy()
+            return BandwidthPolicy(rules, source=section)
+    return BandwidthPolicy()
+
+
+class Throttle:
+    """Token bucket for a copy loop that follows the policy over time: the
+    rate is re-read every `recheck` seconds, so a transfer speeds up or slows
+    down as it crosses windows."""
+
+    def __init__(self, policy, recheck=30.0, burst=0.25, on_change=None):
+        self._policy = policy
+        self._recheck = recheck
+        self._burst = burst
+        self._on_change = on_change
+        self._lock = threading.Lock()
+        self._rate = None
+        self._next_check = 0.0
+        self._allowance = 0.0
+        self._last = time.monotonic()
+
+    @property
+    def rate(self):
+        return self._rate or 0
+
+    def consume(self, n):
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._next_check:
+                rate = self._policy.rate_at()
+                if rate != self._rate:
+                    if self._rate is not None and self._on_change is not None:
+                        self._on_change(rate)
+                    self._rate = rate
+                    self._allowance = 0.0
+                self._next_check = now + self._recheck
+            if not self._rate:
+                self._last = now
+                return
+            self._allowance = min(
+                self._allowance + (now - self._last) * self._rate,
+                self._rate * self._burst,
+            )
+            self._last = now
+            self._allowance -= n
+            wait = -self._allowance / self._rate if self._allowance < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
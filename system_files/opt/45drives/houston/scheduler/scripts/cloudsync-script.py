@@ -6,10 +6,15 @@ import configparser
 from datetime import datetime, timedelta, timezone
 import requests
 import shlex
+import signal
 import re
 import traceback
 import time
 from notify import get_notifier
+from debuglog import get_debug_log
+from bandwidth import load_policy
+from admission import admit, dataset_pool
+import zfs_incremental
 
 
 class SafeStream:
@@ -47,14 +52,12 @@ notifier = get_notifier()
 DEBUG_LOG = os.environ.get("CLOUDSYNC_DEBUG_LOG", "/tmp/cloudsync_debug.log")
 DEBUG_ENABLED = os.environ.get("CLOUDSYNC_DEBUG", "1").strip().lower() in ("1", "true", "yes", "on")
 
+_debug_log = get_debug_log(DEBUG_LOG) if DEBUG_ENABLED else None
+
 def dbg(msg: str):
     if not DEBUG_ENABLED:
         return
-    try:
-        with open(DEBUG_LOG, "a") as f:
-            f.write(f"{datetime.now().isoformat()} {msg}\n")
-    except Exception:
-        pass
+    _debug_log.write(f"{datetime.now().isoformat()} {msg}")
 
 def int_from_env(name, default):
     return int_from_value(os.environ.get(name, str(default)), default)
@@ -321,8 +324,13 @@ def build_rclone_command(options):
         if options.get(key):
             command.append(flag)
 
-    if int(options['bandwidth_limit_kbps']) > 0:
-        command.append(f'--bwlimit={options["bandwidth_limit_kbps"]}')
+    # rclone follows a --bwlimit timetable itself, so the whole schedule is
+    # passed through; the task's limit caps every slot.
+    policy = load_policy(options.get('rclone_remote')).with_cap(int(options['bandwidth_limit_kbps']) * 1024)
+    if policy:
+        command.append(f'--bwlimit={policy.rclone_timetable()}')
+        if policy.rules:
+            print(f"Bandwidth schedule [{policy.source}]: {policy.describe()}")
 
     if options['include_pattern']:
         include_patterns = options['include_pattern'].split(',')
@@ -617,10 +625,73 @@ def execute_command(
         print("Rclone task execution completed.")
 
 
+def _exit_on_sigterm(signum, frame):
+    # systemd stops the task with SIGTERM; unwind through the finally
+    # blocks so an interrupted incremental run drops its snapshot.
+    sys.exit(128 + signum)
+
+
+def begin_incremental(options, src):
+    """Snapshot and `zfs diff` the local ZFS source of a push copy/sync task
+    (see zfs_incremental). Returns None, with the reason printed, when the
+    task runs a full scan."""
+    task_name = os.environ.get("taskName", "").strip()
+    if options['direction'] != 'push' or options['type'] not in ('copy', 'sync') or not task_name:
+        print("ZFS incremental mode applies to push copy/sync tasks; scanning the full source.")
+        return None
+    try:
+        # A base sent elsewhere, or through other filters, says nothing
+        # about what this destination is missing.
+        target = {
+            'remote': options['rclone_remote'],
+            'path': options['target_path'],
+            'type': options['type'],
+            'include': options['include_pattern'],
+            'exclude': options['exclude_pattern'],
+            'include_from': options['include_from_path'],
+            'exclude_from': options['exclude_from_path'],
+            'custom_args': options['custom_args'],
+        }
+        run = zfs_incremental.begin(src, f"cloudsync-{task_name}", include_dirs=False, sep=b"\n",
+                                    target=target)
+    except OSError as e:
+        print(f"WARNING: ZFS incremental mode unavailable ({e}); scanning the full source.")
+        return None
+    if run is None:
+        print(f"{src} is not on a mounted ZFS dataset; scanning the full source.")
+    elif run.full:
+        print(f"ZFS incremental: {run.full_reason}, full transfer from {run.snapshot}")
+    else:
+        print(f"ZFS incremental: {run.changed} changed and {run.removed} removed files "
+              f"between {run.previous} and {run.snapshot}")
+    dbg(f"incremental run: {run.__dict__ if run else None}")
+    return run
+
+
+def delete_removed(options, run, dest):
+    """Delete the run's removed files at the destination (sync tasks)."""
+    command = ['rclone', f'--config={RCLONE_CONF_PATH}', 'delete', '-v',
+               f'--files-from-raw={run.removed_list}']
+    if options.get('dry_run_flag'):
+        command.append('--dry-run')
+    command.append(dest)
+    print(f"Executing command: {' '.join(command)}")
+    notifier.notify("STATUS=Removing files deleted at the source…")
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    for line in result.stdout.splitlines():
+        dbg(line)
+        print(line)
+    if result.returncode != 0:
+        print(f"Error: rclone delete exited with code {result.returncode}")
+        sys.exit(result.returncode)
+
+
 def execute_rclone(options):
     """
     Validate token, refresh if necessary, and execute rclone task.
     """
+    run = None
+    ok = False
     try:
         config = load_rclone_config()
         remote_name = options.get('rclone_remote')
@@ -631,17 +702,47 @@ def execute_rclone(options):
 
         command = build_rclone_command(options)
         src, dest = construct_paths(options['local_path'], options['direction'], options['target_path'])
-        execute_command(
-            command,
-            src,
-            dest,
-            options.get('log_file_path') or None,
-            options.get('stall_timeout_seconds', DEFAULT_STALL_TIMEOUT_SECONDS),
-            options.get('progress_log_heartbeat_seconds', DEFAULT_PROGRESS_LOG_HEARTBEAT_SECONDS),
-        )
+
+        if options.get('zfs_diff_flag'):
+            signal.signal(signal.SIGTERM, _exit_on_sigterm)
+            run = begin_incremental(options, src)
+        if run is not None:
+            src = run.source
+            if not run.full:
+                if not run.changed and not (options['type'] == 'sync' and run.removed):
+                    print("No changes since the last run.")
+                    ok = True
+                    return
+                # Copy just the listed files; sync's deletions are the
+                # removed list, applied afterwards.
+                command[2] = 'copy'
+                command.append(f'--files-from-raw={run.changed_list}')
+
+        if run is None or run.full or run.changed:
+            execute_command(
+                command,
+                src,
+                dest,
+                options.get('log_file_path') or None,
+                options.get('stall_timeout_seconds', DEFAULT_STALL_TIMEOUT_SECONDS),
+                options.get('progress_log_heartbeat_seconds', DEFAULT_PROGRESS_LOG_HEARTBEAT_SECONDS),
+            )
+        if run is not None and not run.full and options['type'] == 'sync' and run.removed:
+            delete_removed(options, run, dest)
+        ok = True
     except Exception as e:
         print(f"Execution error: {e}")
         sys.exit(1)
+    finally:
+        if run is not None:
+            # A failed or dry run leaves the previous base in place.
+            try:
+                if ok and not options.get('dry_run_flag'):
+                    run.commit()
+                else:
+                    run.discard()
+            except OSError as e:
+                print(f"WARNING: could not record the ZFS incremental snapshot: {e}")
 
 
 def parse_arguments():
@@ -679,6 +780,7 @@ def parse_arguments():
         'max_transfer_size_unit': os.environ.get('cloudSyncConfig_rcloneOptions_max_transfer_size_unit', 'MiB'),
         'cutoff_mode': os.environ.get('cloudSyncConfig_rcloneOptions_cutoff_mode', 'HARD').lower(),
         'no_traverse_flag': str_to_bool(os.environ.get('cloudSyncConfig_rcloneOptions_no_traverse_flag', 'False')),
+        'zfs_diff_flag': str_to_bool(os.environ.get('cloudSyncConfig_rcloneOptions_zfs_diff_flag', 'False')),
         'log_file_path': os.environ.get('cloudSyncConfig_rcloneOptions_log_file_path', ''),
         'stats_interval': stats_interval_from_value(
             os.environ.get('cloudSyncConfig_rcloneOptions_stats_interval'),
@@ -711,6 +813,11 @@ def main():
         notifier.notify(f"STATUS=Running {mode_label}…")
         print(f"Starting rclone script ({mode_label.lower()})...")
 
+        # Wait for a cloud sync / pool slot; held until the task exits.
+        admit("cloudsync", [dataset_pool(options.get('local_path', ''))],
+              label=os.environ.get("taskName", "") or options.get('rclone_remote', ''), notifier=notifier)
+        notifier.notify(f"STATUS=Running {mode_label}…")
+
         execute_rclone(options)
 
         notifier.notify(f"STATUS={mode_label} completed successfully")
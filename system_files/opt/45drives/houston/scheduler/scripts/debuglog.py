@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Buffered, size-rotated debug log shared by the task scripts.
+
+dbg() used to open, append to and close its log file for every line; the
+rsync and rclone scripts log each line of their child's output, which on a
+big transfer is millions of open/close calls and a file that never stops
+growing. DebugLog queues lines in memory and a background thread writes
+them through one open descriptor, when HOUSTON_DEBUG_FLUSH_INTERVAL seconds
+have passed or HOUSTON_DEBUG_FLUSH_BYTES are pending. The file is rotated to
+.1 .. .N (HOUSTON_DEBUG_LOG_BACKUPS, default 3) once it reaches
+HOUSTON_DEBUG_LOG_MAX_BYTES (default 50 MiB; 0 disables rotation).
+
+Several tasks may share one log file (all replication tasks use
+/tmp/zfs_rep_debug.log), so writes use O_APPEND, rotation happens under an
+flock, and a writer whose file was rotated by another process reopens it.
+Pending lines are written at interpreter exit and on SIGTERM.
+"""
+import atexit
+import fcntl
+import os
+import signal
+import threading
+import time
+
+
+def _env_number(name, default, cast=int):
+    try:
+        return max(0, cast(os.environ.get(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+MAX_BYTES = _env_number("HOUSTON_DEBUG_LOG_MAX_BYTES", 50 * 1024 * 1024)
+BACKUPS = _env_number("HOUSTON_DEBUG_LOG_BACKUPS", 3)
+FLUSH_INTERVAL = _env_number("HOUSTON_DEBUG_FLUSH_INTERVAL", 1.0, float)
+FLUSH_BYTES = _env_number("HOUSTON_DEBUG_FLUSH_BYTES", 64 * 1024)
+
+
+class DebugLog:
+    def __init__(self, path, max_bytes=MAX_BYTES, backups=BACKUPS,
+                 flush_interval=FLUSH_INTERVAL, flush_bytes=FLUSH_BYTES):
+        self.path = path
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._flush_interval = flush_interval
+        self._flush_bytes = flush_bytes
+        self._cond = threading.Condition()
+        self._pending = []
+        self._pending_bytes = 0
+        self._write_lock = threading.RLock()
+        self._fd = None
+        self._thread = threading.Thread(target=self._run, name="debuglog", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def write(self, line):
+        """Queue one line (a newline is added). Never blocks on disk I/O."""
+        data = line if line.endswith("\n") else line + "\n"
+        with self._cond:
+            self._pending.append(data)
+            self._pending_bytes += len(data)
+            if self._pending_bytes >= self._flush_bytes:
+                self._cond.notify()
+
+    def flush(self):
+        with self._cond:
+            lines, self._pending = self._pending, []
+            self._pending_bytes = 0
+        if lines:
+            self._write("".join(lines).encode("utf-8", "replace"))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self._flush_interval
+                while self._pending_bytes < self._flush_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            self.flush()
+
+    def _open(self):
+        if self._fd is not None:
+            try:
+                # Another process may have rotated the file away from us.
+                if os.stat(self.path).st_ino == os.fstat(self._fd).st_ino:
+                    return self._fd
+            except OSError:
+                pass
+            self._close()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _close(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+
+    def _write(self, data):
+        with self._write_lock:
+            try:
+                fd = self._open()
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                if self._max_bytes and os.fstat(fd).st_size >= self._max_bytes:
+                    self._rotate(fd)
+            except OSError:
+                # Debug logging must never take a task down.
+                self._close()
+
+    def _rotate(self, fd):
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            # Re-check under the lock: another writer may have rotated already.
+            if os.stat(self.path).st_ino != os.fstat(fd).st_ino:
+                return
+            if self._backups:
+                for i in range(self._backups - 1, 0, -1):
+                    src = f"{self.path}.{i}"
+                    if os.path.exists(src):
+                        os.replace(src, f"{self.path}.{i + 1}")
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.truncate(self.path, 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._close()
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def _flush_all():
+    for log in list(_logs.values()):
+        log.flush()
+
+
+def _install_sigterm_flush():
+    # systemd stops a task with SIGTERM, which would otherwise end the
+    # interpreter without running atexit. Only take over the default action.
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL:
+        return
+
+    def _on_sigterm(signum, frame):
+        _flush_all()
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+    signal.signal(signal.SIGTERM, _on_sigterm)
+
+
+def get_debug_log(path):
+    """Process-wide DebugLog for path (one writer thread per file)."""
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None:
+            if not _logs:
+                _install_sigterm_flush()
+            log = _logs[path] = DebugLog(path)
+        return log
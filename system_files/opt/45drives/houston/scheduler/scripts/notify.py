@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
+import atexit
 import os
 import socket
 import sys
+import threading
+import time
 
 try:
     # Optional dependency
@@ -52,5 +55,91 @@ class Notifier:
                     self._warned = True
 
 
+class CoalescingNotifier:
+    """Wraps Notifier so callers in copy loops never block on the systemd socket.
+
+    STATUS= updates are handed to a background thread that keeps only the
+    latest one and sends at most one every `min_interval` seconds. Anything
+    else (READY=1, STOPPING=1, ERRNO=...) goes out immediately, after any
+    pending STATUS so ordering is preserved. The pending STATUS is flushed
+    at interpreter exit, so a task's last status is never lost to
+    coalescing. Taking a pending message and sending it happen together
+    under one lock, so a STATUS popped by the worker can never be sent after
+    a newer one.
+    """
+
+    def __init__(self, inner, min_interval=0.5):
+        self._inner = inner
+        self._min_interval = min_interval
+        self._cond = threading.Condition()
+        self._pending = None
+        self._last_sent = None
+        self._last_time = 0.0
+        self._send_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="notify", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def notify(self, message: str):
+        if not message.startswith("STATUS="):
+            with self._send_lock:
+                self._flush_locked()
+                self._send_locked(message)
+            return
+        with self._cond:
+            self._pending = message
+            self._cond.notify()
+
+    def flush(self):
+        with self._send_lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        with self._cond:
+            message, self._pending = self._pending, None
+        if message is not None:
+            self._send_locked(message)
+
+    def _send_locked(self, message):
+        if message == self._last_sent and message.startswith("STATUS="):
+            return
+        self._inner.notify(message)
+        self._last_sent = message
+        self._last_time = time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                wait = self._last_time + self._min_interval - time.monotonic()
+                if wait > 0:
+                    # Let newer updates replace this one until the slot opens.
+                    self._cond.wait(wait)
+                    continue
+            # The pending message may have been flushed or replaced since;
+            # take whatever is current only once the send lock is held.
+            with self._send_lock:
+                self._flush_locked()
+
+
+_shared = None
+
+
 def get_notifier():
-    return Notifier()
+    """Process-wide notifier shared by all callers.
+
+    HOUSTON_NOTIFY_ASYNC=0 returns a plain synchronous Notifier;
+    HOUSTON_NOTIFY_INTERVAL sets the minimum seconds between STATUS updates.
+    """
+    global _shared
+    if _shared is None:
+        if os.getenv("HOUSTON_NOTIFY_ASYNC", "1").strip().lower() in ("0", "false", "no", "off"):
+            _shared = Notifier()
+        else:
+            try:
+                interval = float(os.getenv("HOUSTON_NOTIFY_INTERVAL", "0.5"))
+            except ValueError:
+                interval = 0.5
+            _shared = CoalescingNotifier(Notifier(), min_interval=max(0.0, interval))
+    return _shared
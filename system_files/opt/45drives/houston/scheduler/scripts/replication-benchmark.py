@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the replication transfer engines.
+
+Drives stream_with_progress, stream_with_progress_stall, stream_with_splice
+and _direct_pipe_transfer from replication-script.py with a synthetic send
+stream, so ZFS_REP_CHUNK_SIZE / ZFS_REP_MBUFFER_BLOCK / ZFS_REP_SPLICE /
+ZFS_REP_DIRECT_PIPE defaults can be chosen from numbers rather than guesses.
+No pool is needed: `zfs send` is a generator process, `zfs recv` a sink, and
+mbuffer/nc are used when installed or replaced by cat and a local TCP relay.
+
+--compress compares ZFS_REP_WIRE_COMPRESS settings over the TCP relay, which
+--link-mbps can throttle to a WAN-like rate; --compressible sets how much of
+the synthetic stream compresses. Throughput is always of uncompressed bytes.
+--transport stripe runs replication-stripe.py (ZFS_REP_NC_STREAMS) over
+loopback with --streams connections.
+
+Examples:
+  replication-benchmark.py --size 2G
+  replication-benchmark.py --size 1G --chunk-sizes 64k,1M --burst 8M --pause-ms 20
+  replication-benchmark.py --engines stall,splice --transport tcp --json
+  replication-benchmark.py --engines splice --transport stripe --streams 8
+  replication-benchmark.py --engines stall --chunk-sizes 1M --compress none,lz4,zstd:1,zstd:3 \\
+      --compressible 60 --link-mbps 200
+"""
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ENGINES = ("loop", "stall", "splice", "direct")
+
+# Stand-in for `zfs send`: SIZE bytes in BLOCK writes, pausing PAUSE seconds
+# after every BURST bytes (0 = steady stream). Blocks are cut from a 32 MiB
+# pool that is cycled, so the generator costs almost no CPU and compressors
+# cannot match whole repeated blocks within their window; PCT percent of each
+# block is repetitive text, the rest random.
+GENERATOR = r"""
+import os, sys, time
+size, block, burst, pause, pct = int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]), float(sys.argv[4]), int(sys.argv[5])
+text = block * pct // 100
+phrase = b"snapshot houston replication 0123456789 "
+filler = (phrase * (text // len(phrase) + 1))[:text]
+nblocks = max(1, min(size, 32 << 20) // block)
+pool = memoryview(b"".join(filler + os.urandom(block - text) for _ in range(nblocks)))
+sent = since = 0
+while sent < size:
+    n = min(block, size - sent)
+    off = (sent // block % nblocks) * block
+    view = pool[off:off + n]
+    while view:
+        w = os.write(1, view)
+        view = view[w:]
+    sent += n
+    since += n
+    if burst and since >= burst:
+        since = 0
+        time.sleep(pause)
+"""
+
+# Stand-ins for `nc -l` (receiver; drains to /dev/null, or to stdout with
+# "fwd" so a decompressor can follow) and `nc host port` (optionally paced to
+# MBPS megabit/s, writing the byte count to COUNT_FILE). The port goes to
+# stderr so stdout stays free for data.
+TCP_SINK = r"""
+import os, socket, sys
+fwd = len(sys.argv) > 1 and sys.argv[1] == "fwd"
+srv = socket.socket()
+srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+srv.bind(("127.0.0.1", 0))
+srv.listen(1)
+sys.stderr.write("%d\n" % srv.getsockname()[1])
+sys.stderr.flush()
+conn, _ = srv.accept()
+while True:
+    b = conn.recv(1 << 20)
+    if not b:
+        break
+    if fwd:
+        view = memoryview(b)
+        while view:
+            view = view[os.write(1, view):]
+"""
+
+TCP_SEND = r"""
+import os, socket, sys, time
+port, mbps, count_file = int(sys.argv[1]), float(sys.argv[2]), sys.argv[3]
+rate = mbps * 1e6 / 8
+s = socket.create_connection(("127.0.0.1", port))
+sent, start = 0, time.monotonic()
+while True:
+    b = os.read(0, 1 << 16)
+    if not b:
+        break
+    s.sendall(b)
+    sent += len(b)
+    if rate:
+        ahead = sent / rate - (time.monotonic() - start)
+        if ahead > 0:
+            time.sleep(ahead)
+s.shutdown(socket.SHUT_WR)
+s.close()
+if count_file:
+    with open(count_file, "w") as f:
+        f.write(str(sent))
+"""
+
+
+def parse_size(text):
+    text = str(text).strip().lower().rstrip("b").rstrip("i")
+    mult = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+    if text and text[-1] in mult:
+        return int(float(text[:-1]) * mult[text[-1]])
+    return int(text)
+
+
+def load_replication(debug):
+    if not debug:
+        os.environ["ZFS_REP_DEBUG"] = "0"
+    sys.path.insert(0, HERE)
+    spec = importlib.util.spec_from_file_location(
+        "replication_script", os.path.join(HERE, "replication-script.py")
+    )
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+class CountingNotifier:
+    """Replaces the sd_notify notifier: counts STATUS updates and the time
+    spent formatting/sending them instead of talking to systemd."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def notify(self, message):
+        t = time.perf_counter()
+        message.encode("utf-8")
+        self.count += 1
+        self.seconds += time.perf_counter() - t
+
+
+def _cpu():
+    me = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return me.ru_utime + me.ru_stime, kids.ru_utime + kids.ru_stime
+
+
+def _free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return str(port)
+
+
+def _tcp_link(args, codec, count_file):
+    """Start the receiving end of the TCP stand-in (plus decompressor when
+    codec is set). Returns (send_cmd, procs); send_cmd reads the stream on stdin.
+    The stripe transport runs replication-stripe.py over loopback instead."""
+    if args.transport == "stripe":
+        stripe = [sys.executable, os.path.join(HERE, "replication-stripe.py")]
+        common = ["--port", _free_port(), "--streams", str(args.streams)]
+        sink = subprocess.Popen(
+            stripe + ["recv", "--listen", "--bind", "127.0.0.1"] + common,
+            stdout=subprocess.PIPE if codec else subprocess.DEVNULL,
+        )
+        send_cmd = stripe + ["send", "--host", "127.0.0.1"] + common
+    else:
+        sink = subprocess.Popen(
+            [sys.executable, "-c", TCP_SINK] + (["fwd"] if codec else []),
+            stdout=subprocess.PIPE if codec else subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        port = sink.stderr.readline().decode().strip()
+        send_cmd = [sys.executable, "-c", TCP_SEND, port, str(args.link_mbps), count_file]
+    procs = [sink]
+    if codec:
+        unpack = subprocess.Popen(codec.decompress_args, stdin=sink.stdout, stdout=subprocess.DEVNULL)
+        sink.stdout.close()
+        procs.append(unpack)
+        send_cmd = codec.feeding(send_cmd)
+    return send_cmd, procs
+
+
+def _recv_chain(args, mbuffer_cmd, codec, count_file):
+    """Start mbuffer stand-in -> [tcp relay] -> sink. Returns (first_proc, procs)."""
+    if args.transport in ("tcp", "stripe"):
+        send_cmd, procs = _tcp_link(args, codec, count_file)
+        sender = subprocess.Popen(send_cmd, stdin=subprocess.PIPE)
+        procs.append(sender)
+        downstream = sender.stdin
+    else:
+        sink = subprocess.Popen(["sh", "-c", "cat >/dev/null"], stdin=subprocess.PIPE)
+        procs = [sink]
+        downstream = sink.stdin
+    mbuf = subprocess.Popen(mbuffer_cmd, stdin=subprocess.PIPE, stdout=downstream, stderr=subprocess.DEVNULL)
+    downstream.close()
+    procs.insert(0, mbuf)
+    return mbuf, procs
+
+
+def run_once(rep, engine, chunk, args, mbuffer_cmd, codec=None):
+    counter = CountingNotifier()
+    rep.notifier = counter
+    os.environ["ZFS_REP_CHUNK_SIZE"] = str(chunk)
+
+    gen_cmd = [
+        sys.executable, "-c", GENERATOR, str(args.size), str(args.gen_block),
+        str(args.burst), str(args.pause_ms / 1000.0), str(args.compressible),
+    ]
+    fd, count_file = tempfile.mkstemp(prefix="repbench-wire-")
+    os.close(fd)
+    self0, kids0 = _cpu()
+    start = time.perf_counter()
+
+    src = subprocess.Popen(gen_cmd, stdout=subprocess.PIPE)
+    if engine == "direct":
+        if args.transport in ("tcp", "stripe"):
+            recv_cmd, extra = _tcp_link(args, codec, count_file)
+        else:
+            recv_cmd = ["sh", "-c", "cat >/dev/null"]
+            extra = []
+        ok, err = rep._direct_pipe_transfer(src, mbuffer_cmd, recv_cmd, args.size, "Benchmark", stall_timeout=0)
+        for p in extra:
+            p.wait()
+        if not ok:
+            raise RuntimeError(err)
+        sent = args.size
+    else:
+        first, procs = _recv_chain(args, mbuffer_cmd, codec, count_file)
+        if engine == "loop":
+            sent, broken = rep.stream_with_progress(src.stdout, first.stdin, args.size, label="Benchmark", chunk_size=chunk)
+        elif engine == "stall":
+            sent, broken = rep.stream_with_progress_stall(src.stdout, first.stdin, args.size, label="Benchmark", stall_timeout=3600)
+        else:
+            sent, broken = rep.stream_with_splice(src.stdout, first.stdin, args.size, label="Benchmark", stall_timeout=3600)
+        first.stdin.close()
+        src.wait()
+        for p in procs:
+            p.wait()
+        if broken:
+            raise RuntimeError("downstream pipe broke")
+
+    wall = time.perf_counter() - start
+    self1, kids1 = _cpu()
+    try:
+        with open(count_file) as f:
+            wire = int(f.read() or 0)
+    except (OSError, ValueError):
+        wire = 0
+    os.unlink(count_file)
+    gib = sent / float(1024 ** 3) or 1.0
+    return {
+        "bytes": sent,
+        "wall": wall,
+        "mib_s": sent / (1024 * 1024) / wall if wall > 0 else 0.0,
+        "cpu_self_per_gib": (self1 - self0) / gib,
+        "cpu_total_per_gib": ((self1 - self0) + (kids1 - kids0)) / gib,
+        "notifications": counter.count,
+        "notify_ms": counter.seconds * 1000.0,
+        "wire_ratio": wire / float(sent) if wire and sent else 0.0,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark replication transfer engines with synthetic send streams.")
+    ap.add_argument("--size", default="1G", help="bytes per run (k/M/G suffixes), default 1G")
+    ap.add_argument("--engines", default=",".join(ENGINES), help="comma list of: " + ", ".join(ENGINES))
+    ap.add_argument("--chunk-sizes", default="64k,256k,1M,4M", help="ZFS_REP_CHUNK_SIZE values for loop/stall")
+    ap.add_argument("--gen-block", default="128k", help="write size of the send stand-in (zfs send writes ~128k records)")
+    ap.add_argument("--burst", default="0", help="pause the generator after this many bytes (0 = steady)")
+    ap.add_argument("--pause-ms", type=float, default=0.0, help="generator pause per burst in milliseconds")
+    ap.add_argument("--transport", choices=("pipe", "tcp", "stripe"), default="pipe",
+                    help="pipe: mbuffer -> recv; tcp: mbuffer -> nc relay -> recv; stripe: mbuffer -> replication-stripe.py -> recv")
+    ap.add_argument("--streams", type=int, default=4, help="TCP connections for --transport stripe")
+    ap.add_argument("--mbuffer", default="256M", help="mbuffer -m size when mbuffer is installed (0 = use cat)")
+    ap.add_argument("--compress", default="", help="wire compression to compare, e.g. none,lz4,zstd:3 (implies --transport tcp)")
+    ap.add_argument("--compressible", type=int, default=0, help="percent of the synthetic stream that is repetitive text (0-100)")
+    ap.add_argument("--link-mbps", type=float, default=0.0, help="pace the TCP relay to this many megabit/s (0 = unlimited)")
+    ap.add_argument("--repeat", type=int, default=3, help="runs per combination; the median is reported")
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    ap.add_argument("--debug", action="store_true", help="keep replication debug logging on (costs I/O)")
+    args = ap.parse_args()
+
+    args.size = parse_size(args.size)
+    args.gen_block = parse_size(args.gen_block)
+    args.burst = parse_size(args.burst)
+
+    rep = load_replication(args.debug)
+
+    mbuffer_cmd = ["cat"]
+    if args.mbuffer != "0" and shutil.which("mbuffer"):
+        m = args.mbuffer.strip()
+        mbuffer_cmd = rep._build_mbuffer_cmd(m[:-1], m[-1].upper()) + ["-q"]
+
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    chunks = [parse_size(c) for c in args.chunk_sizes.split(",") if c.strip()]
+
+    codecs = [None]
+    if args.compress:
+        if args.transport == "pipe":
+            args.transport = "tcp"
+        codecs = []
+        for spec in (c.strip() for c in args.compress.split(",") if c.strip()):
+            name, _, level = spec.partition(":")
+            if name == "none":
+                codecs.append(None)
+            elif name not in rep._WIRE_CODECS:
+                print(f"unknown codec {name!r}", file=sys.stderr)
+            elif not shutil.which(name):
+                print(f"skipping {spec}: {name} is not installed", file=sys.stderr)
+            else:
+                codecs.append(rep.WireCodec(name, level))
+
+    results = []
+    for codec in codecs:
+        for engine in engines:
+            if engine not in ENGINES:
+                print(f"unknown engine {engine!r}", file=sys.stderr)
+                continue
+            if engine == "direct" and not shutil.which("pv"):
+                print("skipping direct: pv is not installed", file=sys.stderr)
+                continue
+            if engine == "splice" and not hasattr(os, "splice"):
+                print("skipping splice: os.splice is not available", file=sys.stderr)
+                continue
+            # splice and direct move data outside Python; chunk size does not apply.
+            for chunk in (chunks if engine in ("loop", "stall") else [0]):
+                runs = [run_once(rep, engine, chunk, args, mbuffer_cmd, codec) for _ in range(max(1, args.repeat))]
+                row = {"engine": engine, "chunk": chunk, "transport": args.transport, "compress": str(codec or "none")}
+                for key in ("mib_s", "wall", "cpu_self_per_gib", "cpu_total_per_gib", "notifications", "notify_ms", "wire_ratio"):
+                    row[key] = statistics.median(r[key] for r in runs)
+                results.append(row)
+                if not args.json:
+                    chunk_s = rep.format_bytes(chunk) if chunk else "-"
+                    wire_s = f"  compress={row['compress']}" if args.compress else ""
+                    if args.compress and row["wire_ratio"]:
+                        wire_s += f" wire={row['wire_ratio'] * 100:.0f}%"
+                    print(
+                        f"{engine:<7} chunk={chunk_s:<9} {row['mib_s']:9.1f} MiB/s  "
+                        f"cpu(py)={row['cpu_self_per_gib']:.2f}s/GiB  cpu(all)={row['cpu_total_per_gib']:.2f}s/GiB  "
+                        f"notify={int(row['notifications'])} ({row['notify_ms']:.2f} ms){wire_s}",
+                        flush=True,
+                    )
+
+    if args.json:
+        print(json.dumps({
+            "size": args.size,
+            "burst": args.burst,
+            "pause_ms": args.pause_ms,
+            "compressible": args.compressible,
+            "link_mbps": args.link_mbps,
+            "mbuffer": " ".join(mbuffer_cmd),
+            "host": socket.gethostname(),
+            "results": results,
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
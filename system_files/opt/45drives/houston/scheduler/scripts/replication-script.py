@@ -1,17 +1,30 @@
+import array
+import atexit
+import bisect
 import subprocess
 import sys
 import datetime
+import functools
 import os
 import time
 import json
 import shlex
 import re
+import select
 import socket
 import threading
 import traceback
+import zlib
 from collections import deque
 import getpass
+import hashlib
+import tempfile
 from notify import get_notifier
+from debuglog import get_debug_log
+import bandwidth
+from admission import admit
+from schedule_expr import match_current_tier
+from zfs_list import ZfsListStream
 
 
 class SafeStream:
@@ -56,17 +69,32 @@ notifier = get_notifier()
 TASK_PROP = "com.45drives_scheduler:task_name"
 TIER_PROP = "com.45drives_scheduler:scheduler_interval_tier"
 
+# Single-pass snapshot listing: identity, ordering and both ownership tags in
+# one `zfs list` instead of a list plus two recursive `zfs get` walks.
+SNAPSHOT_LIST_PROPS = f"name,guid,creation,createtxg,{TASK_PROP},{TIER_PROP}"
+
 
 class Snapshot:
-    def __init__(self, name, guid, creation, creation_epoch=0, order_key=0, task_tag=None, tier_tag=None):
+    """Compact snapshot record. Recursive listings can hold hundreds of
+    thousands of these, so there is no per-instance __dict__ and the creation
+    datetime is derived from the epoch on demand."""
+
+    __slots__ = ("name", "guid", "creation_epoch", "order_key", "task_tag", "tier_tag")
+
+    def __init__(self, name, guid, creation=None, creation_epoch=0, order_key=0, task_tag=None, tier_tag=None):
+        if not creation_epoch and creation is not None:
+            creation_epoch = int(creation.timestamp())
         self.name = name
         self.guid = guid
-        self.creation = creation
         self.creation_epoch = creation_epoch
         self.order_key = order_key
         self.task_tag = task_tag
         self.tier_tag = tier_tag  # value of scheduler_interval_tier property (tN format)
 
+    @property
+    def creation(self):
+        return datetime.datetime.fromtimestamp(self.creation_epoch)
+
 
 def split_zfs_list_line(line: str):
     line = (line or "").rstrip("\n")
@@ -90,7 +118,21 @@ def safe_print(msg: str):
             pass
 
 
+def _user_prop_value(raw):
+    """Normalize a `zfs list -H` user property column ("-" means unset).
+    Values are interned: every snapshot of a task carries the same tag."""
+    raw = (raw or "").strip()
+    if not raw or raw == "-":
+        return None
+    return sys.intern(raw)
+
+
 def parse_snapshot_line(line: str):
+    """Parse one `zfs list -H -p -o SNAPSHOT_LIST_PROPS` line.
+
+    Columns: name, guid, creation, createtxg and optionally the TASK_PROP and
+    TIER_PROP user properties, so tags are joined in the same pass.
+    """
     parts = split_zfs_list_line(line)
     if len(parts) < 3:
         return None
@@ -100,7 +142,6 @@ def parse_snapshot_line(line: str):
 
     try:
         creation_epoch = int(creation_raw)
-        created_dt = datetime.datetime.fromtimestamp(creation_epoch)
     except Exception:
         return None
 
@@ -108,7 +149,14 @@ def parse_snapshot_line(line: str):
     if txg_raw and str(txg_raw).isdigit():
         order_key = int(txg_raw)
 
-    return Snapshot(name, guid, created_dt, creation_epoch=creation_epoch, order_key=order_key)
+    task_tag = _user_prop_value(parts[4]) if len(parts) >= 5 else None
+    tier_tag = _user_prop_value(parts[5]) if len(parts) >= 6 else None
+
+    return Snapshot(
+        name, guid,
+        creation_epoch=creation_epoch, order_key=order_key,
+        task_tag=task_tag, tier_tag=tier_tag,
+    )
 
 
 def as_bool(v, default=False):
@@ -131,68 +179,240 @@ def send_houston_notification(payload):
         print(f"Failed to send D-Bus notification: {notify_error}")
 
 
-def ssh_base_args(user, host, port):
-    """Build a base SSH argv list (for Popen). Used by netcat listener setup."""
+def ssh_base_args(user, host, port, mux=True):
+    """Build a base SSH argv list (for Popen). Used by netcat listener setup.
+    mux=False opens a dedicated connection instead of the task's shared one."""
     args = ["ssh"] + SSH_BASE_OPTS
+    if mux:
+        args.extend(_ssh_mux.opts(user, host, port))
+    else:
+        args.extend(SSH_NO_MUX_OPTS)
     if str(port) != "22":
         args.extend(["-p", str(port)])
     args.append(f"{user}@{host}")
     return args
 
 
+# --- Host capability cache ----------------------------------------------------
+
+# One probe per host records what the transfer setup needs to know (netcat
+# flavour, pv/mbuffer/zstd/lz4 presence, zfs send flags, CPU count). Results are kept
+# in memory for the run and on disk for ZFS_REP_CAPS_TTL seconds; a changed
+# known_hosts entry (remote) or ZFS module version (local) forces a re-probe.
+HOST_CAPS_DIR = os.environ.get("ZFS_REP_CAPS_DIR", "/var/lib/houston/scheduler/host-caps")
+HOST_CAPS_TTL = int(os.environ.get("ZFS_REP_CAPS_TTL", "86400"))
+HOST_CAPS_VERSION = 3
+
+# Striped netcat helper; installed at the same path on every host.
+STRIPE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replication-stripe.py")
+
+# Single shell round trip; every line is key=value.
+_HOST_CAPS_PROBE = (
+    'echo "nc_path=$(readlink -f "$(command -v nc)" 2>/dev/null)"; '
+    'echo "nc_help=$(nc -h 2>&1 | head -n 5 | tr "\\n" " ")"; '
+    'command -v pv >/dev/null 2>&1 && echo pv=1 || echo pv=0; '
+    'command -v mbuffer >/dev/null 2>&1 && echo mbuffer=1 || echo mbuffer=0; '
+    'command -v zstd >/dev/null 2>&1 && echo zstd=1 || echo zstd=0; '
+    'command -v lz4 >/dev/null 2>&1 && echo lz4=1 || echo lz4=0; '
+    f'test -f {shlex.quote(STRIPE_SCRIPT)} && command -v python3 >/dev/null 2>&1 && echo stripe=1 || echo stripe=0; '
+    'echo "cpus=$(nproc 2>/dev/null || getconf _NPROCESSORS_ONLN 2>/dev/null)"; '
+    'echo "zfs_version=$(cat /sys/module/zfs/version 2>/dev/null)"; '
+    'echo "send_usage=$(zfs send 2>&1 | tr "\\n" " ")"'
+)
+
+_host_caps_memo = {}
+
+
+def _classify_nc(bin_path, help_text):
+    """ncat (nmap-ncat, RHEL/Rocky), openbsd (netcat-openbsd, Debian/Ubuntu) or unknown.
+    The resolved binary path is the most reliable indicator, `nc -h` the fallback."""
+    bin_path = (bin_path or "").lower()
+    if "ncat" in bin_path:
+        return "ncat"
+    if "openbsd" in bin_path:
+        return "openbsd"
+    out = (help_text or "").lower()
+    if "ncat" in out or "nmap" in out:
+        return "ncat"
+    if "openbsd" in out:
+        return "openbsd"
+    return "unknown"
+
+
+def _parse_host_caps(text):
+    kv = {}
+    for line in (text or "").splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            kv[key.strip()] = value.strip()
+    usage = kv.get("send_usage", "")
+    m = re.search(r"send \[-([A-Za-z]+)\]", usage)
+    flags = m.group(1) if m else ""
+    try:
+        cpus = int(kv.get("cpus") or 0)
+    except ValueError:
+        cpus = 0
+    return {
+        "nc": _classify_nc(kv.get("nc_path"), kv.get("nc_help")),
+        "pv": kv.get("pv") == "1",
+        "mbuffer": kv.get("mbuffer") == "1",
+        "zstd": kv.get("zstd") == "1",
+        "lz4": kv.get("lz4") == "1",
+        "stripe": kv.get("stripe") == "1",
+        "cpus": cpus,
+        "zfs_version": kv.get("zfs_version", ""),
+        "send_flags": flags,
+        "send_large_block": "L" in flags,
+        "send_raw": "w" in flags,
+        "send_saved": "--saved" in usage,
+    }
+
+
+def _host_caps_identity(remote):
+    """Cheap local fingerprint that changes when the target changes:
+    the known_hosts entry for a remote, the ZFS module version locally."""
+    if not remote:
+        try:
+            with open("/sys/module/zfs/version", "r") as f:
+                return "zfs:" + f.read().strip()
+        except Exception:
+            return "zfs:"
+    user, host, port = remote
+    lookup = host if str(port or "22") == "22" else f"[{host}]:{port}"
+    try:
+        p = subprocess.run(
+            ["ssh-keygen", "-F", lookup],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True, timeout=5,
+        )
+        keys = sorted(l.split(None, 1)[-1] for l in (p.stdout or "").splitlines() if l and not l.startswith("#"))
+        return "hostkey:" + hashlib.sha1("\n".join(keys).encode()).hexdigest()
+    except Exception:
+        return "hostkey:"
+
+
+def _host_caps_path(remote):
+    label = "local" if not remote else f"{remote[0]}@{remote[1]}:{remote[2] or '22'}"
+    digest = hashlib.sha1(label.encode()).hexdigest()[:16]
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", label)[:64]
+    return os.path.join(HOST_CAPS_DIR, f"{safe}-{digest}.json")
+
+
+def _probe_host_caps(remote):
+    start = time.time()
+    if remote:
+        user, host, port = remote
+        cmd = ssh_base_args(user, host, port)
+        cmd.append(_HOST_CAPS_PROBE)
+    else:
+        cmd = ["sh", "-c", _HOST_CAPS_PROBE]
+    try:
+        p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           universal_newlines=True, timeout=30)
+    except Exception as e:
+        dbg(f"host caps probe failed for {remote or 'local'}: {e}")
+        return None
+    if p.returncode != 0 and not p.stdout:
+        dbg(f"host caps probe failed for {remote or 'local'} rc={p.returncode}: {_truncate(p.stderr or '')}")
+        return None
+    caps = _parse_host_caps(p.stdout)
+    dbg(f"host caps probe {remote or 'local'} dur={time.time() - start:.2f}s: {caps}")
+    return caps
+
+
+def host_capabilities(remote=None, refresh=False):
+    """Capabilities of the local host or of *remote* (user, host, port).
+    Probed at most once per run; reuses the on-disk copy while it is younger
+    than the TTL and the identity still matches. Never raises."""
+    if remote and not remote[1]:
+        remote = None
+    if remote:
+        remote = (remote[0], remote[1], str(remote[2] or "22"))
+    key = remote or "local"
+    if not refresh and key in _host_caps_memo:
+        return _host_caps_memo[key]
+
+    path = _host_caps_path(remote)
+    ident = _host_caps_identity(remote)
+    if not refresh:
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            fresh = time.time() - float(data.get("ts", 0)) < HOST_CAPS_TTL
+            if data.get("version") == HOST_CAPS_VERSION and data.get("identity") == ident and fresh:
+                _host_caps_memo[key] = data["caps"]
+                return data["caps"]
+            dbg(f"host caps cache stale for {key}; re-probing")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            dbg(f"host caps cache unreadable ({path}): {e}")
+
+    caps = _probe_host_caps(remote)
+    if caps is None:
+        # Do not persist a failed probe; assume the conservative defaults.
+        caps = _parse_host_caps("")
+        _host_caps_memo[key] = caps
+        return caps
+    _host_caps_memo[key] = caps
+    try:
+        os.makedirs(HOST_CAPS_DIR, exist_ok=True)
+        tmp = f"{path}.tmp.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump({"version": HOST_CAPS_VERSION, "ts": int(time.time()), "identity": ident, "caps": caps}, f)
+        os.replace(tmp, path)
+    except Exception as e:
+        dbg(f"host caps cache write failed ({path}): {e}")
+    return caps
+
+
 def _detect_nc_flavour(remote_user=None, remote_host=None, remote_port="22"):
     """
     Detect which netcat variant is installed (locally or on a remote host).
     Returns "ncat" for nmap-ncat (Rocky/RHEL), "openbsd" for netcat-openbsd
-    (Ubuntu/Debian), or "unknown".
-
-    Detection strategy:
-      1. `readlink -f $(which nc)` — binary path is the most reliable indicator
-      2. `nc -h` output — look for self-identification strings
+    (Ubuntu/Debian), or "unknown". Answered from the host capability cache.
     """
-    try:
-        # Primary: resolve the actual binary path via readlink
-        readlink_cmd = "readlink -f $(which nc) 2>/dev/null || true"
-        if remote_user and remote_host:
-            ssh_cmd = ssh_base_args(remote_user, remote_host, remote_port)
-            ssh_cmd.append(readlink_cmd)
-            p = subprocess.run(
-                ssh_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                universal_newlines=True, timeout=10,
-            )
+    remote = (remote_user, remote_host, remote_port) if remote_user and remote_host else None
+    return host_capabilities(remote)["nc"]
+
+
+# ZFS_REP_NC_STREAMS=N (N > 1) swaps the single netcat connection for
+# replication-stripe.py: the stream is cut into sequence-numbered frames sent
+# over N TCP connections to the same data port and put back in order before
+# zfs recv, to fill high bandwidth-delay links one flow cannot. Used only
+# when both hosts have the helper; otherwise plain nc is used.
+NC_STREAMS = max(1, int(os.environ.get("ZFS_REP_NC_STREAMS", "1") or 1))
+
+_nc_streams_memo = {}
+
+
+def nc_streams(remote_user=None, remote_host=None, remote_port="22"):
+    """TCP connections for a netcat transfer with remote_host: NC_STREAMS if
+    both ends can run the stripe helper, else 1. Decided once per host so the
+    listener and the connecting side always agree."""
+    if NC_STREAMS <= 1 or not remote_host:
+        return 1
+    if remote_host not in _nc_streams_memo:
+        if remote_user is None:
+            # Connect side asked first; the listener decides.
+            return 1
+        streams = NC_STREAMS
+        missing = [label for label, r in (("local host", None), (remote_host, (remote_user, remote_host, remote_port)))
+                   if not host_capabilities(r).get("stripe")]
+        if missing:
+            safe_print(f"Note: striped netcat helper unavailable on {' and '.join(missing)}; using a single connection.")
+            streams = 1
         else:
-            p = subprocess.run(
-                ["sh", "-c", readlink_cmd], stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE, universal_newlines=True, timeout=10,
-            )
-        bin_path = (p.stdout or "").strip().lower()
-        if "ncat" in bin_path:
-            return "ncat"
-        if "openbsd" in bin_path:
-            return "openbsd"
-
-        # Fallback: parse nc -h output for self-identification
-        if remote_user and remote_host:
-            ssh_cmd = ssh_base_args(remote_user, remote_host, remote_port)
-            ssh_cmd.append("nc -h")
-            p = subprocess.run(
-                ssh_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                universal_newlines=True, timeout=10,
-            )
-        else:
-            p = subprocess.run(
-                ["nc", "-h"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                universal_newlines=True, timeout=10,
-            )
-        out = ((p.stdout or "") + " " + (p.stderr or "")).lower()
-        if "ncat" in out or "nmap" in out:
-            return "ncat"
-        if "openbsd" in out:
-            return "openbsd"
-    except Exception:
-        pass
+            dbg(f"netcat: striping over {streams} connections to {remote_host}")
+        _nc_streams_memo[remote_host] = streams
+    return _nc_streams_memo[remote_host]
 
-    return "unknown"
+
+def _stripe_args(mode, port, streams):
+    return [
+        mode, "--port", str(port), "--streams", str(streams),
+        "--stall-timeout", str(TRANSFER_STALL_TIMEOUT),
+    ]
 
 
 def build_nc_listen_cmd(port: str, remote_user=None, remote_host=None, remote_port="22", bind_address=None, send_only=False):
@@ -202,10 +422,18 @@ def build_nc_listen_cmd(port: str, remote_user=None, remote_host=None, remote_po
     If bind_address is provided, binds the listener to that IP only.
     If send_only is True, ncat uses --send-only (for pull: zfs send | nc -l).
     If send_only is False, ncat uses --recv-only (for push: nc -l | zfs recv).
+    With ZFS_REP_NC_STREAMS > 1 the striped helper listens instead.
 
     IMPORTANT: Never combine -p with -l. Port is always passed as a positional
     argument, which works on all netcat variants.
     """
+    streams = nc_streams(remote_user, remote_host, remote_port)
+    if streams > 1:
+        args = ["python3", STRIPE_SCRIPT] + _stripe_args("send" if send_only else "recv", port, streams) + ["--listen"]
+        if bind_address:
+            args += ["--bind", bind_address]
+        return " ".join(shlex.quote(a) for a in args)
+
     flavour = _detect_nc_flavour(remote_user, remote_host, remote_port)
     dbg(f"nc flavour on {'remote' if remote_host else 'local'}: {flavour}")
     port_q = shlex.quote(port)
@@ -224,7 +452,12 @@ def build_nc_listen_cmd(port: str, remote_user=None, remote_host=None, remote_po
 
 def _build_nc_connect_cmd(host: str, port: str, recv_only=True):
     """Build a local nc connect command with --recv-only or --send-only for ncat.
-    recv_only=True for pull (client receives), False for push (client sends)."""
+    recv_only=True for pull (client receives), False for push (client sends).
+    Matches the striped listener when build_nc_listen_cmd chose one for host."""
+    streams = nc_streams(None, host)
+    if streams > 1:
+        return [sys.executable, STRIPE_SCRIPT] + _stripe_args("recv" if recv_only else "send", port, streams) + ["--host", host]
+
     flavour = _detect_nc_flavour()
     if flavour == "ncat":
         flag = "--recv-only" if recv_only else "--send-only"
@@ -233,6 +466,86 @@ def _build_nc_connect_cmd(host: str, port: str, recv_only=True):
     return ["nc", host, port]
 
 
+# --- Wire compression ---------------------------------------------------------
+
+# ZFS_REP_WIRE_COMPRESS=zstd|lz4 compresses the stream on the sending host and
+# decompresses it right before `zfs recv`; ZFS_REP_WIRE_LEVEL sets the level
+# (zstd 1-19, default 3; lz4 1-12, default 1). Worth it on slow links only:
+# on a fast LAN the compressor becomes the bottleneck. Streams sent with -c
+# or -w are already compressed/encrypted and never get the stage, nor does a
+# pair of hosts where either side lacks the tool.
+WIRE_COMPRESS = os.environ.get("ZFS_REP_WIRE_COMPRESS", "").strip().lower()
+WIRE_LEVEL = os.environ.get("ZFS_REP_WIRE_LEVEL", "").strip()
+
+# name: (default level, max level, compress argv, decompress argv)
+_WIRE_CODECS = {
+    "zstd": ("3", 19, ["zstd", "-q", "-c", "-T0"], ["zstd", "-q", "-d", "-c"]),
+    "lz4": ("1", 12, ["lz4", "-q", "-c"], ["lz4", "-q", "-d", "-c"]),
+}
+
+
+class WireCodec:
+    """Compressor/decompressor pair placed around the network hop."""
+
+    def __init__(self, name, level=""):
+        default, top, comp, decomp = _WIRE_CODECS[name]
+        try:
+            lvl = min(max(int(level or default), 1), top)
+        except ValueError:
+            lvl = int(default)
+        self.name = name
+        self.level = lvl
+        self.compress_args = comp + [f"-{lvl}"]
+        self.decompress_args = list(decomp)
+
+    def __str__(self):
+        return f"{self.name} -{self.level}"
+
+    def shell(self, decompress=False):
+        """The stage as a shell pipeline element (for remote command strings)."""
+        args = self.decompress_args if decompress else self.compress_args
+        return " ".join(shlex.quote(a) for a in args)
+
+    def feeding(self, args, decompress=False):
+        """argv running the stage with its output piped into *args*. The exit
+        status is that of *args*; a failed stage shows up there as a
+        truncated stream."""
+        return ["sh", "-c", f'{self.shell(decompress)} | exec "$@"', "sh"] + [str(a) for a in args]
+
+    def fed_by(self, args):
+        """argv running *args* with its output compressed. The exit status is
+        that of *args* (or of the compressor if it fails), so a failing
+        `zfs send` is not mistaken for a short, clean stream. POSIX sh has no
+        pipefail; the status of *args* comes back through fd 3."""
+        script = (
+            'exec 4>&1; '
+            f'st=$( {{ {{ "$@" 3>&- 4>&-; echo $? >&3; }} | {self.shell()} >&4 3>&-; }} 3>&1 ) || exit $?; '
+            'exit "$st"'
+        )
+        return ["sh", "-c", script, "sh"] + [str(a) for a in args]
+
+
+def wire_codec(compressed, raw, remote, name=None, level=None):
+    """WireCodec for a stream between this host and *remote* (user, host, port),
+    or None when compression is off, the stream is -c/-w, or a side lacks the tool."""
+    name = WIRE_COMPRESS if name is None else name
+    if not name or name in ("0", "no", "off", "none") or not remote or not remote[1]:
+        return None
+    if name not in _WIRE_CODECS:
+        safe_print(f"WARNING: unknown wire compression {name!r}; sending uncompressed.")
+        return None
+    if compressed or raw:
+        dbg(f"wire compression ({name}) skipped: stream is already {'raw' if raw else 'compressed'}")
+        return None
+    missing = [label for label, r in (("local host", None), (remote[1], remote)) if not host_capabilities(r).get(name)]
+    if missing:
+        safe_print(f"Note: {name} is not installed on {' and '.join(missing)}; sending uncompressed.")
+        return None
+    codec = WireCodec(name, WIRE_LEVEL if level is None else level)
+    safe_print(f"Wire compression: {codec}")
+    return codec
+
+
 def join_zfs_path(pool: str, dataset: str) -> str:
     pool = (pool or "").strip()
     ds = (dataset or "").strip()
@@ -293,117 +606,6 @@ def is_task_snapshot(full_snap_name: str, task_name: str, custom_name: str = "")
     return False
 
 
-# ---------------------------------------------------------------------------
-# Multi-interval tier matching
-# ---------------------------------------------------------------------------
-
-def _field_matches_value(pattern: str, current: int) -> bool:
-    """Check if a systemd calendar field pattern matches a value."""
-    pattern = str(pattern).strip()
-    if pattern == "*":
-        return True
-
-    # Range: A..B
-    if ".." in pattern:
-        parts = pattern.split("..")
-        try:
-            a, b = int(parts[0]), int(parts[1])
-            return a <= current <= b
-        except (ValueError, IndexError):
-            return False
-
-    # Step: A/N
-    if "/" in pattern:
-        parts = pattern.split("/")
-        try:
-            start, step = int(parts[0]), int(parts[1])
-            if step <= 0:
-                return False
-            return current >= start and (current - start) % step == 0
-        except (ValueError, IndexError):
-            return False
-
-    # Comma list: A,B,C
-    if "," in pattern:
-        try:
-            values = [int(v.strip()) for v in pattern.split(",")]
-            return current in values
-        except ValueError:
-            return False
-
-    # Single value — exact match
-    try:
-        return current == int(pattern)
-    except ValueError:
-        return False
-
-
-def _interval_matches_time(interval: dict, now: datetime.datetime) -> bool:
-    """Check if a schedule interval matches the current time."""
-    minute_val = interval.get("minute", {}).get("value", "*")
-    if not _field_matches_value(minute_val, now.minute):
-        return False
-
-    hour_val = interval.get("hour", {}).get("value", "*")
-    if not _field_matches_value(hour_val, now.hour):
-        return False
-
-    day_val = interval.get("day", {}).get("value", "*")
-    if not _field_matches_value(day_val, now.day):
-        return False
-
-    month_val = interval.get("month", {}).get("value", "*")
-    if not _field_matches_value(month_val, now.month):
-        return False
-
-    year_val = interval.get("year", {}).get("value", "*")
-    if not _field_matches_value(year_val, now.year):
-        return False
-
-    dow = interval.get("dayOfWeek", [])
-    if dow:
-        # Python weekday(): Mon=0 .. Sun=6
-        dow_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-        current_dow = dow_names[now.weekday()]
-        # Normalize incoming DOW entries to 3-char Title case
-        normalized_dow = [str(d).strip()[:3].title() for d in dow]
-        if current_dow not in normalized_dow:
-            return False
-
-    return True
-
-
-def _count_specificity(interval: dict) -> int:
-    """Count non-wildcard fields. Higher = more specific."""
-    count = 0
-    for field in ("minute", "hour", "day", "month", "year"):
-        val = str(interval.get(field, {}).get("value", "*")).strip()
-        if val != "*":
-            count += 1
-    if interval.get("dayOfWeek", []):
-        count += 1
-    return count
-
-
-def match_current_tier(intervals: list, now: datetime.datetime) -> int:
-    """
-    Given schedule intervals and current time, return the index of the most
-    specific matching interval.  Falls back to 0 if nothing matches.
-    """
-    matched = []
-    for idx, interval in enumerate(intervals):
-        if _interval_matches_time(interval, now):
-            specificity = _count_specificity(interval)
-            matched.append((idx, specificity))
-
-    if not matched:
-        return 0  # fallback to first interval
-
-    # Most specific wins; on tie, prefer the lower index (more general / higher-priority)
-    matched.sort(key=lambda x: (x[1], -x[0]), reverse=True)
-    return matched[0][0]
-
-
 def load_schedule_json(path: str):
     """Load the schedule JSON file. Returns the parsed dict or None."""
     if not path:
@@ -449,165 +651,350 @@ PIPELINE_FINALIZE_TIMEOUT = int(os.environ.get("ZFS_REP_FINALIZE_TIMEOUT", "1800
 # If no data flows for this long, the pipeline is killed. 0 disables.
 TRANSFER_STALL_TIMEOUT = int(os.environ.get("ZFS_REP_STALL_TIMEOUT", "3600"))
 
-def get_local_snapshots(filesystem):
-    cmd = [
+def _zfs_list_snapshots_args(filesystem, props=SNAPSHOT_LIST_PROPS):
+    return [
         "zfs",
         "list",
         "-H",
         "-p",
         "-o",
-        "name,guid,creation,createtxg",
+        props,
         "-t",
         "snapshot",
         "-r",
         filesystem,
     ]
-    try:
-        p = run_logged(cmd, text=True, timeout=ZFS_LIST_TIMEOUT)
-    except subprocess.TimeoutExpired:
-        msg = f"Timed out after {ZFS_LIST_TIMEOUT}s listing snapshots on {filesystem}. The pool may be degraded or unresponsive."
-        print(msg, file=sys.stderr)
-        notifier.notify(f"STATUS={msg}")
-        sys.exit(1)
-    
-    if p.returncode == 0:
-        snaps = []
-        for line in (p.stdout or "").splitlines():
-            snap = parse_snapshot_line(line)
-            if snap:
-                snaps.append(snap)
 
-        # Fetch task tags for ownership tracking
-        tag_map = {}
-        tier_map = {}
-        try:
-            tag_cmd = ["zfs", "get", "-H", "-r", "-o", "name,property,value", TASK_PROP, filesystem]
-            tag_p = run_logged(tag_cmd, text=True)
-            if tag_p.returncode == 0:
-                for line in (tag_p.stdout or "").splitlines():
-                    try:
-                        name, prop, value = line.split("\t")
-                        if prop == TASK_PROP and value != "-":
-                            tag_map[name] = value
-                    except ValueError:
-                        continue
-        except Exception:
-            pass
-        try:
-            tier_cmd = ["zfs", "get", "-H", "-r", "-o", "name,property,value", TIER_PROP, filesystem]
-            tier_p = run_logged(tier_cmd, text=True)
-            if tier_p.returncode == 0:
-                for line in (tier_p.stdout or "").splitlines():
-                    try:
-                        name, prop, value = line.split("\t")
-                        if prop == TIER_PROP and value != "-":
-                            tier_map[name] = value
-                    except ValueError:
-                        continue
-        except Exception:
-            pass
-        for s in snaps:
-            s.task_tag = tag_map.get(s.name)
-            s.tier_tag = tier_map.get(s.name)
 
-        return snaps
+def iter_local_snapshots(filesystem, props=SNAPSHOT_LIST_PROPS, timeout=ZFS_LIST_TIMEOUT):
+    cmd = _zfs_list_snapshots_args(filesystem, props)
+    dbg(f"POPEN local: {_fmt_cmd(cmd)}")
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return ZfsListStream(proc, parse_snapshot_line, timeout=timeout)
 
-    err = (p.stderr or p.stdout or "").lower()
-    if "dataset does not exist" in err or "cannot open" in err:
-        return None
-    raise subprocess.CalledProcessError(p.returncode, cmd, output=p.stdout, stderr=p.stderr)
 
+def iter_remote_snapshots(user, host, ssh_port, filesystem, props=SNAPSHOT_LIST_PROPS, timeout=ZFS_LIST_TIMEOUT):
+    args = _zfs_list_snapshots_args(filesystem, props)
+    proc = ssh_popen_args(user, host, ssh_port, args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return ZfsListStream(proc, parse_snapshot_line, timeout=timeout)
 
-def get_remote_snapshots(user, host, ssh_port, filesystem):
-    args = [
-        "zfs",
-        "list",
-        "-H",
-        "-p",
-        "-o",
-        "name,guid,creation,createtxg",
-        "-t",
-        "snapshot",
-        "-r",
-        filesystem,
-    ]
 
-    try:
-        p = ssh_run_args(user, host, ssh_port, args, capture_output=True, check=False, text=False, timeout=ZFS_LIST_TIMEOUT)
-    except subprocess.TimeoutExpired:
+def _finish_local_listing(stream, filesystem, props=SNAPSHOT_LIST_PROPS):
+    """Check how an exhausted local listing ended: True if it succeeded,
+    False if the dataset does not exist. Exits on timeout, raises otherwise."""
+    if stream.timed_out:
+        msg = f"Timed out after {ZFS_LIST_TIMEOUT}s listing snapshots on {filesystem}. The pool may be degraded or unresponsive."
+        print(msg, file=sys.stderr)
+        notifier.notify(f"STATUS={msg}")
+        sys.exit(1)
+    if stream.returncode == 0:
+        return True
+    if stream.missing:
+        return False
+    raise subprocess.CalledProcessError(stream.returncode, _zfs_list_snapshots_args(filesystem, props), stderr=stream.stderr_text())
+
+
+def _finish_remote_listing(stream, user, host, filesystem):
+    """Remote counterpart of _finish_local_listing; exits on any failure
+    other than a missing dataset."""
+    if stream.timed_out:
         msg = f"Timed out after {ZFS_LIST_TIMEOUT}s listing remote snapshots on {user}@{host}:{filesystem}. The remote pool may be degraded or unresponsive."
         print(msg, file=sys.stderr)
         notifier.notify(f"STATUS={msg}")
         sys.exit(1)
+    if stream.returncode == 0:
+        return True
+    if stream.missing:
+        return False
+    print(f"ERROR: Failed to fetch remote snapshots for {filesystem}:\n{stream.stderr_text().lower()}")
+    sys.exit(1)
+
+
+def _list_local_snapshots(filesystem, props=SNAPSHOT_LIST_PROPS):
+    start = time.time()
+    stream = iter_local_snapshots(filesystem, props)
+    snaps = list(stream)
+    dbg(f"RC local={stream.returncode} dur={time.time() - start:.2f}s snapshots={len(snaps)}")
+    return snaps if _finish_local_listing(stream, filesystem, props) else None
+
+
+def _list_remote_snapshots(user, host, ssh_port, filesystem, props=SNAPSHOT_LIST_PROPS):
+    start = time.time()
+    stream = iter_remote_snapshots(user, host, ssh_port, filesystem, props)
+    snaps = list(stream)
+    dbg(f"RC ssh={stream.returncode} dur={time.time() - start:.2f}s snapshots={len(snaps)}")
+    return snaps if _finish_remote_listing(stream, user, host, filesystem) else None
+
+
+# --- Persistent snapshot inventory cache -------------------------------------
+
+# Set ZFS_REP_SNAPSHOT_CACHE=1 to keep a per-(host, dataset) snapshot inventory
+# on disk. Snapshots are only ever added (higher createtxg) or destroyed, so a
+# refresh lists the cheap native columns, diffs them by guid against the cache
+# and reads the user-property tags only for snapshots the cache has not seen.
+SNAPSHOT_CACHE_ENABLED = as_bool(os.environ.get("ZFS_REP_SNAPSHOT_CACHE"))
+SNAPSHOT_CACHE_DIR = os.environ.get(
+    "ZFS_REP_SNAPSHOT_CACHE_DIR", "/var/lib/houston/scheduler/snapshot-cache"
+)
+# Force a full (tag-reading) relist after this many seconds, so tags set
+# outside this script are eventually picked up.
+SNAPSHOT_CACHE_MAX_AGE = int(os.environ.get("ZFS_REP_SNAPSHOT_CACHE_MAX_AGE", "86400"))
+# Above this many unseen snapshots a single-pass full listing is cheaper than
+# batched tag lookups.
+SNAPSHOT_CACHE_MAX_NEW = int(os.environ.get("ZFS_REP_SNAPSHOT_CACHE_MAX_NEW", "2000"))
+SNAPSHOT_CACHE_VERSION = 1
+
+# Columns that come straight from the dataset header (no user-property reads).
+SNAPSHOT_NATIVE_PROPS = "name,guid,creation,createtxg"
+
+# Upper bound (bytes) for snapshot names packed into one zfs argv. Remote
+# commands travel as a single `sh -c` string, capped at 128 KiB by the kernel.
+ZFS_ARGV_BUDGET = int(os.environ.get("ZFS_REP_ARGV_BUDGET", "65536"))
+
+
+def _chunk_by_argv_budget(items, budget=None, sep_len=1):
+    """Yield lists of strings whose joined length stays within *budget* bytes."""
+    budget = budget or ZFS_ARGV_BUDGET
+    chunk = []
+    size = 0
+    for item in items:
+        item_len = len(item) + sep_len
+        if chunk and size + item_len > budget:
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(item)
+        size += item_len
+    if chunk:
+        yield chunk
+
+
+def _zfs_run(cmd, remote=None, timeout=None):
+    """Run a zfs command locally or, when *remote* is a (user, host, port)
+    tuple, over ssh. Returns the text-mode CompletedProcess (never raises on rc)."""
+    if remote:
+        user, host, port = remote
+        return ssh_run_args(user, host, port, cmd, capture_output=True, check=False, text=True, timeout=timeout)
+    return run_logged(cmd, text=True, timeout=timeout)
+
+
+def _snapshot_cache_path(filesystem, remote=None):
+    if remote:
+        user, host, port = remote
+        key = f"{user}@{host}:{port}|{filesystem}"
+    else:
+        key = f"local|{filesystem}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:20]
+    return os.path.join(SNAPSHOT_CACHE_DIR, f"{digest}.json")
+
+
+def _guid_checksum(guids):
+    h = hashlib.sha1()
+    for guid in sorted(guids):
+        h.update(str(guid).encode())
+        h.update(b"\n")
+    return h.hexdigest()
+
 
-    if p.returncode == 0:
-        snapshots = []
-        out = (p.stdout or b"")
-        if isinstance(out, str):
-            out = out.encode()
-        for raw_line in out.split(b"\n"):
-            line = raw_line.decode(errors="replace")
-            snap = parse_snapshot_line(line)
-            if snap:
-                snapshots.append(snap)
-        del out  # free raw bytes early
-
-        # Fetch task tags from remote for ownership tracking
-        tag_map = {}
-        tier_map = {}
+def _snapshot_to_record(s):
+    return [s.name, s.guid, s.creation_epoch, s.order_key, s.task_tag, s.tier_tag]
+
+
+def _load_snapshot_cache(path):
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        dbg(f"snapshot cache: unreadable {path}: {e}")
+        return None
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_CACHE_VERSION:
+        return None
+    return data
+
+
+def _save_snapshot_cache(path, key, snaps):
+    guids = [s.guid for s in snaps]
+    data = {
+        "version": SNAPSHOT_CACHE_VERSION,
+        "key": key,
+        "updated": int(time.time()),
+        "max_txg": max((s.order_key for s in snaps), default=0),
+        "count": len(guids),
+        "checksum": _guid_checksum(guids),
+        "snapshots": [_snapshot_to_record(s) for s in snaps],
+    }
+    tmp = f"{path}.tmp.{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+    except Exception as e:
+        dbg(f"snapshot cache: failed to write {path}: {e}")
         try:
-            tag_args = ["zfs", "get", "-H", "-r", "-o", "name,property,value", TASK_PROP, filesystem]
-            tag_p = ssh_run_args(user, host, ssh_port, tag_args, capture_output=True, check=False, text=False)
-            if tag_p.returncode == 0:
-                tag_out = (tag_p.stdout or b"")
-                if isinstance(tag_out, str):
-                    tag_out = tag_out.encode()
-                for raw_line in tag_out.split(b"\n"):
-                    try:
-                        parts = raw_line.decode(errors="replace").split("\t")
-                        if len(parts) >= 3 and parts[1] == TASK_PROP and parts[2] != "-":
-                            tag_map[parts[0]] = parts[2]
-                    except (ValueError, IndexError):
-                        continue
-                del tag_out
-        except Exception:
+            os.remove(tmp)
+        except OSError:
             pass
+
+
+def _drop_snapshot_cache(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        dbg(f"snapshot cache: failed to remove {path}: {e}")
+
+
+def _fetch_snapshot_tags(names, remote=None):
+    """Read TASK_PROP/TIER_PROP for the given snapshots with batched `zfs get`.
+    Returns (tag_map, tier_map); lookups that fail are simply left out."""
+    tag_map = {}
+    tier_map = {}
+    for chunk in _chunk_by_argv_budget(names):
+        cmd = ["zfs", "get", "-H", "-o", "name,property,value", f"{TASK_PROP},{TIER_PROP}"] + chunk
         try:
-            tier_args = ["zfs", "get", "-H", "-r", "-o", "name,property,value", TIER_PROP, filesystem]
-            tier_p = ssh_run_args(user, host, ssh_port, tier_args, capture_output=True, check=False, text=False)
-            if tier_p.returncode == 0:
-                tier_out = (tier_p.stdout or b"")
-                if isinstance(tier_out, str):
-                    tier_out = tier_out.encode()
-                for raw_line in tier_out.split(b"\n"):
-                    try:
-                        parts = raw_line.decode(errors="replace").split("\t")
-                        if len(parts) >= 3 and parts[1] == TIER_PROP and parts[2] != "-":
-                            tier_map[parts[0]] = parts[2]
-                    except (ValueError, IndexError):
-                        continue
-                del tier_out
-        except Exception:
-            pass
-        for s in snapshots:
+            p = _zfs_run(cmd, remote, timeout=ZFS_LIST_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            dbg(f"snapshot cache: tag lookup timed out for {len(chunk)} snapshot(s)")
+            continue
+        for line in (p.stdout or "").splitlines():
+            parts = line.split("\t")
+            if len(parts) < 3:
+                continue
+            value = _user_prop_value(parts[2])
+            if value is None:
+                continue
+            if parts[1] == TASK_PROP:
+                tag_map[parts[0]] = value
+            elif parts[1] == TIER_PROP:
+                tier_map[parts[0]] = value
+    return tag_map, tier_map
+
+
+def _cached_snapshot_inventory(filesystem, remote=None):
+    """Return the snapshot list for *filesystem*, refreshing the on-disk
+    inventory incrementally. Same semantics as the uncached listing
+    (None when the dataset does not exist)."""
+    path = _snapshot_cache_path(filesystem, remote)
+    key = f"{remote[0]}@{remote[1]}:{remote[2]}|{filesystem}" if remote else f"local|{filesystem}"
+
+    def _full_listing():
+        if remote:
+            snaps = _list_remote_snapshots(*remote, filesystem)
+        else:
+            snaps = _list_local_snapshots(filesystem)
+        if snaps is None:
+            _drop_snapshot_cache(path)
+        else:
+            _save_snapshot_cache(path, key, snaps)
+        return snaps
+
+    cache = _load_snapshot_cache(path)
+    if cache is None or (time.time() - cache.get("updated", 0)) > SNAPSHOT_CACHE_MAX_AGE:
+        dbg(f"snapshot cache: full listing for {key}")
+        return _full_listing()
+
+    if remote:
+        current = _list_remote_snapshots(*remote, filesystem, props=SNAPSHOT_NATIVE_PROPS)
+    else:
+        current = _list_local_snapshots(filesystem, props=SNAPSHOT_NATIVE_PROPS)
+    if current is None:
+        _drop_snapshot_cache(path)
+        return None
+
+    cached_by_guid = {}
+    for rec in cache.get("snapshots", []):
+        cached_by_guid[rec[1]] = rec
+
+    # Fast path: nothing added or destroyed since the last refresh. The
+    # listing still supplies the names (renames keep the guid); only the
+    # tags come from the cache.
+    if len(current) == cache.get("count") and _guid_checksum(s.guid for s in current) == cache.get("checksum"):
+        renamed = False
+        for s in current:
+            rec = cached_by_guid[s.guid]
+            s.task_tag = rec[4]
+            s.tier_tag = rec[5]
+            renamed = renamed or rec[0] != s.name
+        dbg(f"snapshot cache: hit for {key} ({len(current)} snapshots{', renamed' if renamed else ''})")
+        if renamed:
+            _save_snapshot_cache(path, key, current)
+        return current
+    max_txg = cache.get("max_txg", 0)
+
+    unseen = [s for s in current if s.guid not in cached_by_guid]
+    if len(unseen) > SNAPSHOT_CACHE_MAX_NEW:
+        dbg(f"snapshot cache: {len(unseen)} unseen snapshots for {key}; full listing")
+        return _full_listing()
+
+    tag_map, tier_map = _fetch_snapshot_tags([s.name for s in unseen], remote) if unseen else ({}, {})
+    for s in current:
+        rec = cached_by_guid.get(s.guid)
+        if rec is not None:
+            # Renames keep the guid; the listing supplies the current name.
+            s.task_tag = rec[4]
+            s.tier_tag = rec[5]
+        else:
             s.task_tag = tag_map.get(s.name)
             s.tier_tag = tier_map.get(s.name)
 
-        return snapshots
+    dbg(
+        f"snapshot cache: refreshed {key} new={len(unseen)} "
+        f"(newer than txg {max_txg}: {sum(1 for s in unseen if s.order_key > max_txg)}) "
+        f"destroyed={len(cached_by_guid) - (len(current) - len(unseen))}"
+    )
+    _save_snapshot_cache(path, key, current)
+    return current
 
-    errb = (p.stderr or b"")
-    outb = (p.stdout or b"")
-    if isinstance(errb, str):
-        errb = errb.encode()
-    if isinstance(outb, str):
-        outb = outb.encode()
-    err_output = errb.decode(errors="replace").lower() + outb.decode(errors="replace").lower()
 
-    if "dataset does not exist" in err_output or "cannot open" in err_output:
-        return None
+def get_local_snapshots(filesystem):
+    if SNAPSHOT_CACHE_ENABLED:
+        return _cached_snapshot_inventory(filesystem)
+    return _list_local_snapshots(filesystem)
 
-    print(f"ERROR: Failed to fetch remote snapshots for {filesystem}:\n{err_output}")
-    sys.exit(1)
+
+def get_remote_snapshots(user, host, ssh_port, filesystem):
+    if SNAPSHOT_CACHE_ENABLED:
+        return _cached_snapshot_inventory(filesystem, remote=(user, host, str(ssh_port)))
+    return _list_remote_snapshots(user, host, ssh_port, filesystem)
+
+
+class SnapshotScan:
+    """One pass over a dataset's snapshots, for callers that look at each
+    snapshot once (pruning, existence checks) and so never need the whole
+    list. Iterate it, then read `exists` (False when the dataset is missing;
+    None if the caller stopped early). With the inventory cache enabled the
+    cached list is iterated instead."""
+
+    def __init__(self, filesystem, remote_user=None, remote_host=None, remote_port="22"):
+        self.filesystem = filesystem
+        self.remote = (remote_user, remote_host, str(remote_port)) if remote_host else None
+        self.exists = None
+
+    def __iter__(self):
+        if SNAPSHOT_CACHE_ENABLED:
+            snaps = _cached_snapshot_inventory(self.filesystem, remote=self.remote)
+            self.exists = snaps is not None
+            yield from snaps or ()
+            return
+
+        start = time.time()
+        if self.remote:
+            stream = iter_remote_snapshots(*self.remote, self.filesystem)
+        else:
+            stream = iter_local_snapshots(self.filesystem)
+        count = 0
+        for snap in stream:
+            count += 1
+            yield snap
+        dbg(f"RC {'ssh' if self.remote else 'local'}={stream.returncode} dur={time.time() - start:.2f}s snapshots={count}")
+        if self.remote:
+            self.exists = _finish_remote_listing(stream, self.remote[0], self.remote[1], self.filesystem)
+        else:
+            self.exists = _finish_local_listing(stream, self.filesystem)
 
 
 # Configurable mBuffer block size (default 256k; set ZFS_REP_MBUFFER_BLOCK for benchmarking)
@@ -619,6 +1006,194 @@ def _build_mbuffer_cmd(buf_size, buf_unit):
     return ["mbuffer", "-s", MBUFFER_BLOCK_SIZE, "-m", f"{buf_size}{buf_unit}"]
 
 
+# --- bandwidth schedule -------------------------------------------------------
+
+# Time-of-day limits from the [bandwidth] sections of scheduler.conf (see
+# bandwidth.py). Set in main() for transfers that leave the host; the copy
+# loop re-reads the rate as windows change. The limit is per destination, so
+# all streams of a run share it: the copy loops draw from one Throttle, and
+# the fixed pv/mbuffer flags get an equal share per parallel stream.
+_bw_policy = bandwidth.BandwidthPolicy()
+_bw_throttle = None
+_bw_throttle_lock = threading.Lock()
+_bw_streams = 1
+
+
+def _shared_throttle():
+    """The process-wide Throttle for _bw_policy (None when unlimited)."""
+    global _bw_throttle
+    if not _bw_policy:
+        return None
+    with _bw_throttle_lock:
+        if _bw_throttle is None:
+            _bw_throttle = bandwidth.Throttle(
+                _bw_policy,
+                on_change=lambda rate: safe_print(f"Bandwidth limit now {bandwidth.format_rate(rate)}"),
+            )
+        return _bw_throttle
+
+
+def _rate_limit_args(tool):
+    """Rate flag for the pipelines that bypass the copy loop (pv, mbuffer).
+    These are fixed at the rate in effect when the transfer starts, split
+    evenly across the streams running in parallel."""
+    rate = _bw_policy.rate_at() if _bw_policy else 0
+    if rate:
+        rate = max(1, rate // max(1, _bw_streams))
+    if not rate:
+        return []
+    if tool == "pv":
+        return ["-L", str(rate)]
+    if tool == "mbuffer":
+        return ["-R", f"{max(1, rate // 1024)}k"]
+    return []
+
+
+# --- mbuffer autotune ---------------------------------------------------------
+
+# Set ZFS_REP_MBUFFER_AUTOTUNE=1 to size mbuffer (-m) and its block size (-s)
+# from the throughput and stalls of previous runs to the same destination
+# instead of the task's fixed mbufferSize/mbufferUnit and ZFS_REP_MBUFFER_BLOCK.
+# History is keyed on transfer method + host and kept next to the snapshot cache.
+MBUFFER_AUTOTUNE_ENABLED = as_bool(os.environ.get("ZFS_REP_MBUFFER_AUTOTUNE"))
+MBUFFER_TUNE_DIR = os.environ.get(
+    "ZFS_REP_MBUFFER_TUNE_DIR", "/var/lib/houston/scheduler/mbuffer-tune"
+)
+# Seconds of stream the buffer should absorb (zfs send is bursty on metadata-heavy datasets).
+MBUFFER_TUNE_SECONDS = float(os.environ.get("ZFS_REP_MBUFFER_TUNE_SECONDS", "2"))
+MBUFFER_TUNE_MIN = 64 * 1024 * 1024
+MBUFFER_TUNE_MAX = int(os.environ.get("ZFS_REP_MBUFFER_TUNE_MAX", str(4 * 1024 ** 3)))
+MBUFFER_TUNE_HISTORY = 10
+# Runs smaller than this say more about setup latency than about the link.
+MBUFFER_TUNE_MIN_SAMPLE = 64 * 1024 * 1024
+
+# Filled by transfer_stream(); written to the history file at task end.
+_transfer_samples = []
+
+
+def _record_transfer(bytes_sent, elapsed, stalled=False):
+    _transfer_samples.append({"bytes": int(bytes_sent), "secs": round(float(elapsed), 3), "stalled": bool(stalled)})
+
+
+def _mbuffer_tune_path(transfer_method, host):
+    key = f"{transfer_method or 'local'}|{host or 'localhost'}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{transfer_method or 'local'}-{host or 'localhost'}")[:64]
+    return os.path.join(MBUFFER_TUNE_DIR, f"{safe}-{digest}.json")
+
+
+def _load_mbuffer_history(path):
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        runs = data.get("runs")
+        return runs if isinstance(runs, list) else []
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        dbg(f"mbuffer autotune: ignoring unreadable history {path}: {e}")
+        return []
+
+
+def save_mbuffer_history(transfer_method, host, buffer_bytes, block):
+    """Append this run's transfer samples to the destination's history."""
+    if not MBUFFER_AUTOTUNE_ENABLED or not _transfer_samples:
+        return
+    path = _mbuffer_tune_path(transfer_method, host)
+    total = sum(s["bytes"] for s in _transfer_samples)
+    secs = sum(s["secs"] for s in _transfer_samples if not s["stalled"])
+    run = {
+        "ts": int(time.time()),
+        "bytes": total,
+        "secs": round(secs, 3),
+        "stalls": sum(1 for s in _transfer_samples if s["stalled"]),
+        "buffer": int(buffer_bytes),
+        "block": block,
+    }
+    runs = (_load_mbuffer_history(path) + [run])[-MBUFFER_TUNE_HISTORY:]
+    try:
+        os.makedirs(MBUFFER_TUNE_DIR, exist_ok=True)
+        tmp = f"{path}.tmp.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump({"version": 1, "runs": runs}, f)
+        os.replace(tmp, path)
+    except Exception as e:
+        dbg(f"mbuffer autotune: could not write {path}: {e}")
+
+
+def _mem_available_bytes():
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except Exception:
+        pass
+    return None
+
+
+def _mbuffer_bytes(size, unit):
+    mult = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}.get(str(unit).upper(), 1024 ** 3)
+    try:
+        return int(size) * mult
+    except (TypeError, ValueError):
+        return mult
+
+
+def autotune_mbuffer(transfer_method, host, size, unit):
+    """Pick (size, unit) for mbuffer from this destination's history and set
+    MBUFFER_BLOCK_SIZE for the rest of the run.
+
+    Buffer holds MBUFFER_TUNE_SECONDS of the median observed rate, doubled if
+    any recent run stalled, within [64 MiB, min(ZFS_REP_MBUFFER_TUNE_MAX,
+    MemAvailable/8)]. Block size follows the link: 1M for fast LAN, 512k for
+    mid-range, 128k for slow WAN links. Without usable history the configured
+    values are returned unchanged."""
+    global MBUFFER_BLOCK_SIZE
+    configured_block = MBUFFER_BLOCK_SIZE
+    runs = _load_mbuffer_history(_mbuffer_tune_path(transfer_method, host))
+    rates = sorted(
+        r["bytes"] / r["secs"]
+        for r in runs
+        if r.get("secs", 0) > 0 and r.get("bytes", 0) >= MBUFFER_TUNE_MIN_SAMPLE
+    )
+    if not rates:
+        dbg(f"mbuffer autotune: no history for {transfer_method}/{host}; using {size}{unit} -s {configured_block}")
+        return size, unit
+
+    rate = rates[len(rates) // 2]
+    stalls = sum(int(r.get("stalls", 0) or 0) for r in runs[-3:])
+
+    want = int(rate * MBUFFER_TUNE_SECONDS)
+    if stalls:
+        want *= 2
+    ceiling = MBUFFER_TUNE_MAX
+    mem = _mem_available_bytes()
+    if mem:
+        ceiling = min(ceiling, mem // 8)
+    ceiling = max(ceiling, MBUFFER_TUNE_MIN)
+    want = max(MBUFFER_TUNE_MIN, min(want, ceiling))
+    mib = max(1, want // (1024 * 1024))
+
+    mib_s = rate / (1024 * 1024)
+    if mib_s >= 200:
+        block = "1M"
+    elif mib_s >= 50:
+        block = "512k"
+    else:
+        block = "128k"
+
+    msg = (
+        f"mbuffer autotune ({transfer_method or 'local'} {host or 'localhost'}): "
+        f"median {mib_s:.1f} MiB/s over {len(rates)} run(s), {stalls} recent stall(s) -> "
+        f"-m {mib}M -s {block} (configured {size}{unit} -s {configured_block}, ceiling {format_bytes(ceiling)})"
+    )
+    dbg(msg)
+    print(msg)
+    MBUFFER_BLOCK_SIZE = block
+    return str(mib), "M"
+
+
 # --- Netcat readiness polling ------------------------------------------------
 
 def _wait_for_port(host, port, timeout=30, interval=0.5):
@@ -719,25 +1294,43 @@ DIRECT_PIPE_ENABLED = as_bool(os.environ.get("ZFS_REP_DIRECT_PIPE"))
 
 
 def _has_pv():
-    """Check if pv (pipe viewer) is installed."""
-    try:
-        p = subprocess.run(["which", "pv"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=5)
-        return p.returncode == 0
-    except Exception:
-        return False
+    """Check if pv (pipe viewer) is installed (host capability cache)."""
+    return host_capabilities()["pv"]
+
+
+_PV_UNITS = {"B": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4, "PiB": 1024 ** 5}
+
+
+def _pv_lines(pv_stderr):
+    """pv redraws its status line with carriage returns; yield each update as a line."""
+    fd = pv_stderr.fileno()
+    buf = b""
+    while True:
+        data = os.read(fd, 4096)
+        if not data:
+            break
+        buf += data
+        parts = re.split(rb"[\r\n]", buf)
+        buf = parts.pop()
+        for part in parts:
+            yield part
+    if buf:
+        yield buf
 
 
 def _pv_monitor_thread(pv_stderr, total_bytes, label, notifier_ref, last_activity=None):
     """Read pv stderr output and emit progress notifications.
     pv -f writes progress lines to stderr like:
       1.23GiB 0:00:10 [ 126MiB/s] [====>               ] 12%
-    We parse the percentage or byte count for notifications.
+    We parse the percentage or byte count for notifications. total_bytes may
+    be a SizeEstimate: until it arrives the byte count is reported, then a
+    percentage computed from it.
     If last_activity is provided (a single-element list), update it with time.time()
     on each output line so the caller can detect stalls."""
     last_pct = -1.0
     last_emit = 0.0
     try:
-        for raw_line in iter(pv_stderr.readline, b""):
+        for raw_line in _pv_lines(pv_stderr):
             line = raw_line.decode(errors="replace").strip()
             if not line:
                 continue
@@ -752,6 +1345,20 @@ def _pv_monitor_thread(pv_stderr, total_bytes, label, notifier_ref, last_activit
                     notifier_ref.notify(f"STATUS={label}… {pct:.0f}% complete")
                     last_pct = pct
                     last_emit = now
+            else:
+                b = re.match(r'([\d.]+)\s*([KMGTP]?i?B)\b', line)
+                if b and b.group(2) in _PV_UNITS:
+                    done = float(b.group(1)) * _PV_UNITS[b.group(2)]
+                    total = _size_of(total_bytes)
+                    if total:
+                        pct = min(round(done * 100.0 / total, 1), 100.0)
+                        if pct > last_pct and (now - last_emit) >= 1.0:
+                            notifier_ref.notify(f"STATUS={label}… {pct:.1f}% complete")
+                            last_pct = pct
+                            last_emit = now
+                    elif (now - last_emit) >= 5.0:
+                        notifier_ref.notify(f"STATUS={label}… {done / (1024 * 1024):.1f} MiB sent")
+                        last_emit = now
             # Also log rate info from pv
             rate_m = re.search(r'\[\s*([\d.]+\s*[KMGT]i?B/s)\s*\]', line)
             if rate_m and (now - last_emit) >= 10.0:
@@ -774,9 +1381,9 @@ def _direct_pipe_transfer(src_process, mbuffer_cmd, recv_cmd, total_bytes, label
     procs = []
     try:
         # Build pv command for progress monitoring
-        pv_cmd = ["pv", "-f", "-b", "-r", "-t"]
-        if total_bytes:
-            pv_cmd.extend(["-s", str(total_bytes)])
+        pv_cmd = ["pv", "-f", "-b", "-r", "-t"] + _rate_limit_args("pv")
+        if _size_of(total_bytes):
+            pv_cmd.extend(["-s", str(_size_of(total_bytes))])
 
         # Shared mutable timestamp for stall detection (single-element list for thread safety)
         last_activity = [time.time()]
@@ -906,17 +1513,22 @@ def _direct_pipe_transfer(src_process, mbuffer_cmd, recv_cmd, total_bytes, label
         return False, f"Direct pipe error: {e}"
 
 
-def build_zfs_send_args(sendName, sendName2, *, recursive, compressed, raw, include_intermediates=None):
+def build_zfs_send_args(sendName, sendName2, *, recursive, compressed, raw, include_intermediates=None, props=False):
     """Build zfs send argument list.
 
     include_intermediates controls -I vs -i independently of recursive:
       - None (default): legacy behavior (recursive implies -I)
       - True: use -I (all intermediate snapshots)
       - False: use -i (only delta from base to target)
+
+    props adds -p for non-recursive sends that should carry dataset
+    properties the way -R does (per-child parallel replication).
     """
     args = ["zfs", "send"]
     if recursive:
         args.append("-R")
+    elif props:
+        args.append("-p")
     if compressed:
         args.append("-Lce")
     if raw:
@@ -950,6 +1562,10 @@ class StreamCapture:
         except Exception:
             pass
 
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
     def text(self) -> str:
         if not self._lines:
             return ""
@@ -986,27 +1602,35 @@ def _parse_send_size_output(raw: bytes):
     return total if found_size_line and total > 0 else None
 
 
-def estimate_send_size(send_cmd):
+def estimate_send_size(send_cmd, on_start=None):
+    """Estimate total send size with a local dry run. on_start(proc) is
+    called with the dry-run process so the caller can cancel it."""
     try:
         cmd = list(send_cmd)
         if len(cmd) < 2 or cmd[0] != "zfs" or cmd[1] != "send":
             return None
         cmd.insert(2, "-nP")
-        p = run_logged(cmd, text=False)
+        dbg(f"RUN local (estimate): {_fmt_cmd(cmd)}")
+        start = time.time()
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if on_start is not None:
+            on_start(p)
+        out, err = p.communicate()
+        dbg(f"RC local (estimate)={p.returncode} dur={time.time() - start:.2f}s")
 
         if p.returncode != 0:
             return None
-        raw = (p.stdout or b"") + (p.stderr or b"")
-        return _parse_send_size_output(raw)
+        return _parse_send_size_output((out or b"") + (err or b""))
     except Exception:
         return None
 
 
-def estimate_send_size_remote(remote_user, remote_host, remote_port, send_cmd):
+def estimate_send_size_remote(remote_user, remote_host, remote_port, send_cmd, on_start=None):
     """Estimate total send size by running a dry-run via SSH.
 
     Uses Popen to stream output line-by-line, avoiding unbounded memory
-    usage for large recursive sends with many child datasets.
+    usage for large recursive sends with many child datasets. on_start(proc)
+    is called with the ssh process so the caller can cancel it.
     """
     try:
         cmd = list(send_cmd)
@@ -1014,10 +1638,7 @@ def estimate_send_size_remote(remote_user, remote_host, remote_port, send_cmd):
             return None
         cmd.insert(2, "-nP")
 
-        ssh_cmd = ["ssh"] + SSH_BASE_OPTS
-        if str(remote_port) != "22":
-            ssh_cmd += ["-p", str(remote_port)]
-        ssh_cmd.append(f"{remote_user}@{remote_host}")
+        ssh_cmd = ssh_base_args(remote_user, remote_host, remote_port)
         ssh_cmd.append(" ".join(shlex.quote(str(a)) for a in cmd))
 
         dbg(f"RUN ssh (estimate): {_fmt_cmd(ssh_cmd)}")
@@ -1027,6 +1648,8 @@ def estimate_send_size_remote(remote_user, remote_host, remote_port, send_cmd):
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
         )
+        if on_start is not None:
+            on_start(p)
 
         total = 0
         found_size_line = False
@@ -1067,194 +1690,620 @@ def estimate_send_size_remote(remote_user, remote_host, remote_port, send_cmd):
         return None
 
 
-def stream_with_progress(src, dst, total_bytes, label="Transferring", min_interval=1.0, chunk_size=None):
-    """Returns (bytes_sent, pipe_broken) tuple."""
-    bytes_sent = 0
-    pipe_broken = False
-    last_pct = -1.0
-    last_emit = 0.0
-    last_dbg = 0.0
-    start_time = time.time()
-    window_bytes = 0
-    window_start = start_time
+# The `zfs send -nP` dry run walks the same metadata as the real send and can
+# take minutes for large recursive incrementals. By default it runs alongside
+# the transfer: progress is reported in bytes until the estimate arrives and
+# switches to percentages once it does. ZFS_REP_ASYNC_ESTIMATE=0 restores the
+# estimate-then-send order.
+ASYNC_ESTIMATE_ENABLED = as_bool(os.environ.get("ZFS_REP_ASYNC_ESTIMATE"), default=True)
+
+
+class SizeEstimate:
+    """Send size that may still be being computed. ``value`` is None until
+    the estimate is in (and stays None if it fails); the transfer loops read
+    it on every chunk. on_ready(total) runs once when a size arrives.
+
+    estimate(on_start) runs the dry run and hands its process to on_start,
+    so cancel() can kill it. An estimate started inside a function wrapped
+    with _cancels_estimates is cancelled when that function returns."""
+
+    def __init__(self, estimate, on_ready=None):
+        self.value = None
+        self._on_ready = on_ready
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._proc = None
+        self._cancelled = False
+        self._start = time.time()
+        scope = getattr(_estimate_scope, "active", None)
+        if scope is not None:
+            scope.append(self)
+        if ASYNC_ESTIMATE_ENABLED:
+            threading.Thread(target=self._run, args=(estimate,), name="send-size-estimate", daemon=True).start()
+        else:
+            self._run(estimate)
 
-    # Default 1 MiB chunk; configurable for benchmarking
-    read_size = chunk_size or int(os.environ.get("ZFS_REP_CHUNK_SIZE", str(1024 * 1024)))
+    def _track(self, proc):
+        with self._lock:
+            self._proc = proc
+            if self._cancelled:
+                _kill_quietly(proc)
 
-    if total_bytes:
-        notifier.notify(f"STATUS={label}… 0.0% complete")
-        dbg(f"{label} start: estimated_total={total_bytes} ({format_bytes(total_bytes)}) chunk_size={read_size}")
-    else:
-        notifier.notify(f"STATUS={label}…")
-        dbg(f"{label} start: estimated_total=unknown chunk_size={read_size}")
+    def _run(self, estimate):
+        try:
+            total = estimate(self._track)
+        except Exception as e:
+            dbg(f"send size estimate failed: {e}")
+            total = None
+        elapsed = time.time() - self._start
+        with self._lock:
+            if self._cancelled:
+                dbg(f"send size estimate cancelled after {elapsed:.2f}s")
+            elif total:
+                self.value = int(total)
+                dbg(f"send size estimate: {self.value} bytes ({format_bytes(self.value)}) after {elapsed:.2f}s")
+                if self._on_ready is not None:
+                    self._on_ready(self.value)
+            else:
+                dbg(f"send size estimate unavailable after {elapsed:.2f}s")
+                safe_print("Note: Could not estimate send size; progress will be indeterminate.")
+        self._done.set()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.value
+
+    def cancel(self):
+        """Stop a dry run that is still going; on_ready will not run after
+        this returns."""
+        with self._lock:
+            if self._done.is_set() or self._cancelled:
+                return
+            self._cancelled = True
+            if self._proc is not None:
+                _kill_quietly(self._proc)
+
+
+def _kill_quietly(proc):
+    try:
+        if proc.poll() is None:
+            proc.kill()
+    except Exception:
+        pass
+
+
+_estimate_scope = threading.local()
+
+
+def _cancels_estimates(fn):
+    """Cancel every SizeEstimate started by *fn* (in this thread) once it
+    returns, raises or exits, so a dry run still walking metadata does not
+    outlive its transfer."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_estimate_scope, "active", None)
+        _estimate_scope.active = []
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            for estimate in _estimate_scope.active:
+                estimate.cancel()
+            _estimate_scope.active = outer
+    return wrapper
+
+
+def _size_of(total_bytes):
+    """Current byte total from an int or a SizeEstimate (None if unknown)."""
+    if isinstance(total_bytes, SizeEstimate):
+        return total_bytes.value
+    return total_bytes
+
+
+class StallTimeout(Exception):
+    """Raised when no data flows for longer than the stall timeout."""
+    pass
 
+
+class _TransferProgress:
+    """Byte counting, status notifications, debug heartbeat and stall
+    detection shared by the copy loops (read/write and splice), so the
+    engines report identically.
+
+    total_bytes may be a SizeEstimate still in flight: bytes are reported
+    until it arrives. base_bytes is what earlier attempts already moved
+    (percentages are of total_bytes overall); on_checkpoint(bytes_sent) is
+    called on every heartbeat; throttle (bandwidth.Throttle) paces the copy.
+    """
+
+    def __init__(self, label, total_bytes, min_interval=1.0, stall_timeout=0,
+                 base_bytes=0, on_checkpoint=None, throttle=None, engine=""):
+        self.label = label
+        self.size_source = total_bytes
+        self.total_bytes = _size_of(total_bytes)
+        self.min_interval = min_interval
+        self.stall_timeout = stall_timeout if stall_timeout and stall_timeout > 0 else 0
+        self.base_bytes = base_bytes
+        self.on_checkpoint = on_checkpoint
+        self.throttle = throttle
+        self.tag = f" ({engine})" if engine else ""
+        self.bytes_sent = 0
+        self.pipe_broken = False
+        self.last_pct = -1.0
+        self.last_emit = 0.0
+        self.last_dbg = 0.0
+        self.last_data_time = time.time()
+        self.start_time = self.last_data_time
+        self.window_bytes = 0
+        self.window_start = self.start_time
+
+    def start(self, detail=""):
+        label = self.label
+        if self.total_bytes:
+            notifier.notify(f"STATUS={label}… {min(self.base_bytes * 100.0 / self.total_bytes, 100.0):.1f}% complete")
+        else:
+            notifier.notify(f"STATUS={label}…")
+        dbg(f"{label} start{self.tag}: estimated_total={self.total_bytes or 'unknown'}{detail}")
+
+    def wait_readable(self, fd):
+        """Block until fd has data (or EOF). Raises StallTimeout once nothing
+        has arrived for stall_timeout seconds; returns at once when stall
+        detection is off."""
+        if not self.stall_timeout:
+            return
+        poll_interval = min(30.0, self.stall_timeout)
+        while True:
+            ready, _, _ = select.select([fd], [], [], poll_interval)
+            if ready:
+                return
+            elapsed = time.time() - self.last_data_time
+            if elapsed >= self.stall_timeout:
+                mib = self.bytes_sent / (1024 * 1024)
+                raise StallTimeout(
+                    f"No data received for {int(elapsed)}s (stall timeout: {self.stall_timeout}s). "
+                    f"Transferred {mib:.1f} MiB before stall."
+                )
+
+    def broken(self):
+        safe_print(f"WARNING: {self.label} pipe broken after {self.bytes_sent/(1024*1024):.1f} MiB — downstream process likely exited.")
+        dbg(f"{self.label} BrokenPipeError after bytes_sent={self.bytes_sent}")
+        self.pipe_broken = True
+
+    def add(self, n):
+        """Account for n bytes just moved."""
+        if self.throttle is not None:
+            self.throttle.consume(n)
+        now = self.last_data_time = time.time()
+        self.bytes_sent += n
+        self.window_bytes += n
+        label = self.label
+
+        if not self.total_bytes and self.size_source is not None:
+            self.total_bytes = _size_of(self.size_source)
+            if self.total_bytes:
+                dbg(f"{label}: size estimate arrived after {self.bytes_sent} bytes; total={self.total_bytes}")
+
+        if self.total_bytes:
+            pct = min(round((self.base_bytes + self.bytes_sent) * 100.0 / self.total_bytes, 1), 100.0)
+            if pct > self.last_pct and (now - self.last_emit) >= self.min_interval:
+                notifier.notify(f"STATUS={label}… {pct:.1f}% complete")
+                self.last_pct = pct
+                self.last_emit = now
+        elif (now - self.last_emit) >= max(5.0, self.min_interval):
+            mib = self.bytes_sent / (1024 * 1024)
+            notifier.notify(f"STATUS={label}… {mib:.1f} MiB sent")
+            safe_print(f"{label}… {mib:.1f} MiB sent")
+            self.last_emit = now
+
+        if (now - self.last_dbg) >= 10.0:
+            self._heartbeat(now)
+
+    def _heartbeat(self, now):
+        elapsed = now - self.start_time
+        avg_rate = self.bytes_sent / elapsed if elapsed > 0 else 0
+        window_elapsed = now - self.window_start
+        current_rate = self.window_bytes / window_elapsed if window_elapsed > 0 else 0
+        eta_str = ""
+        if self.total_bytes and avg_rate > 0:
+            remaining = self.total_bytes - self.base_bytes - self.bytes_sent
+            eta_str = f" ETA={int(remaining / avg_rate)}s"
+        dbg(
+            f"heartbeat {self.label}{self.tag}: bytes_sent={self.bytes_sent} ({self.bytes_sent/(1024*1024):.1f} MiB) "
+            f"current_rate={current_rate/(1024*1024):.1f} MiB/s "
+            f"avg_rate={avg_rate/(1024*1024):.1f} MiB/s{eta_str}"
+        )
+        self.last_dbg = now
+        self.window_bytes = 0
+        self.window_start = now
+        if self.on_checkpoint is not None:
+            self.on_checkpoint(self.bytes_sent)
+
+    def finish(self):
+        """Log the summary; returns (bytes_sent, pipe_broken)."""
+        elapsed = time.time() - self.start_time
+        avg_rate = self.bytes_sent / elapsed if elapsed > 0 else 0
+        dbg(
+            f"{self.label} finished{self.tag}: bytes_sent={self.bytes_sent} ({format_bytes(self.bytes_sent)}) "
+            f"elapsed={elapsed:.1f}s avg_rate={avg_rate/(1024*1024):.1f} MiB/s pipe_broken={self.pipe_broken}"
+        )
+        return self.bytes_sent, self.pipe_broken
+
+
+def _copy_loop(src, dst, progress, read_size):
+    """Read/write copy of src into dst, reported through *progress*."""
+    fd = src.fileno() if progress.stall_timeout else None
     while True:
+        if fd is not None:
+            progress.wait_readable(fd)
         chunk = src.read(read_size)
         if not chunk:
             break
         try:
             dst.write(chunk)
         except (BrokenPipeError, ValueError):
-            safe_print(f"WARNING: {label} pipe broken after {bytes_sent/(1024*1024):.1f} MiB — downstream process likely exited.")
-            dbg(f"{label} BrokenPipeError after bytes_sent={bytes_sent}")
-            pipe_broken = True
+            progress.broken()
             break
-        bytes_sent += len(chunk)
-        window_bytes += len(chunk)
-        now = time.time()
-
-        if total_bytes:
-            pct = min(round(bytes_sent * 100.0 / total_bytes, 1), 100.0)
-            if pct > last_pct and (now - last_emit) >= min_interval:
-                notifier.notify(f"STATUS={label}… {pct:.1f}% complete")
-                last_pct = pct
-                last_emit = now
-        else:
-            if (now - last_emit) >= max(5.0, min_interval):
-                mib = bytes_sent / (1024 * 1024)
-                notifier.notify(f"STATUS={label}… {mib:.1f} MiB sent")
-                safe_print(f"{label}… {mib:.1f} MiB sent")
-                last_emit = now
-
-        # debug heartbeat every 10s with rate info
-        if (now - last_dbg) >= 10.0:
-            elapsed = now - start_time
-            avg_rate = bytes_sent / elapsed if elapsed > 0 else 0
-            window_elapsed = now - window_start
-            current_rate = window_bytes / window_elapsed if window_elapsed > 0 else 0
-            eta_str = ""
-            if total_bytes and avg_rate > 0:
-                remaining = total_bytes - bytes_sent
-                eta_secs = remaining / avg_rate
-                eta_str = f" ETA={int(eta_secs)}s"
-            dbg(
-                f"heartbeat {label}: bytes_sent={bytes_sent} ({bytes_sent/(1024*1024):.1f} MiB) "
-                f"current_rate={current_rate/(1024*1024):.1f} MiB/s "
-                f"avg_rate={avg_rate/(1024*1024):.1f} MiB/s{eta_str}"
-            )
-            last_dbg = now
-            window_bytes = 0
-            window_start = now
+        progress.add(len(chunk))
 
     try:
         dst.flush()
     except Exception:
         pass
+    return progress.finish()
 
-    elapsed = time.time() - start_time
-    avg_rate = bytes_sent / elapsed if elapsed > 0 else 0
-    dbg(
-        f"{label} finished: bytes_sent={bytes_sent} ({format_bytes(bytes_sent)}) "
-        f"elapsed={elapsed:.1f}s avg_rate={avg_rate/(1024*1024):.1f} MiB/s pipe_broken={pipe_broken}"
+
+def stream_with_progress(src, dst, total_bytes, label="Transferring", min_interval=1.0, chunk_size=None):
+    """Returns (bytes_sent, pipe_broken) tuple."""
+    # Default 1 MiB chunk; configurable for benchmarking
+    read_size = chunk_size or int(os.environ.get("ZFS_REP_CHUNK_SIZE", str(1024 * 1024)))
+    progress = _TransferProgress(label, total_bytes, min_interval=min_interval)
+    progress.start(f" chunk_size={read_size}")
+    return _copy_loop(src, dst, progress, read_size)
+
+
+def stream_with_progress_stall(src, dst, total_bytes, label="Resuming", min_interval=1.0, stall_timeout=3600,
+                               base_bytes=0, on_checkpoint=None, throttle=None):
+    """Like stream_with_progress but raises StallTimeout if no data arrives for stall_timeout seconds.
+    If stall_timeout is 0 or None, stall detection is disabled (behaves like stream_with_progress).
+    base_bytes, on_checkpoint, throttle and a SizeEstimate total_bytes are as
+    for _TransferProgress.
+    Returns (bytes_sent, pipe_broken) tuple."""
+    read_size = int(os.environ.get("ZFS_REP_CHUNK_SIZE", str(1024 * 1024)))
+    progress = _TransferProgress(
+        label, total_bytes, min_interval=min_interval, stall_timeout=stall_timeout,
+        base_bytes=base_bytes, on_checkpoint=on_checkpoint, throttle=throttle,
     )
-    return bytes_sent, pipe_broken
+    progress.start()
+    return _copy_loop(src, dst, progress, read_size)
 
 
-class StallTimeout(Exception):
-    """Raised when no data flows for longer than the stall timeout."""
+# --- Zero-copy splice() transfer ---------------------------------------------
+
+# Set ZFS_REP_SPLICE=1 to move the send stream between pipes with splice(2)
+# instead of reading it into Python. The pages are handed from the zfs send
+# pipe straight to the mbuffer/ssh/nc/recv pipe; Python only counts bytes for
+# progress and stall detection. Falls back to the read/write loop when
+# splice is not available or the kernel rejects the descriptors.
+SPLICE_ENABLED = as_bool(os.environ.get("ZFS_REP_SPLICE"))
+SPLICE_PIPE_SIZE = int(os.environ.get("ZFS_REP_SPLICE_PIPE_SIZE", str(1024 * 1024)))
+
+
+class _SpliceUnsupported(Exception):
+    """splice() refused the descriptors before any data was moved."""
     pass
 
 
-def stream_with_progress_stall(src, dst, total_bytes, label="Resuming", min_interval=1.0, stall_timeout=3600):
-    """Like stream_with_progress but raises StallTimeout if no data arrives for stall_timeout seconds.
-    If stall_timeout is 0 or None, stall detection is disabled (behaves like stream_with_progress).
+def _grow_pipe(fd, size):
+    """Best-effort F_SETPIPE_SZ so each splice() moves more than 64 KiB.
+    Capped by /proc/sys/fs/pipe-max-size for unprivileged callers."""
+    try:
+        import fcntl
+        setsz = getattr(fcntl, "F_SETPIPE_SZ", 1031)
+        return fcntl.fcntl(fd, setsz, size)
+    except Exception:
+        return None
+
+
+def stream_with_splice(src, dst, total_bytes, label="Transferring", min_interval=1.0, stall_timeout=3600,
+                       base_bytes=0, on_checkpoint=None, throttle=None):
+    """Zero-copy counterpart of stream_with_progress_stall.
+
+    Same progress notifications, heartbeat, throttle and StallTimeout semantics.
+    Raises _SpliceUnsupported if the first splice() fails with EINVAL/ENOSYS
+    so the caller can retry with the read/write loop; nothing has been
+    consumed from src at that point.
     Returns (bytes_sent, pipe_broken) tuple."""
-    import select as _select
+    import errno
 
-    bytes_sent = 0
-    pipe_broken = False
-    last_pct = -1.0
-    last_emit = 0.0
-    last_dbg = 0.0
-    last_data_time = time.time()
-    start_time = last_data_time
-    window_bytes = 0
-    window_start = start_time
-    stall_enabled = bool(stall_timeout and stall_timeout > 0)
+    if not hasattr(os, "splice"):
+        raise _SpliceUnsupported("os.splice not available")
 
-    read_size = int(os.environ.get("ZFS_REP_CHUNK_SIZE", str(1024 * 1024)))
+    src_fd = src.fileno()
+    try:
+        dst.flush()
+    except Exception:
+        pass
+    dst_fd = dst.fileno()
+
+    src_pipe = _grow_pipe(src_fd, SPLICE_PIPE_SIZE)
+    dst_pipe = _grow_pipe(dst_fd, SPLICE_PIPE_SIZE)
+    move_size = max(src_pipe or 0, dst_pipe or 0, 64 * 1024)
+    flags = getattr(os, "SPLICE_F_MOVE", 0) | getattr(os, "SPLICE_F_MORE", 0)
+
+    progress = _TransferProgress(
+        label, total_bytes, min_interval=min_interval, stall_timeout=stall_timeout,
+        base_bytes=base_bytes, on_checkpoint=on_checkpoint, throttle=throttle, engine="splice",
+    )
+    started = False
+
+    while True:
+        progress.wait_readable(src_fd)
+        try:
+            n = os.splice(src_fd, dst_fd, move_size, flags=flags)
+        except BrokenPipeError:
+            progress.broken()
+            break
+        except OSError as e:
+            if not started and e.errno in (errno.EINVAL, errno.ENOSYS, errno.EBADF):
+                raise _SpliceUnsupported(str(e))
+            raise
+
+        if not started:
+            started = True
+            progress.start(f" move_size={move_size}")
+
+        if n == 0:
+            break
+        progress.add(n)
+
+    return progress.finish()
+
+
+# --- Progress journal ---------------------------------------------------------
+
+# Each send/recv into a dataset keeps a small journal of the stream's total
+# size, bytes moved so far and recent throughput, checkpointed on every
+# transfer heartbeat. When a later run resumes from a receive_resume_token
+# it picks up the overall total and position from the journal, so progress
+# and ETA are right immediately and the `zfs send -nP` dry run is skipped.
+# ZFS_REP_JOURNAL=0 disables it.
+JOURNAL_ENABLED = as_bool(os.environ.get("ZFS_REP_JOURNAL"), default=True)
+JOURNAL_DIR = os.environ.get("ZFS_REP_JOURNAL_DIR", "/var/lib/houston/scheduler/progress")
+JOURNAL_MAX_AGE = int(os.environ.get("ZFS_REP_JOURNAL_MAX_AGE", str(30 * 86400)))
+JOURNAL_SAMPLES = 30
+JOURNAL_VERSION = 1
+
+
+_TOKEN_TONAME_RE = re.compile(rb"toname\0+([^\0]+)\0")
+
+
+def _resume_token_snapshot(token):
+    """Snapshot a receive_resume_token continues (its `toname`), or None if
+    the token cannot be decoded. The token is "1-<cksum>-<len>-<hex>" with
+    the hex being a zlib-compressed packed nvlist; strings in it are
+    NUL-terminated, so the value is read straight after the key."""
+    try:
+        packed = zlib.decompress(bytes.fromhex(token.split("-", 3)[3]))
+    except Exception:
+        return None
+    m = _TOKEN_TONAME_RE.search(packed)
+    if not m:
+        return None
+    name = m.group(1).decode(errors="replace")
+    return name if "@" in name else None
 
-    if total_bytes:
-        notifier.notify(f"STATUS={label}… 0.0% complete")
-    else:
-        notifier.notify(f"STATUS={label}…")
 
-    fd = src.fileno()
+class ProgressJournal:
+    """On-disk progress record for the stream currently feeding one dataset.
 
-    while True:
-        if stall_enabled:
-            # Wait for data with a timeout chunk (check every 30s)
-            poll_interval = min(30.0, stall_timeout)
-            ready, _, _ = _select.select([fd], [], [], poll_interval)
-            if not ready:
-                elapsed = time.time() - last_data_time
-                if elapsed >= stall_timeout:
-                    mib = bytes_sent / (1024 * 1024)
-                    raise StallTimeout(
-                        f"No data received for {int(elapsed)}s (stall timeout: {stall_timeout}s). "
-                        f"Transferred {mib:.1f} MiB before stall."
-                    )
-                continue
+    Journals are keyed by the remote peer (receiving host for a push, sending
+    host for a pull; empty for local) plus the receiving dataset, so tasks
+    that use the same dataset name on different hosts do not share one.
+    Once clear() removes a journal, late writes to it (a size estimate or
+    checkpoint still in flight) are dropped instead of recreating the file.
+    """
 
-        chunk = src.read(read_size)
-        if not chunk:
-            break
-        last_data_time = time.time()
+    _open = {}
+    _open_lock = threading.Lock()
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self.base = int(data.get("bytes_done", 0) or 0)
+        self._lock = threading.Lock()
+        self._closed = False
+        with self._open_lock:
+            self._open[path] = self
+
+    @staticmethod
+    def path_for(recv_fs, peer=""):
+        key = f"{peer}|{recv_fs}" if peer else recv_fs
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", recv_fs)[:64]
+        return os.path.join(JOURNAL_DIR, f"{safe}-{digest}.json")
+
+    @classmethod
+    def begin(cls, recv_fs, snapshot, total_bytes, token="", peer=""):
+        """Start a journal for a fresh stream (replaces any previous one)."""
+        if not JOURNAL_ENABLED:
+            return None
+        now = int(time.time())
+        j = cls(cls.path_for(recv_fs, peer), {
+            "version": JOURNAL_VERSION,
+            "task": os.environ.get("taskName", ""),
+            "dest": recv_fs,
+            "peer": peer,
+            "snapshot": snapshot,
+            "total_bytes": int(total_bytes or 0),
+            "bytes_done": 0,
+            "token": token,
+            "attempts": 1,
+            "started": now,
+            "updated": now,
+            "samples": [],
+        })
+        j._write()
+        return j
+
+    @classmethod
+    def resume(cls, recv_fs, token, peer=""):
+        """Journal of the interrupted stream behind *token*, or None if there
+        is no usable one (missing, stale, for another stream, no size or no
+        checkpoint yet)."""
+        if not JOURNAL_ENABLED:
+            return None
+        path = cls.path_for(recv_fs, peer)
         try:
-            dst.write(chunk)
-        except (BrokenPipeError, ValueError):
-            safe_print(f"WARNING: {label} pipe broken after {bytes_sent/(1024*1024):.1f} MiB — downstream process likely exited.")
-            dbg(f"{label} BrokenPipeError after bytes_sent={bytes_sent}")
-            pipe_broken = True
-            break
-        bytes_sent += len(chunk)
-        window_bytes += len(chunk)
-        now = time.time()
+            with open(path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            dbg(f"journal {path} unreadable: {e}")
+            return None
+        if (data.get("version") != JOURNAL_VERSION or data.get("dest") != recv_fs
+                or data.get("peer", "") != peer):
+            return None
+        if time.time() - float(data.get("updated", 0)) > JOURNAL_MAX_AGE:
+            return None
+        if not data.get("total_bytes") or not data.get("bytes_done"):
+            return None
+        # The token must continue the stream this journal was recording.
+        token_snap = _resume_token_snapshot(token)
+        if not token_snap or token_snap != data.get("snapshot"):
+            dbg(f"journal {path} is for {data.get('snapshot') or 'an unknown snapshot'}, "
+                f"resume token is for {token_snap or 'an unknown snapshot'}; ignoring it")
+            return None
+        data["token"] = token
+        data["attempts"] = int(data.get("attempts", 1)) + 1
+        j = cls(path, data)
+        j._write()
+        return j
+
+    @classmethod
+    def clear(cls, recv_fs, peer=""):
+        path = cls.path_for(recv_fs, peer)
+        with cls._open_lock:
+            j = cls._open.pop(path, None)
+        if j is not None:
+            with j._lock:
+                j._closed = True
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            dbg(f"journal clear failed for {recv_fs}: {e}")
+
+    @property
+    def total(self):
+        return int(self.data.get("total_bytes", 0) or 0)
+
+    def rate(self):
+        """Bytes/s over the recorded samples (0 if unknown)."""
+        samples = self.data.get("samples") or []
+        if len(samples) < 2:
+            return 0.0
+        (t0, b0), (t1, b1) = samples[0], samples[-1]
+        return (b1 - b0) / (t1 - t0) if t1 > t0 and b1 >= b0 else 0.0
+
+    def set_total(self, total_bytes):
+        """Fill in the stream size once a background estimate arrives."""
+        with self._lock:
+            if self._closed:
+                return
+            self.data["total_bytes"] = int(total_bytes or 0)
+            self._write()
+
+    def checkpoint(self, bytes_sent):
+        """Record this attempt's byte count (called from the transfer heartbeat)."""
+        with self._lock:
+            if self._closed:
+                return
+            now = time.time()
+            done = self.base + int(bytes_sent)
+            self.data["bytes_done"] = done
+            self.data["updated"] = int(now)
+            samples = self.data.setdefault("samples", [])
+            samples.append([round(now, 1), done])
+            del samples[:-JOURNAL_SAMPLES]
+            self._write()
+
+    def _write(self):
+        try:
+            os.makedirs(JOURNAL_DIR, exist_ok=True)
+            tmp = f"{self.path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp, "w") as f:
+                json.dump(self.data, f)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            dbg(f"journal write failed ({self.path}): {e}")
+
+
+def _resume_progress(recv_fs, resume_token, estimate, peer=""):
+    """Total and starting offset for a resumed stream: from the journal when
+    it has them, otherwise from *estimate()* (a `zfs send -nP -t` dry run of
+    the remainder). Returns (total_bytes, journal)."""
+    journal = ProgressJournal.resume(recv_fs, resume_token, peer)
+    if journal is not None:
+        total, done = journal.total, journal.base
+        rate = journal.rate()
+        eta = f", ETA ~{int((total - done) / rate)}s at last rate" if rate > 0 and total > done else ""
+        msg = (
+            f"Resuming interrupted transfer to {recv_fs}: {format_bytes(done)} of {format_bytes(total)} "
+            f"already sent ({min(done * 100.0 / total, 100.0):.1f}%){eta}."
+        )
+        print(msg)
+        dbg(f"{msg} (journal attempt {journal.data.get('attempts')}; size estimate skipped)")
+        return total, journal
 
-        if total_bytes:
-            pct = min(round(bytes_sent * 100.0 / total_bytes, 1), 100.0)
-            if pct > last_pct and (now - last_emit) >= min_interval:
-                notifier.notify(f"STATUS={label}… {pct:.1f}% complete")
-                last_pct = pct
-                last_emit = now
-        else:
-            if (now - last_emit) >= max(5.0, min_interval):
-                mib = bytes_sent / (1024 * 1024)
-                notifier.notify(f"STATUS={label}… {mib:.1f} MiB sent")
-                safe_print(f"{label}… {mib:.1f} MiB sent")
-                last_emit = now
-
-        if (now - last_dbg) >= 10.0:
-            elapsed = now - start_time
-            avg_rate = bytes_sent / elapsed if elapsed > 0 else 0
-            window_elapsed = now - window_start
-            current_rate = window_bytes / window_elapsed if window_elapsed > 0 else 0
-            eta_str = ""
-            if total_bytes and avg_rate > 0:
-                remaining = total_bytes - bytes_sent
-                eta_secs = remaining / avg_rate
-                eta_str = f" ETA={int(eta_secs)}s"
-            dbg(
-                f"heartbeat {label}: bytes_sent={bytes_sent} ({bytes_sent/(1024*1024):.1f} MiB) "
-                f"current_rate={current_rate/(1024*1024):.1f} MiB/s "
-                f"avg_rate={avg_rate/(1024*1024):.1f} MiB/s{eta_str}"
-            )
-            last_dbg = now
-            window_bytes = 0
-            window_start = now
+    total_bytes = estimate()
+    if total_bytes:
+        size_mib = total_bytes / (1024 * 1024)
+        dbg(f"Resume send estimated size: {total_bytes} bytes ({size_mib:.1f} MiB)")
+        print(f"Resuming interrupted transfer to {recv_fs} (~{size_mib:.0f} MiB remaining). Progress in debug log.")
+    else:
+        dbg("Resume send size estimation unavailable; progress will be indeterminate.")
+        print(f"Resuming interrupted transfer to {recv_fs} (size unknown). Progress in debug log.")
+    return total_bytes, ProgressJournal.begin(
+        recv_fs, _resume_token_snapshot(resume_token) or "", total_bytes, resume_token, peer,
+    )
 
-    try:
-        dst.flush()
-    except Exception:
-        pass
 
-    elapsed = time.time() - start_time
-    avg_rate = bytes_sent / elapsed if elapsed > 0 else 0
-    dbg(
-        f"{label} finished: bytes_sent={bytes_sent} ({format_bytes(bytes_sent)}) "
-        f"elapsed={elapsed:.1f}s avg_rate={avg_rate/(1024*1024):.1f} MiB/s pipe_broken={pipe_broken}"
-    )
-    return bytes_sent, pipe_broken
+def transfer_stream(src, dst, total_bytes, label="Transferring", min_interval=1.0, stall_timeout=3600, journal=None):
+    """Copy a send stream into the receive side with the configured engine:
+    splice() when ZFS_REP_SPLICE is set and usable, otherwise the Python
+    read/write loop. With a journal, progress continues from its position
+    and is checkpointed into it. Follows the bandwidth schedule when one
+    applies to this run. Returns (bytes_sent, pipe_broken); raises
+    StallTimeout."""
+    base = journal.base if journal is not None else 0
+    on_checkpoint = journal.checkpoint if journal is not None else None
+    throttle = _shared_throttle()
+    start = time.time()
+    result = None
+    try:
+        if SPLICE_ENABLED:
+            try:
+                result = stream_with_splice(
+                    src, dst, total_bytes, label=label,
+                    min_interval=min_interval, stall_timeout=stall_timeout,
+                    base_bytes=base, on_checkpoint=on_checkpoint, throttle=throttle,
+                )
+            except _SpliceUnsupported as e:
+                dbg(f"{label}: splice unavailable ({e}); using read/write loop")
+        if result is None:
+            result = stream_with_progress_stall(
+                src, dst, total_bytes, label=label,
+                min_interval=min_interval, stall_timeout=stall_timeout,
+                base_bytes=base, on_checkpoint=on_checkpoint, throttle=throttle,
+            )
+    except StallTimeout:
+        _record_transfer(0, time.time() - start, stalled=True)
+        raise
+    _record_transfer(result[0], time.time() - start)
+    if journal is not None:
+        journal.checkpoint(result[0])
+    return result
 
 
 def get_written_since_snapshot(dataset, snapshot_fullname, remote_user=None, remote_host=None, remote_port="22"):
@@ -1570,6 +2619,112 @@ def safe_destroy_remote(snap_name, remote_user, remote_host, remote_port) -> boo
         return False
 
 
+# Upper bound on snapshots destroyed by one `zfs destroy` call, which keeps
+# progress updates flowing and limits the blast radius of a failed batch.
+ZFS_DESTROY_BATCH_MAX = int(os.environ.get("ZFS_REP_DESTROY_BATCH", "500"))
+
+
+def _held_snapshots(names, remote=None):
+    """Check holds for many snapshots with as few `zfs holds` calls as the argv
+    budget allows. Returns (held, unknown): names with user holds, and names
+    whose hold state could not be determined (their chunk failed)."""
+    held = set()
+    unknown = set()
+    for chunk in _chunk_by_argv_budget(names):
+        try:
+            p = _zfs_run(["zfs", "holds", "-H"] + chunk, remote, timeout=ZFS_LIST_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            dbg(f"holds check timed out for {len(chunk)} snapshot(s)")
+            unknown.update(chunk)
+            continue
+        for line in (p.stdout or "").splitlines():
+            name = line.split("\t", 1)[0].strip()
+            if name:
+                held.add(name)
+        if p.returncode != 0:
+            # A missing snapshot fails the whole call; let the per-snapshot
+            # path sort out which names are affected.
+            dbg(f"holds check rc={p.returncode} for {len(chunk)} snapshot(s): {(p.stderr or '').strip()}")
+            unknown.update(n for n in chunk if n not in held)
+    return held, unknown
+
+
+def _plan_destroy_batches(candidates, kept_order):
+    """Group prune candidates into `zfs destroy` arguments, one dataset each.
+
+    Runs of candidates that are adjacent in the dataset's createtxg order are
+    collapsed into `first%last` ranges; anything else goes into a comma list.
+    A range is only used when no other snapshot of that dataset sits between
+    its endpoints, so it cannot reach snapshots we did not select.
+    *kept_order* maps each dataset to the sorted order keys of its snapshots
+    that are not candidates. Returns a list of (destroy_arg, [Snapshot, ...]).
+    """
+    by_ds = {}
+    for s in candidates:
+        by_ds.setdefault(dataset_of_snapshot(s.name), []).append(s)
+
+    batches = []
+    for ds in sorted(by_ds):
+        kept = kept_order.get(ds, ())
+
+        # Split the candidates into runs with no kept snapshot between them.
+        # A kept snapshot with the same order key (creation-time fallback)
+        # cannot be placed, so such a candidate stands alone.
+        runs = []
+        run = []
+        prev_slot = None
+        for s in sorted(by_ds[ds], key=lambda s: s.order_key):
+            slot = bisect.bisect_left(kept, s.order_key)
+            tied = slot < len(kept) and kept[slot] == s.order_key
+            if run and (tied or slot != prev_slot):
+                runs.append(run)
+                run = []
+            run.append(s)
+            prev_slot = None if tied else slot
+        if run:
+            runs.append(run)
+
+        specs = []  # (spec, snapshots covered)
+        for run in runs:
+            for i in range(0, len(run), ZFS_DESTROY_BATCH_MAX):
+                part = run[i:i + ZFS_DESTROY_BATCH_MAX]
+                if len(part) >= 3:
+                    specs.append((f"{snapshot_suffix(part[0].name)}%{snapshot_suffix(part[-1].name)}", part))
+                else:
+                    specs.extend((snapshot_suffix(s.name), [s]) for s in part)
+
+        prefix_len = len(ds) + 1
+        cur_specs = []
+        cur_snaps = []
+        cur_len = prefix_len
+        for spec, snaps in specs:
+            if cur_specs and (
+                cur_len + len(spec) + 1 > ZFS_ARGV_BUDGET
+                or len(cur_snaps) + len(snaps) > ZFS_DESTROY_BATCH_MAX
+            ):
+                batches.append((f"{ds}@{','.join(cur_specs)}", cur_snaps))
+                cur_specs, cur_snaps, cur_len = [], [], prefix_len
+            cur_specs.append(spec)
+            cur_snaps.extend(snaps)
+            cur_len += len(spec) + 1
+        if cur_specs:
+            batches.append((f"{ds}@{','.join(cur_specs)}", cur_snaps))
+    return batches
+
+
+def _destroy_snapshot_batch(destroy_arg, count, remote=None):
+    """Destroy several snapshots in one call. ZFS destroys the whole list in a
+    single sync task, so a failure means nothing was removed. Returns (ok, err)."""
+    where = "remote " if remote else ""
+    try:
+        p = _zfs_run(["zfs", "destroy", destroy_arg], remote, timeout=ZFS_DESTROY_TIMEOUT + count)
+    except subprocess.TimeoutExpired:
+        return False, f"{where}zfs destroy timed out for a batch of {count} snapshot(s)"
+    if p.returncode != 0:
+        return False, f"{where}zfs destroy failed for a batch of {count} snapshot(s): {(p.stderr or p.stdout or '').strip()}"
+    return True, ""
+
+
 def prune_snapshots_by_retention(
     filesystem,
     task_name,
@@ -1585,22 +2740,6 @@ def prune_snapshots_by_retention(
     tier_idx=None,
     custom_name="",
 ):
-    if remote_host:
-        snapshots = get_remote_snapshots(remote_user, remote_host, remote_port, filesystem)
-        if snapshots is None:
-            msg = f"Remote dataset {filesystem} does not exist. Nothing to prune."
-            final_pct = min(100, int(progress_base) + int(progress_span))
-            notifier.notify(f"STATUS={msg} {final_pct}% complete")
-            return final_pct
-    else:
-        snapshots = get_local_snapshots(filesystem)
-
-    if snapshots is None:
-        msg = f"{'Remote ' if remote_host else ''}dataset {filesystem} does not exist. Nothing to prune."
-        final_pct = min(100, int(progress_base) + int(progress_span))
-        notifier.notify(f"STATUS={msg} {final_pct}% complete")
-        return final_pct
-
     now = datetime.datetime.now()
 
     unit_multipliers = {
@@ -1630,35 +2769,52 @@ def prune_snapshots_by_retention(
         return final_pct
 
     retention_milliseconds = retention_val * unit_multipliers[retention_unit]
-    snapshots_to_delete = []
-
     excluded_suffix = excluded_snapshot_name.split("@", 1)[-1] if excluded_snapshot_name else None
 
-    for snapshot in snapshots:
+    def _selected(snapshot):
         # Primary: check ZFS property tag (most reliable, works with any naming scheme)
-        belongs = (hasattr(snapshot, 'task_tag') and snapshot.task_tag == task_name)
+        belongs = snapshot.task_tag == task_name
 
         # Fallback: name-based matching, but ONLY for untagged snapshots.
         # If a snapshot is tagged for a different task, never claim it.
-        if not belongs and not getattr(snapshot, 'task_tag', None):
+        if not belongs and not snapshot.task_tag:
             belongs = is_task_snapshot(snapshot.name, task_name, custom_name=custom_name)
 
         if not belongs:
-            continue
+            return False
 
         # Tier filtering via ZFS property
         if tier_idx is not None:
-            snap_tier = getattr(snapshot, 'tier_tag', None)
+            snap_tier = snapshot.tier_tag
             if snap_tier is not None and snap_tier != f"t{tier_idx}":
-                continue  # belongs to a different tier
+                return False  # belongs to a different tier
 
-        snap_suffix = snapshot_suffix(snapshot.name)
-        if excluded_suffix and snap_suffix == excluded_suffix:
-            continue
+        if excluded_suffix and snapshot_suffix(snapshot.name) == excluded_suffix:
+            return False
 
         age_milliseconds = (now - snapshot.creation).total_seconds() * 1000
-        if age_milliseconds > retention_milliseconds:
+        return age_milliseconds > retention_milliseconds
+
+    # Stream the listing: keep the candidates and, for everything else, only
+    # its order key (needed to plan destroy ranges that skip it).
+    snapshots_to_delete = []
+    kept_order = {}
+    scan = SnapshotScan(filesystem, remote_user, remote_host, remote_port)
+    for snapshot in scan:
+        if _selected(snapshot):
             snapshots_to_delete.append(snapshot)
+        else:
+            ds = dataset_of_snapshot(snapshot.name)
+            kept = kept_order.get(ds)
+            if kept is None:
+                kept = kept_order[ds] = array.array("q")
+            kept.append(snapshot.order_key)
+
+    if not scan.exists:
+        msg = f"{'Remote ' if remote_host else ''}dataset {filesystem} does not exist. Nothing to prune."
+        final_pct = min(100, int(progress_base) + int(progress_span))
+        notifier.notify(f"STATUS={msg} {final_pct}% complete")
+        return final_pct
 
     start = max(0, min(100, int(progress_base)))
     span = max(0, min(100 - start, int(progress_span)))
@@ -1674,22 +2830,56 @@ def prune_snapshots_by_retention(
     notifier.notify(f"STATUS=Pruning {total} {prefix}snapshot(s)… {start}% complete")
     dbg(f"prune: {total} candidates to destroy (remote={bool(remote_host)})")
 
+    remote = (remote_user, remote_host, remote_port) if remote_host else None
+    held, unknown = _held_snapshots([s.name for s in snapshots_to_delete], remote)
+    batchable = [s for s in snapshots_to_delete if s.name not in held and s.name not in unknown]
+    singles = [s for s in snapshots_to_delete if s.name in held or s.name in unknown]
+    # Held or unchecked snapshots are destroyed one by one; a range must not
+    # span them either.
+    for s in singles:
+        kept_order.setdefault(dataset_of_snapshot(s.name), array.array("q")).append(s.order_key)
+    for ds, kept in kept_order.items():
+        kept_order[ds] = array.array("q", sorted(kept))
+    batches = _plan_destroy_batches(batchable, kept_order)
+    dbg(f"prune: {len(batchable)} in {len(batches)} destroy batch(es), {len(held)} held, {len(unknown)} unknown")
+
+    def _destroy_one(snapshot):
+        dbg(f"prune: destroying {snapshot.name}")
+        if remote_host:
+            return safe_destroy_remote(snapshot.name, remote_user, remote_host, remote_port)
+        return safe_destroy_local(snapshot.name)
+
     pruned = 0
     skipped = 0
-    for idx, snapshot in enumerate(snapshots_to_delete, start=1):
-        dbg(f"prune: destroying {snapshot.name} ({idx}/{total})")
-        if remote_host:
-            ok = safe_destroy_remote(snapshot.name, remote_user, remote_host, remote_port)
+    done = 0
+    for destroy_arg, batch_snaps in batches:
+        dbg(f"prune: destroying batch of {len(batch_snaps)}: {destroy_arg}")
+        ok, err = _destroy_snapshot_batch(destroy_arg, len(batch_snaps), remote)
+        if ok:
+            for snapshot in batch_snaps:
+                print(f"Deleted snapshot: {snapshot.name}")
+            pruned += len(batch_snaps)
         else:
-            ok = safe_destroy_local(snapshot.name)
+            # Nothing was destroyed; retry one by one to get per-snapshot outcomes.
+            dbg(f"prune: {err} — falling back to per-snapshot destroy")
+            for snapshot in batch_snaps:
+                if _destroy_one(snapshot):
+                    pruned += 1
+                    print(f"Deleted snapshot: {snapshot.name}")
+                else:
+                    skipped += 1
+        done += len(batch_snaps)
+        pct = start + int(done * span / total)
+        notifier.notify(f"STATUS=Pruning {total} {prefix}snapshot(s)… {pct}% complete")
 
-        if ok:
+    for snapshot in singles:
+        if _destroy_one(snapshot):
             pruned += 1
             print(f"Deleted snapshot: {snapshot.name}")
         else:
             skipped += 1
-
-        pct = start + int(idx * span / total)
+        done += 1
+        pct = start + int(done * span / total)
         notifier.notify(f"STATUS=Pruning {total} {prefix}snapshot(s)… {pct}% complete")
 
     msg = f"Pruned {pruned} snapshots older than retention period ({retention_val} {retention_unit})."
@@ -1701,6 +2891,7 @@ def prune_snapshots_by_retention(
     return final_pct
 
 
+@_cancels_estimates
 def send_snapshot_push(
     sendName,
     recvName,
@@ -1717,6 +2908,7 @@ def send_snapshot_push(
     recursive=False,
     recvDataPort=None,
     include_intermediates=None,
+    send_props=False,
 ):
     notifier.notify("STATUS=Preparing ZFS send/recv pipeline…")
 
@@ -1727,6 +2919,7 @@ def send_snapshot_push(
         compressed=compressed,
         raw=raw,
         include_intermediates=include_intermediates,
+        props=send_props,
     )
 
     if sendName2:
@@ -1734,9 +2927,14 @@ def send_snapshot_push(
     else:
         print(f"sending {sendName} to {recvName}")
 
-    total_bytes = estimate_send_size(send_cmd)
-    if total_bytes is None:
-        print("Note: Could not estimate send size; progress will be indeterminate.")
+    journal = ProgressJournal.begin(recvName, sendName, 0, peer=recvHost or "")
+    size = SizeEstimate(
+        lambda on_start: estimate_send_size(send_cmd, on_start),
+        on_ready=journal.set_total if journal is not None else None,
+    )
+    codec = None
+    if transferMethod != "local" and recvHost:
+        codec = wire_codec(compressed, raw, (recvHostUser, recvHost, recvSshPort))
 
     process_send = subprocess.Popen(send_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     dbg(f"PIPE send pid={process_send.pid} cmd={_fmt_cmd(send_cmd)}")
@@ -1758,9 +2956,9 @@ def send_snapshot_push(
             raise RuntimeError("Failed to initialize send/recv pipes.")
 
         try:
-            _, pipe_broken = stream_with_progress_stall(
-                process_send.stdout, process_recv.stdin, total_bytes,
-                label="Transferring", stall_timeout=TRANSFER_STALL_TIMEOUT,
+            _, pipe_broken = transfer_stream(
+                process_send.stdout, process_recv.stdin, size,
+                label="Transferring", journal=journal, stall_timeout=TRANSFER_STALL_TIMEOUT,
             )
         except StallTimeout as e:
             _kill_procs(process_send, process_recv)
@@ -1844,9 +3042,9 @@ def send_snapshot_push(
             # Use a custom approach: pipe process_send through pv+mbuffer,
             # then ssh recv reads from mbuffer stdout.
 
-            pv_cmd = ["pv", "-f", "-b", "-r", "-t"]
-            if total_bytes:
-                pv_cmd.extend(["-s", str(total_bytes)])
+            pv_cmd = ["pv", "-f", "-b", "-r", "-t"] + _rate_limit_args("pv")
+            if size.value:
+                pv_cmd.extend(["-s", str(size.value)])
 
             process_pv = subprocess.Popen(
                 pv_cmd,
@@ -1866,11 +3064,14 @@ def send_snapshot_push(
             process_pv.stdout.close()
 
             process_remote_recv = ssh_popen_args(
-                recvHostUser, recvHost, recvSshPort, flags,
+                recvHostUser, recvHost, recvSshPort,
+                codec.feeding(flags, decompress=True) if codec else flags,
                 stdin=process_m_buff.stdout,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 universal_newlines=False,
+                mux=False,
+                codec=codec,
             )
             process_m_buff.stdout.close()
 
@@ -1882,7 +3083,7 @@ def send_snapshot_push(
             # Monitor pv in a thread (with stall tracking)
             pv_thread = threading.Thread(
                 target=_pv_monitor_thread,
-                args=(process_pv.stderr, total_bytes, "Transferring", notifier, last_activity),
+                args=(process_pv.stderr, size, "Transferring", notifier, last_activity),
                 daemon=True,
             )
             pv_thread.start()
@@ -1972,11 +3173,13 @@ def send_snapshot_push(
             recvHostUser,
             recvHost,
             recvSshPort,
-            flags,
+            codec.feeding(flags, decompress=True) if codec else flags,
             stdin=process_m_buff.stdout,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             universal_newlines=False,
+            mux=False,
+            codec=codec,
         )
         # Close parent's copy so SIGPIPE propagates if recv dies
         process_m_buff.stdout.close()
@@ -1987,9 +3190,9 @@ def send_snapshot_push(
             raise RuntimeError("Failed to initialize send/mbuffer pipes.")
 
         try:
-            _, pipe_broken = stream_with_progress_stall(
-                process_send.stdout, process_m_buff.stdin, total_bytes,
-                label="Transferring", stall_timeout=TRANSFER_STALL_TIMEOUT,
+            _, pipe_broken = transfer_stream(
+                process_send.stdout, process_m_buff.stdin, size,
+                label="Transferring", journal=journal, stall_timeout=TRANSFER_STALL_TIMEOUT,
             )
         except StallTimeout as e:
             _kill_procs(process_send, process_m_buff, process_remote_recv)
@@ -2067,7 +3270,8 @@ def send_snapshot_push(
 
         recv_q = shlex.quote(recvName)
         nc_listen = build_nc_listen_cmd(data_port, recvHostUser, recvHost, ssh_port, bind_address=NC_BIND_ADDRESS)
-        listen_cmd = f"{nc_listen} | zfs recv -s {'-F ' if forceOverwrite else ''}{recv_q}"
+        decompress = f"{codec.shell(decompress=True)} | " if codec else ""
+        listen_cmd = f"{nc_listen} | {decompress}zfs recv -s {'-F ' if forceOverwrite else ''}{recv_q}"
         ssh_cmd_listener = ssh_base_args(recvHostUser, recvHost, ssh_port)
         ssh_cmd_listener.append(listen_cmd)
 
@@ -2083,6 +3287,8 @@ def send_snapshot_push(
 
         mbuffer_cmd = _build_mbuffer_cmd(mBufferSize, mBufferUnit)
         nc_cmd = _build_nc_connect_cmd(recvHost, data_port, recv_only=False)
+        if codec:
+            nc_cmd = codec.feeding(nc_cmd)
 
         process_mbuffer = subprocess.Popen(
             mbuffer_cmd,
@@ -2104,9 +3310,9 @@ def send_snapshot_push(
             raise RuntimeError("Failed to initialize send/mbuffer pipes.")
 
         try:
-            _, pipe_broken = stream_with_progress_stall(
-                process_send.stdout, process_mbuffer.stdin, total_bytes,
-                label="Transferring", stall_timeout=TRANSFER_STALL_TIMEOUT,
+            _, pipe_broken = transfer_stream(
+                process_send.stdout, process_mbuffer.stdin, size,
+                label="Transferring", journal=journal, stall_timeout=TRANSFER_STALL_TIMEOUT,
             )
         except StallTimeout as e:
             _kill_procs(process_send, process_mbuffer, process_nc, ssh_process_listener)
@@ -2202,6 +3408,7 @@ def send_snapshot_push(
     print("ERROR: Invalid transferMethod specified. Must be 'local', 'ssh', or 'netcat'.")
     sys.exit(1)
 
+@_cancels_estimates
 def send_snapshot_pull(
     remoteSnapName,
     localRecvFs,
@@ -2218,6 +3425,7 @@ def send_snapshot_pull(
     transferMethod="ssh",
     recvDataPort=None,
     include_intermediates=None,
+    send_props=False,
 ):
     notifier.notify("STATUS=Preparing ZFS pull pipeline…")
 
@@ -2231,11 +3439,15 @@ def send_snapshot_pull(
         compressed=compressed,
         raw=raw,
         include_intermediates=include_intermediates,
+        props=send_props,
     )
 
-    total_bytes = estimate_send_size_remote(remoteUser, remoteHost, remoteSshPort, remote_send_args)
-    if total_bytes is None:
-        print("Note: Could not estimate send size; progress will be indeterminate.")
+    journal = ProgressJournal.begin(localRecvFs, remoteSnapName, 0, peer=remoteHost)
+    size = SizeEstimate(
+        lambda on_start: estimate_send_size_remote(remoteUser, remoteHost, remoteSshPort, remote_send_args, on_start),
+        on_ready=journal.set_total if journal is not None else None,
+    )
+    codec = wire_codec(compressed, raw, (remoteUser, remoteHost, remoteSshPort))
 
     if remoteBaseSnapName:
         print(f"pulling incrementally from {remoteBaseSnapName} -> {remoteSnapName} into {localRecvFs}")
@@ -2251,7 +3463,8 @@ def send_snapshot_pull(
         # Build the remote command: zfs send | nc -l <port>
         remote_send_str = " ".join(shlex.quote(str(a)) for a in remote_send_args)
         nc_listen = build_nc_listen_cmd(data_port, remoteUser, remoteHost, ssh_port, bind_address=NC_BIND_ADDRESS, send_only=True)
-        remote_cmd = f"{remote_send_str} | {nc_listen}"
+        compress = f"{codec.shell()} | " if codec else ""
+        remote_cmd = f"{remote_send_str} | {compress}{nc_listen}"
         ssh_cmd_sender = ssh_base_args(remoteUser, remoteHost, ssh_port)
         ssh_cmd_sender.append(remote_cmd)
 
@@ -2278,9 +3491,9 @@ def send_snapshot_pull(
         process_pv = None
         pv_source = process_nc.stdout
         if _has_pv():
-            pv_cmd = ["pv", "-f", "-b", "-r", "-t"]
-            if total_bytes:
-                pv_cmd.extend(["-s", str(total_bytes)])
+            pv_cmd = ["pv", "-f", "-b", "-r", "-t"] + _rate_limit_args("pv")
+            if size.value:
+                pv_cmd.extend(["-s", str(size.value)])
             process_pv = subprocess.Popen(
                 pv_cmd,
                 stdin=process_nc.stdout,
@@ -2291,6 +3504,8 @@ def send_snapshot_pull(
             pv_source = process_pv.stdout
 
         mbuffer_cmd = _build_mbuffer_cmd(mBufferSize, mBufferUnit)
+        if not process_pv:
+            mbuffer_cmd += _rate_limit_args("mbuffer")
         process_mbuffer = subprocess.Popen(
             mbuffer_cmd,
             stdin=pv_source,
@@ -2309,7 +3524,7 @@ def send_snapshot_pull(
         if process_pv:
             pv_thread = threading.Thread(
                 target=_pv_monitor_thread,
-                args=(process_pv.stderr, total_bytes, "Transferring", notifier, last_activity),
+                args=(process_pv.stderr, size, "Transferring", notifier, last_activity),
                 daemon=True,
             )
             pv_thread.start()
@@ -2318,6 +3533,8 @@ def send_snapshot_pull(
         if forceOverwrite:
             recv_cmd.append("-F")
         recv_cmd.append(localRecvFs)
+        if codec:
+            recv_cmd = codec.feeding(recv_cmd, decompress=True)
 
         process_local_recv = subprocess.Popen(
             recv_cmd,
@@ -2404,11 +3621,12 @@ def send_snapshot_pull(
         remoteUser,
         remoteHost,
         remoteSshPort,
-        remote_send_args,
+        codec.fed_by(remote_send_args) if codec else remote_send_args,
         stdin=None,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         universal_newlines=False,
+        mux=False,
     )
 
     # --- Direct-pipe path: SSH stdout -> pv -> mbuffer -> zfs recv (no Python copy) ---
@@ -2419,9 +3637,11 @@ def send_snapshot_pull(
         if forceOverwrite:
             recv_cmd.append("-F")
         recv_cmd.append(localRecvFs)
+        if codec:
+            recv_cmd = codec.feeding(recv_cmd, decompress=True)
 
         ok, err_msg = _direct_pipe_transfer(
-            process_remote_send, m_buff_cmd, recv_cmd, total_bytes,
+            process_remote_send, m_buff_cmd, recv_cmd, size,
             label="Transferring",
         )
         if not ok:
@@ -2444,6 +3664,8 @@ def send_snapshot_pull(
     if forceOverwrite:
         recv_cmd.append("-F")
     recv_cmd.append(localRecvFs)
+    if codec:
+        recv_cmd = codec.feeding(recv_cmd, decompress=True)
 
     process_local_recv = subprocess.Popen(
         recv_cmd,
@@ -2458,9 +3680,9 @@ def send_snapshot_pull(
         raise RuntimeError("Failed to initialize send/mbuffer pipes.")
 
     try:
-        _, pipe_broken = stream_with_progress_stall(
-            process_remote_send.stdout, process_m_buff.stdin, total_bytes,
-            label="Transferring", stall_timeout=TRANSFER_STALL_TIMEOUT,
+        _, pipe_broken = transfer_stream(
+            process_remote_send.stdout, process_m_buff.stdin, size,
+            label="Transferring", journal=journal, stall_timeout=TRANSFER_STALL_TIMEOUT,
         )
     except StallTimeout as e:
         _kill_procs(process_remote_send, process_m_buff, process_local_recv)
@@ -2608,15 +3830,10 @@ def resume_receive_push(
 
     send_cmd = ["zfs", "send", "-t", resume_token]
 
-    # Estimate resume send size for progress reporting
-    total_bytes = estimate_send_size(send_cmd)
-    if total_bytes:
-        size_mib = total_bytes / (1024 * 1024)
-        dbg(f"Resume send estimated size: {total_bytes} bytes ({size_mib:.1f} MiB)")
-        print(f"Resuming interrupted transfer to {recvName} (~{size_mib:.0f} MiB remaining). Progress in debug log.")
-    else:
-        dbg("Resume send size estimation unavailable; progress will be indeterminate.")
-        print(f"Resuming interrupted transfer to {recvName} (size unknown). Progress in debug log.")
+    # Overall size/position from the progress journal, else estimate the remainder
+    total_bytes, journal = _resume_progress(
+        recvName, resume_token, lambda: estimate_send_size(send_cmd), peer=recvHost or "",
+    )
 
     process_send = subprocess.Popen(send_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
@@ -2636,9 +3853,9 @@ def resume_receive_push(
             raise RuntimeError("Failed to initialize resume send/recv pipes.")
 
         try:
-            _, pipe_broken = stream_with_progress_stall(
+            _, pipe_broken = transfer_stream(
                 process_send.stdout, process_recv.stdin, total_bytes,
-                label="Resuming", stall_timeout=stall_timeout,
+                label="Resuming", journal=journal, stall_timeout=stall_timeout,
             )
         except StallTimeout as e:
             notifier.notify(f"STATUS=Resume stalled: {e}")
@@ -2724,9 +3941,9 @@ def resume_receive_push(
             raise RuntimeError("Failed to initialize resume netcat pipes.")
 
         try:
-            _, pipe_broken = stream_with_progress_stall(
+            _, pipe_broken = transfer_stream(
                 process_send.stdout, process_mbuffer.stdin, total_bytes,
-                label="Resuming (netcat)", stall_timeout=stall_timeout,
+                label="Resuming (netcat)", journal=journal, stall_timeout=stall_timeout,
             )
         except StallTimeout as e:
             notifier.notify(f"STATUS=Resume stalled: {e}")
@@ -2804,6 +4021,7 @@ def resume_receive_push(
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         universal_newlines=False,
+        mux=False,
     )
     # Close parent's copy so SIGPIPE propagates if recv dies
     process_m_buff.stdout.close()
@@ -2812,9 +4030,9 @@ def resume_receive_push(
         raise RuntimeError("Failed to initialize resume SSH pipes.")
 
     try:
-        _, pipe_broken = stream_with_progress_stall(
+        _, pipe_broken = transfer_stream(
             process_send.stdout, process_m_buff.stdin, total_bytes,
-            label="Resuming", stall_timeout=stall_timeout,
+            label="Resuming", journal=journal, stall_timeout=stall_timeout,
         )
     except StallTimeout as e:
         notifier.notify(f"STATUS=Resume stalled: {e}")
@@ -2881,16 +4099,13 @@ def resume_receive_pull(
     if not remoteHost:
         raise RuntimeError("Pull replication requires a remote host.")
 
-    # Estimate resume send size for progress reporting
+    # Overall size/position from the progress journal, else estimate the remainder
     send_cmd = ["zfs", "send", "-t", resume_token]
-    total_bytes = estimate_send_size_remote(remoteUser, remoteHost, remoteSshPort, send_cmd)
-    if total_bytes:
-        size_mib = total_bytes / (1024 * 1024)
-        dbg(f"Resume pull send estimated size: {total_bytes} bytes ({size_mib:.1f} MiB)")
-        print(f"Resuming interrupted transfer to {localRecvFs} (~{size_mib:.0f} MiB remaining). Progress in debug log.")
-    else:
-        dbg("Resume pull send size estimation unavailable; progress will be indeterminate.")
-        print(f"Resuming interrupted transfer to {localRecvFs} (size unknown). Progress in debug log.")
+    total_bytes, journal = _resume_progress(
+        localRecvFs, resume_token,
+        lambda: estimate_send_size_remote(remoteUser, remoteHost, remoteSshPort, send_cmd),
+        peer=remoteHost,
+    )
 
     if transferMethod == "netcat":
         data_port = str(recvDataPort or remoteSshPort or "31337")
@@ -2927,7 +4142,7 @@ def resume_receive_pull(
         process_pv = None
         pv_source = process_nc.stdout
         if _has_pv():
-            pv_cmd = ["pv", "-f", "-b", "-r", "-t"]
+            pv_cmd = ["pv", "-f", "-b", "-r", "-t"] + _rate_limit_args("pv")
             if total_bytes:
                 pv_cmd.extend(["-s", str(total_bytes)])
             process_pv = subprocess.Popen(
@@ -2940,6 +4155,8 @@ def resume_receive_pull(
             pv_source = process_pv.stdout
 
         mbuffer_cmd = _build_mbuffer_cmd(mBufferSize, mBufferUnit)
+        if not process_pv:
+            mbuffer_cmd += _rate_limit_args("mbuffer")
         process_mbuffer = subprocess.Popen(
             mbuffer_cmd,
             stdin=pv_source,
@@ -3058,6 +4275,7 @@ def resume_receive_pull(
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         universal_newlines=False,
+        mux=False,
     )
 
     m_buff_cmd = _build_mbuffer_cmd(mBufferSize, mBufferUnit)
@@ -3084,9 +4302,9 @@ def resume_receive_pull(
         raise RuntimeError("Failed to initialize resume pull pipes.")
 
     try:
-        _, pipe_broken = stream_with_progress_stall(
+        _, pipe_broken = transfer_stream(
             process_remote_send.stdout, process_m_buff.stdin, total_bytes,
-            label="Resuming (pull)", stall_timeout=stall_timeout,
+            label="Resuming (pull)", journal=journal, stall_timeout=stall_timeout,
         )
     except StallTimeout as e:
         notifier.notify(f"STATUS=Resume stalled: {e}")
@@ -3146,20 +4364,346 @@ def snapshot_exists_on_destination(
     remote_port="22",
 ):
     target_name = f"{dest_filesystem}@{snapshot_suffix_name}"
-    if remote_host:
-        dest_snaps = get_remote_snapshots(remote_user, remote_host, remote_port, dest_filesystem)
-    else:
-        dest_snaps = get_local_snapshots(dest_filesystem)
-
-    if dest_snaps is None:
-        return False, target_name
-
-    for snap in dest_snaps:
+    for snap in SnapshotScan(dest_filesystem, remote_user, remote_host, remote_port):
         if snap.name == target_name:
             return True, target_name
 
     return False, target_name
 
+# --- Parallel per-child replication ------------------------------------------
+
+# Set ZFS_REP_PARALLEL_CHILDREN=N (N >= 2) to replicate a recursive task as
+# one incremental stream per dataset, N at a time, instead of a single
+# `zfs send -R`. Every stream still sends the one recursive snapshot that
+# was just taken, so the destination ends up at the same consistent point.
+# Netcat uses a single data port and always keeps the -R stream.
+PARALLEL_CHILDREN = int(os.environ.get("ZFS_REP_PARALLEL_CHILDREN", "0") or 0)
+PARALLEL_STATUS_INTERVAL = 5.0
+
+
+class ChildSend:
+    """One dataset of a recursive task, planned as its own send/recv."""
+
+    __slots__ = ("src_ds", "dst_ds", "snap", "base", "force", "token", "size", "after")
+
+    def __init__(self, src_ds, dst_ds, snap, base="", force=False, token="", size=0, after=None):
+        self.src_ds = src_ds
+        self.dst_ds = dst_ds
+        self.snap = snap
+        self.base = base
+        self.force = force
+        self.token = token
+        self.size = size
+        self.after = after  # ChildSend that must finish first (parent is created by it)
+
+
+def _list_datasets(filesystem, props, remote=None):
+    """`zfs list -r -t filesystem,volume` of *filesystem* as {name: [values]}.
+    Returns None if the dataset does not exist."""
+    cmd = ["zfs", "list", "-H", "-p", "-r", "-t", "filesystem,volume", "-o", f"name,{props}", filesystem]
+    p = _zfs_run(cmd, remote, timeout=ZFS_LIST_TIMEOUT)
+    if p.returncode != 0:
+        err = (p.stderr or "").lower()
+        if "does not exist" in err or "dataset does not exist" in err:
+            return None
+        raise RuntimeError(f"Failed to list datasets under {filesystem}: {(p.stderr or '').strip()}")
+    out = {}
+    for line in (p.stdout or "").splitlines():
+        parts = line.split("\t")
+        if parts and parts[0]:
+            out[parts[0]] = parts[1:]
+    return out
+
+
+def plan_child_sends(source_fs, dest_fs, new_snap, source_snaps, dest_snaps,
+                     src_datasets, dst_datasets, *, allow_overwrite=False, root_force=False):
+    """Work out base snapshot and receive flags for every source dataset.
+
+    Mirrors the root-dataset planning in main() per child: most recent common
+    snapshot by guid, -F only when Allow Overwrite permits it. Returns
+    (plans, errors); plans are ordered parents first."""
+    suffix = snapshot_suffix(new_snap)
+    src_by_ds = {}
+    for s in source_snaps or []:
+        src_by_ds.setdefault(dataset_of_snapshot(s.name), []).append(s)
+    dst_by_ds = {}
+    for d in dest_snaps or []:
+        dst_by_ds.setdefault(dataset_of_snapshot(d.name), []).append(d)
+
+    plans = []
+    by_src = {}
+    errors = []
+    for ds in sorted(src_datasets, key=lambda n: (n.count("/"), n)):
+        if ds != source_fs and not ds.startswith(source_fs + "/"):
+            continue
+        dst = dest_fs + ds[len(source_fs):]
+        try:
+            size = int((src_datasets[ds] or ["0"])[0])
+        except (ValueError, IndexError):
+            size = 0
+        plan = ChildSend(ds, dst, f"{ds}@{suffix}", size=size, force=root_force and ds == source_fs)
+
+        dst_info = dst_datasets.get(dst) if dst_datasets else None
+        if dst_info is not None:
+            token = (dst_info[0] if dst_info else "").strip()
+            plan.token = "" if token in ("", "-") else token
+
+        if dst_info is None:
+            # New on the destination: full receive once its parent exists.
+            parent = by_src.get(ds.rsplit("/", 1)[0]) if ds != source_fs else None
+            if parent is not None and not parent.base:
+                plan.after = parent
+        else:
+            src_list = src_by_ds.get(ds, [])
+            dst_list = sorted(dst_by_ds.get(dst, []), key=lambda s: s.creation_epoch)
+            src_guids = {s.guid: s.name for s in src_list}
+            common = [d for d in dst_list if d.guid in src_guids]
+            if not dst_list:
+                if not allow_overwrite:
+                    errors.append(f"{dst} exists with no snapshots; Allow Overwrite is required for a full receive.")
+                    continue
+                plan.force = True
+            elif not common:
+                if not allow_overwrite:
+                    errors.append(f"{dst} has no snapshot in common with {ds}; Allow Overwrite is required.")
+                    continue
+                plan.force = True
+            else:
+                last_common = max(common, key=lambda s: s.creation_epoch)
+                plan.base = src_guids[last_common.guid]
+                ahead = any(d.guid not in src_guids for d in dst_list if d.creation_epoch > last_common.creation_epoch)
+                if ahead:
+                    if not allow_overwrite:
+                        errors.append(f"{dst} has snapshots newer than {plan.base}; Allow Overwrite is required.")
+                        continue
+                    plan.force = True
+
+        plans.append(plan)
+        by_src[ds] = plan
+    return plans, errors
+
+
+class _ParallelStatusGate:
+    """Notifier stand-in used while child sends run: worker threads keep
+    their STATUS= updates to themselves, the coordinator reports aggregate
+    progress, everything else passes through."""
+
+    def __init__(self, inner):
+        self._inner = inner
+
+    def notify(self, msg):
+        if msg.startswith("STATUS=") and threading.current_thread() is not threading.main_thread():
+            return
+        self._inner.notify(msg)
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+def run_child_sends(plans, send_one, workers):
+    """Run *send_one(plan)* for every plan on a pool of *workers* threads.
+
+    A plan waits for its `after` plan; if that one fails it is skipped.
+    Larger datasets start first so the wall time approaches the largest
+    child rather than the sum. Returns {src_ds: error} for failed plans."""
+    import concurrent.futures
+
+    global notifier
+    outer = notifier
+    notifier = _ParallelStatusGate(outer)
+
+    pending = sorted(plans, key=lambda pl: pl.size, reverse=True)
+    running = {}
+    done = set()
+    failed = {}
+    total = len(plans)
+    last_status = 0.0
+
+    def _guarded(plan):
+        try:
+            send_one(plan)
+            return None
+        except SystemExit as e:
+            return f"send/receive exited with status {e.code}"
+        except Exception as e:
+            dbg(f"parallel child {plan.src_ds} failed:\n{traceback.format_exc()}")
+            return str(e) or e.__class__.__name__
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            while pending or running:
+                for plan in list(pending):
+                    if len(running) >= workers:
+                        break
+                    if plan.after is not None:
+                        if plan.after.src_ds in failed:
+                            failed[plan.src_ds] = f"parent {plan.after.src_ds} failed"
+                            pending.remove(plan)
+                            continue
+                        if plan.after.src_ds not in done:
+                            continue
+                    pending.remove(plan)
+                    dbg(f"parallel child start: {plan.snap} base={plan.base or '-'} -> {plan.dst_ds} force={plan.force}")
+                    running[pool.submit(_guarded, plan)] = plan
+
+                if not running:
+                    continue
+                finished, _ = concurrent.futures.wait(
+                    running, timeout=PARALLEL_STATUS_INTERVAL,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                for fut in finished:
+                    plan = running.pop(fut)
+                    err = fut.result()
+                    if err:
+                        failed[plan.src_ds] = err
+                        safe_print(f"ERROR: replication of {plan.src_ds} failed: {err}")
+                    else:
+                        done.add(plan.src_ds)
+                    dbg(f"parallel child done: {plan.src_ds} ok={not err}")
+
+                now = time.time()
+                if finished or (now - last_status) >= PARALLEL_STATUS_INTERVAL:
+                    pct = (len(done) + len(failed)) * 100.0 / total if total else 100.0
+                    outer.notify(
+                        f"STATUS=Transferring… {pct:.1f}% complete "
+                        f"({len(done)}/{total} datasets, {len(running)} in flight)"
+                    )
+                    last_status = now
+    finally:
+        notifier = outer
+    return failed
+
+
+def replicate_children_parallel(
+    source_fs, dest_fs, new_snap, source_snaps, dest_snaps, *,
+    direction, workers, allow_overwrite, root_force, compressed, raw,
+    include_intermediates, remote_user, remote_host, ssh_port, transfer_method,
+    mbuffer_size, mbuffer_unit, data_port, stall_timeout,
+):
+    """Replicate a recursive task as per-dataset sends on a worker pool.
+    Exits non-zero if planning fails or any dataset fails."""
+    global _bw_streams
+    remote = (remote_user, remote_host, ssh_port) if remote_host else None
+    src_remote = remote if direction == "pull" else None
+    dst_remote = remote if direction == "push" and transfer_method != "local" else None
+
+    notifier.notify("STATUS=Planning per-dataset transfers…")
+    src_datasets = _list_datasets(source_fs, "referenced", src_remote) or {}
+    dst_datasets = _list_datasets(dest_fs, "receive_resume_token", dst_remote) or {}
+
+    plans, errors = plan_child_sends(
+        source_fs, dest_fs, new_snap, source_snaps, dest_snaps,
+        src_datasets, dst_datasets,
+        allow_overwrite=allow_overwrite, root_force=root_force,
+    )
+    if errors:
+        for err in errors:
+            print(err)
+        notifier.notify(f"STATUS=Refusing parallel replication: {errors[0]}")
+        sys.exit(2)
+
+    inc = True if include_intermediates is None else include_intermediates
+    print(f"Replicating {len(plans)} dataset(s) with {workers} parallel stream(s)…")
+    dbg(f"parallel replication: datasets={len(plans)} workers={workers} direction={direction}")
+
+    def send_one(plan):
+        if plan.token:
+            # A previous run left a partial receive on this child; finish or abort it first.
+            if direction == "pull":
+                ok, err = resume_receive_pull(
+                    plan.token, plan.dst_ds, remoteHost=remote_host, remoteSshPort=ssh_port,
+                    remoteUser=remote_user, mBufferSize=mbuffer_size, mBufferUnit=mbuffer_unit,
+                    forceOverwrite=plan.force, stall_timeout=stall_timeout,
+                    transferMethod=transfer_method, recvDataPort=data_port,
+                )
+                if not ok:
+                    clear_receive_resume_token(plan.dst_ds)
+            else:
+                ok, err = resume_receive_push(
+                    plan.token, plan.dst_ds, recvHost=remote_host or "", recvSshPort=ssh_port,
+                    recvHostUser=remote_user, mBufferSize=mbuffer_size, mBufferUnit=mbuffer_unit,
+                    transferMethod=transfer_method, recvDataPort=data_port,
+                    forceOverwrite=plan.force, stall_timeout=stall_timeout,
+                )
+                if not ok:
+                    clear_receive_resume_token(
+                        plan.dst_ds,
+                        remote_user=remote_user if remote_host else None,
+                        remote_host=remote_host or None,
+                        remote_port=ssh_port,
+                    )
+            if ok:
+                # The destination now holds the resumed snapshot, which is
+                # newer than the planned base: send on from it instead.
+                resumed = _resume_token_snapshot(plan.token)
+                if not resumed:
+                    scan = SnapshotScan(plan.dst_ds, *dst_remote) if dst_remote else SnapshotScan(plan.dst_ds)
+                    newest = max(scan, key=lambda s: s.creation_epoch, default=None)
+                    resumed = newest.name if newest else None
+                if not resumed:
+                    raise RuntimeError(f"resumed a partial receive on {plan.dst_ds} but could not tell which snapshot it completed")
+                dbg(f"parallel child {plan.src_ds}: resumed partial receive of {resumed}")
+                if snapshot_suffix(resumed) == snapshot_suffix(plan.snap):
+                    return
+                plan.base = f"{plan.src_ds}@{snapshot_suffix(resumed)}"
+            else:
+                dbg(f"parallel child {plan.src_ds}: resume failed ({err}); token cleared")
+
+        if direction == "pull":
+            send_snapshot_pull(
+                remoteSnapName=plan.snap,
+                localRecvFs=plan.dst_ds,
+                remoteBaseSnapName=plan.base,
+                compressed=compressed,
+                raw=raw,
+                remoteHost=remote_host,
+                remoteSshPort=ssh_port,
+                remoteUser=remote_user,
+                mBufferSize=mbuffer_size,
+                mBufferUnit=mbuffer_unit,
+                forceOverwrite=plan.force,
+                recursive=False,
+                transferMethod=transfer_method,
+                recvDataPort=data_port,
+                include_intermediates=inc,
+                send_props=True,
+            )
+        else:
+            send_snapshot_push(
+                plan.snap,
+                plan.dst_ds,
+                plan.base,
+                compressed,
+                raw,
+                remote_host,
+                ssh_port,
+                remote_user,
+                mbuffer_size,
+                mbuffer_unit,
+                plan.force,
+                transfer_method,
+                recursive=False,
+                recvDataPort=data_port,
+                include_intermediates=inc,
+                send_props=True,
+            )
+        ProgressJournal.clear(plan.dst_ds, remote_host or "")
+
+    start = time.time()
+    _bw_streams = max(1, min(workers, len(plans)))
+    try:
+        failed = run_child_sends(plans, send_one, workers)
+    finally:
+        _bw_streams = 1
+    dbg(f"parallel replication finished in {time.time() - start:.1f}s failed={len(failed)}")
+    if failed:
+        notifier.notify(f"STATUS=Replication failed for {len(failed)} of {len(plans)} dataset(s).")
+        for ds, err in failed.items():
+            print(f"  {ds}: {err}")
+        sys.exit(1)
+    notifier.notify("STATUS=All datasets received.")
+
 # --- One-shot flag auto-disable ----------------------------------------------
 
 # Keys that should be reset to false after a single use.
@@ -3228,15 +4772,12 @@ def _truncate(s: str, limit: int = DEBUG_MAX_TEXT) -> str:
         return s
     return s[:limit] + f"\n...[truncated {len(s) - limit} chars]"
 
+_debug_log = get_debug_log(DEBUG_LOG) if DEBUG_ENABLED else None
+
 def dbg(msg: str):
     if not DEBUG_ENABLED:
         return
-    try:
-        line = f"{datetime.datetime.now().isoformat()} {msg}\n"
-        with open(DEBUG_LOG, "a") as f:
-            f.write(line)
-    except Exception:
-        pass
+    _debug_log.write(f"{datetime.datetime.now().isoformat()} {msg}")
 
 def dbg_kv(title: str, kv: dict):
     if not DEBUG_ENABLED:
@@ -3266,9 +4807,21 @@ def dbg_env():
         "ZFS_REP_CHUNK_SIZE",
         "ZFS_REP_MBUFFER_BLOCK",
         "ZFS_REP_DIRECT_PIPE",
+        "ZFS_REP_SPLICE",
+        "ZFS_REP_SPLICE_PIPE_SIZE",
+        "ZFS_REP_PARALLEL_CHILDREN",
+        "ZFS_REP_MBUFFER_AUTOTUNE",
+        "ZFS_REP_SSH_MUX",
+        "ZFS_REP_CAPS_TTL",
+        "ZFS_REP_JOURNAL",
+        "ZFS_REP_ASYNC_ESTIMATE",
+        "ZFS_REP_WIRE_COMPRESS",
+        "ZFS_REP_WIRE_LEVEL",
+        "ZFS_REP_NC_STREAMS",
         "ZFS_REP_TCP_TUNING",
         "ZFS_REP_TCP_CC",
         "ZFS_REP_NC_BIND_ADDRESS",
+        "ZFS_REP_SNAPSHOT_CACHE",
         "HOME",
         "PATH",
     ]
@@ -3325,11 +4878,106 @@ if _SSH_CIPHER:
     SSH_BASE_OPTS.extend(["-o", f"Ciphers={_SSH_CIPHER}"])
     dbg(f"SSH cipher override: {_SSH_CIPHER}")
 
+# --- SSH connection multiplexing ----------------------------------------------
+
+# One ControlMaster per (user, host, port) for the life of the task, so the
+# many short remote commands (listings, zfs get/holds/destroy, nc probes,
+# port waits, size estimates) skip the key exchange and authentication.
+# Bulk zfs send/recv streams keep their own connection (mux=False) so
+# parallel streams are not squeezed through one TCP window.
+# ZFS_REP_SSH_MUX=0 disables it.
+SSH_MUX_ENABLED = as_bool(os.environ.get("ZFS_REP_SSH_MUX"), default=True)
+SSH_NO_MUX_OPTS = ["-o", "ControlMaster=no", "-o", "ControlPath=none"]
+
+
+class SshMux:
+    """Starts `ssh -M -N -f` masters on demand and tears them down at exit."""
+
+    def __init__(self, enabled=True):
+        self._enabled = enabled
+        self._dir = None
+        self._masters = {}
+        self._lock = threading.Lock()
+
+    def opts(self, user, host, port):
+        """ssh -o options that route a session through the shared master,
+        or [] if multiplexing is off or the master could not be started."""
+        if not self._enabled or not host:
+            return []
+        key = (user, host, str(port or "22"))
+        with self._lock:
+            path = self._masters.get(key)
+            if path is None:
+                path = self._start(key)
+                self._masters[key] = path
+        if not path:
+            return []
+        return ["-o", "ControlMaster=no", "-o", f"ControlPath={path}"]
+
+    def _start(self, key):
+        user, host, port = key
+        try:
+            if self._dir is None:
+                # Short base dir: unix socket paths are limited to ~108 bytes.
+                self._dir = tempfile.mkdtemp(prefix="zfsrep-ssh-", dir="/tmp")
+            path = os.path.join(self._dir, f"{len(self._masters)}.sock")
+            cmd = ["ssh"] + SSH_BASE_OPTS + [
+                "-M", "-N", "-f",
+                "-o", "ControlPersist=yes",
+                "-o", f"ControlPath={path}",
+            ]
+            if port != "22":
+                cmd += ["-p", port]
+            cmd.append(f"{user}@{host}")
+            dbg(f"RUN ssh master: {_fmt_cmd(cmd)}")
+            start = time.time()
+            # stderr goes to a file, not a pipe: older OpenSSH keeps the
+            # backgrounded master's stderr open, so a pipe would never hit EOF.
+            with tempfile.TemporaryFile() as errf:
+                p = subprocess.run(
+                    cmd,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=errf,
+                    timeout=60,
+                )
+                errf.seek(0)
+                err = errf.read(4000).decode(errors="replace")
+            if p.returncode != 0 or not os.path.exists(path):
+                dbg(f"ssh master for {user}@{host}:{port} not started (rc={p.returncode}): {err.strip()}")
+                return ""
+            dbg(f"ssh master for {user}@{host}:{port} ready in {time.time() - start:.2f}s at {path}")
+            return path
+        except Exception as e:
+            dbg(f"ssh master for {user}@{host}:{port} failed: {e}")
+            return ""
+
+    def close(self):
+        with self._lock:
+            masters, self._masters = self._masters, {}
+        for (user, host, port), path in masters.items():
+            if not path:
+                continue
+            cmd = ["ssh", "-o", f"ControlPath={path}", "-O", "exit"]
+            if port != "22":
+                cmd += ["-p", port]
+            cmd.append(f"{user}@{host}")
+            try:
+                subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL, timeout=10)
+            except Exception:
+                pass
+        if self._dir:
+            import shutil
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+
+_ssh_mux = SshMux(SSH_MUX_ENABLED)
+atexit.register(_ssh_mux.close)
+
 def ssh_run_args(user, host, port, args, *, capture_output=True, check=False, text=False, timeout=None):
-    ssh_cmd = ["ssh"] + SSH_BASE_OPTS
-    if str(port) != "22":
-        ssh_cmd += ["-p", str(port)]
-    ssh_cmd.append(f"{user}@{host}")
+    ssh_cmd = ssh_base_args(user, host, port)
 
     remote_cmd = " ".join(shlex.quote(str(a)) for a in args)
     ssh_cmd.append(remote_cmd)
@@ -3360,14 +5008,15 @@ def ssh_run_args(user, host, port, args, *, capture_output=True, check=False, te
         raise subprocess.CalledProcessError(p.returncode, ssh_cmd, output=p.stdout, stderr=p.stderr)
     return p
 
-def ssh_popen_args(user, host, port, args, *, stdin=None, stdout=None, stderr=None, universal_newlines=False):
-    ssh_cmd = ["ssh"] + SSH_BASE_OPTS
-    if str(port) != "22":
-        ssh_cmd += ["-p", str(port)]
-    ssh_cmd.append(f"{user}@{host}")
+def ssh_popen_args(user, host, port, args, *, stdin=None, stdout=None, stderr=None, universal_newlines=False, mux=True,
+                   codec=None):
+    """codec: WireCodec that compresses stdin locally before it goes over ssh."""
+    ssh_cmd = ssh_base_args(user, host, port, mux=mux)
 
     remote_cmd = " ".join(shlex.quote(str(a)) for a in args)
     ssh_cmd.append(remote_cmd)
+    if codec is not None:
+        ssh_cmd = codec.feeding(ssh_cmd)
 
     dbg(f"POPEN ssh: {_fmt_cmd(ssh_cmd)}")
     p = subprocess.Popen(
@@ -3381,6 +5030,7 @@ def ssh_popen_args(user, host, port, args, *, stdin=None, stdout=None, stderr=No
     return p
 
 def main():
+    global _bw_policy
     try:
         notifier.notify("STATUS=Starting ZFS replication task…")
         notifier.notify("READY=1")
@@ -3591,6 +5241,19 @@ def main():
         if not destFilesystem:
             raise RuntimeError("Destination dataset is empty (zfsRepConfig_destDataset_pool/dataset).")
 
+        # Wait for a replication / pool slot; held until the task exits.
+        # Taken before resuming an interrupted stream, which can be as large
+        # as any fresh send.
+        if direction == "pull":
+            localPools = [dstPool]
+        elif transferMethod == "local":
+            localPools = [srcPool, dstPool]
+        else:
+            localPools = [srcPool]
+        admission = admit("replication", localPools, label=taskName or sourceFilesystem, notifier=notifier)
+        if admission.waited:
+            dbg(f"admission: waited {admission.waited:.1f}s for pools={localPools}")
+
         if direction == "pull":
             if not remoteHost:
                 raise RuntimeError("Pull replication requires Host to be set (remote source).")
@@ -3609,6 +5272,7 @@ def main():
                 print(f"Checking for resume token on {local_target_fs}…")
                 notifier.notify(f"STATUS=Checking for resume token on {local_target_fs}…")
                 _resume_token = get_receive_resume_token(local_target_fs)
+                _resume_fs = local_target_fs
                 if not _resume_token:
                     print("RESUME ONLY mode: no resume token found. Nothing to resume.")
                     print("The previous transfer either completed successfully or was never started.")
@@ -3630,6 +5294,7 @@ def main():
                     recvDataPort=dataPort,
                 )
                 if ok:
+                    ProgressJournal.clear(_resume_fs, remoteHost or "")
                     print("Resume transfer completed successfully.")
                     notifier.notify("STATUS=Resume transfer completed. 100% complete")
                     sys.exit(0)
@@ -3684,6 +5349,7 @@ def main():
                     print(f"Checking for resume token on {target_fs}…")
                     notifier.notify(f"STATUS=Checking for resume token on {target_fs}…")
                     _resume_token = get_receive_resume_token(target_fs)
+                _resume_fs = target_fs
                 if not _resume_token:
                     print("RESUME ONLY mode: no resume token found. Nothing to resume.")
                     print("The previous transfer either completed successfully or was never started.")
@@ -3705,6 +5371,7 @@ def main():
                     stall_timeout=resumeStallTimeout,
                 )
                 if ok:
+                    ProgressJournal.clear(_resume_fs, remoteHost or "")
                     print("Resume transfer completed successfully.")
                     notifier.notify("STATUS=Resume transfer completed. 100% complete")
                     sys.exit(0)
@@ -3740,6 +5407,12 @@ def main():
                 notifier.notify(f"STATUS=Fetching local destination snapshots for {target_fs}…")
                 destinationSnapshots = get_local_snapshots(target_fs)
 
+        # One capability probe per host (usually a cache hit); the nc/pv
+        # lookups during the transfer are answered from it.
+        sendCaps = host_capabilities((remoteUser, remoteHost, sshPort) if direction == "pull" else None)
+        if isRaw and sendCaps["send_flags"] and not sendCaps["send_raw"]:
+            print("WARNING: zfs send on the source host does not advertise -w (raw); the raw send may fail.")
+
         forceOverwrite = False
         incrementalSnapName = ""
 
@@ -3777,6 +5450,7 @@ def main():
                     recvDataPort=dataPort,
                 )
                 if ok:
+                    ProgressJournal.clear(destFilesystem, remoteHost or "")
                     return
                 err_lower = (err or "").lower()
                 needs_overwrite = "destination exists" in err_lower or "must specify -f" in err_lower
@@ -3865,6 +5539,7 @@ def main():
                     stall_timeout=resumeStallTimeout,
                 )
                 if ok:
+                    ProgressJournal.clear(destFilesystem, remoteHost or "")
                     return
                 err_lower = (err or "").lower()
                 needs_overwrite = "destination exists" in err_lower or "must specify -f" in err_lower
@@ -4151,10 +5826,7 @@ def main():
 
                 if direction == "pull":
                     # Run on remote via SSH
-                    ssh_cmd = ["ssh"] + SSH_BASE_OPTS
-                    if str(sshPort) != "22":
-                        ssh_cmd += ["-p", str(sshPort)]
-                    ssh_cmd.append(f"{remoteUser}@{remoteHost}")
+                    ssh_cmd = ssh_base_args(remoteUser, remoteHost, sshPort)
                     ssh_cmd.append(" ".join(shlex.quote(str(a)) for a in verbose_cmd))
                     run_cmd = ssh_cmd
                 else:
@@ -4209,6 +5881,31 @@ def main():
             print("\n--- End Dry Run (no changes made) ---")
             sys.exit(0)
 
+        # Per-child parallel streams replace the single -R stream when enabled.
+        parallelChildren = 0
+        if isRecursiveSnap and PARALLEL_CHILDREN > 1:
+            if transferMethod == "netcat":
+                dbg("parallel children disabled: netcat uses a single data port")
+            elif forceFullSend:
+                dbg("parallel children disabled: force full send uses the -R stream")
+            else:
+                parallelChildren = PARALLEL_CHILDREN
+
+        if direction == "pull" or transferMethod != "local":
+            _bw_policy = bandwidth.load_policy(remoteHost)
+            if _bw_policy:
+                print(f"Bandwidth schedule [{_bw_policy.source}]: {_bw_policy.describe()}")
+                dbg(f"bandwidth rules={_bw_policy.rules!r}")
+
+        if MBUFFER_AUTOTUNE_ENABLED:
+            tuneHost = remoteHost if (direction == "pull" or transferMethod != "local") else ""
+            mBufferSize, mBufferUnit = autotune_mbuffer(transferMethod, tuneHost, mBufferSize, mBufferUnit)
+            # Registered with atexit so stalled runs (sys.exit) are recorded too.
+            atexit.register(
+                save_mbuffer_history, transferMethod, tuneHost,
+                _mbuffer_bytes(mBufferSize, mBufferUnit), MBUFFER_BLOCK_SIZE,
+            )
+
         notifier.notify("STATUS=Creating source snapshot…")
 
         if direction == "pull":
@@ -4257,23 +5954,43 @@ def main():
                             print(f"WARNING: failed to destroy {snap.name}: {err_out}")
                 print("Destination snapshots cleared.")
 
-            send_snapshot_pull(
-                remoteSnapName=newSnap,
-                localRecvFs=destFilesystem,
-                remoteBaseSnapName=incrementalSnapName,
-                compressed=isCompressed,
-                raw=isRaw,
-                remoteHost=remoteHost,
-                remoteSshPort=sshPort,
-                remoteUser=remoteUser,
-                mBufferSize=str(mBufferSize),
-                mBufferUnit=mBufferUnit,
-                forceOverwrite=forceOverwrite,
-                recursive=isRecursiveSnap,
-                transferMethod=transferMethod,
-                recvDataPort=dataPort,
-                include_intermediates=includeIntermediateSnapshots,
-            )
+            if parallelChildren:
+                replicate_children_parallel(
+                    sourceFilesystem, destFilesystem, newSnap, sourceSnapshots, destinationSnapshots,
+                    direction=direction,
+                    workers=parallelChildren,
+                    allow_overwrite=allowOverwrite,
+                    root_force=forceOverwrite,
+                    compressed=isCompressed,
+                    raw=isRaw,
+                    include_intermediates=includeIntermediateSnapshots,
+                    remote_user=remoteUser,
+                    remote_host=remoteHost,
+                    ssh_port=sshPort,
+                    transfer_method=transferMethod,
+                    mbuffer_size=str(mBufferSize),
+                    mbuffer_unit=mBufferUnit,
+                    data_port=dataPort,
+                    stall_timeout=resumeStallTimeout,
+                )
+            else:
+                send_snapshot_pull(
+                    remoteSnapName=newSnap,
+                    localRecvFs=destFilesystem,
+                    remoteBaseSnapName=incrementalSnapName,
+                    compressed=isCompressed,
+                    raw=isRaw,
+                    remoteHost=remoteHost,
+                    remoteSshPort=sshPort,
+                    remoteUser=remoteUser,
+                    mBufferSize=str(mBufferSize),
+                    mBufferUnit=mBufferUnit,
+                    forceOverwrite=forceOverwrite,
+                    recursive=isRecursiveSnap,
+                    transferMethod=transferMethod,
+                    recvDataPort=dataPort,
+                    include_intermediates=includeIntermediateSnapshots,
+                )
         else:
             newSnap = create_snapshot_local(sourceFilesystem, isRecursiveSnap, taskName, customName, tier_idx=tier_idx)
             exists, dest_snap_name = snapshot_exists_on_destination(
@@ -4301,10 +6018,8 @@ def main():
                     print(f"Destroying {len(destinationSnapshots)} snapshot(s) on remote destination {destFilesystem} for full receive…")
                     notifier.notify(f"STATUS=Destroying remote destination snapshots for full receive…")
                     for snap in destinationSnapshots:
-                        ssh_destroy = ["ssh"] + SSH_BASE_OPTS
-                        if str(sshPort) != "22":
-                            ssh_destroy += ["-p", str(sshPort)]
-                        ssh_destroy += [f"{remoteUser}@{remoteHost}", "zfs", "destroy", "-R", snap.name]
+                        ssh_destroy = ssh_base_args(remoteUser, remoteHost, sshPort)
+                        ssh_destroy += ["zfs", "destroy", "-R", snap.name]
                         dbg(f"RUN {_fmt_cmd(ssh_destroy)}")
                         dp = subprocess.run(ssh_destroy, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
                         if dp.returncode != 0:
@@ -4324,23 +6039,46 @@ def main():
                                 print(f"WARNING: failed to destroy {snap.name}: {err_out}")
                 print("Destination snapshots cleared.")
 
-            send_snapshot_push(
-                newSnap,
-                destFilesystem,
-                incrementalSnapName,
-                isCompressed,
-                isRaw,
-                remoteHost,
-                sshPort,
-                remoteUser,
-                str(mBufferSize),
-                mBufferUnit,
-                forceOverwrite,
-                transferMethod,
-                recursive=isRecursiveSnap,
-                recvDataPort=dataPort,
-                include_intermediates=includeIntermediateSnapshots,
-            )
+            if parallelChildren:
+                replicate_children_parallel(
+                    sourceFilesystem, destFilesystem, newSnap, sourceSnapshots, destinationSnapshots,
+                    direction=direction,
+                    workers=parallelChildren,
+                    allow_overwrite=allowOverwrite,
+                    root_force=forceOverwrite,
+                    compressed=isCompressed,
+                    raw=isRaw,
+                    include_intermediates=includeIntermediateSnapshots,
+                    remote_user=remoteUser if remoteHost else None,
+                    remote_host=remoteHost or None,
+                    ssh_port=sshPort,
+                    transfer_method=transferMethod,
+                    mbuffer_size=str(mBufferSize),
+                    mbuffer_unit=mBufferUnit,
+                    data_port=dataPort,
+                    stall_timeout=resumeStallTimeout,
+                )
+            else:
+                send_snapshot_push(
+                    newSnap,
+                    destFilesystem,
+                    incrementalSnapName,
+                    isCompressed,
+                    isRaw,
+                    remoteHost,
+                    sshPort,
+                    remoteUser,
+                    str(mBufferSize),
+                    mBufferUnit,
+                    forceOverwrite,
+                    transferMethod,
+                    recursive=isRecursiveSnap,
+                    recvDataPort=dataPort,
+                    include_intermediates=includeIntermediateSnapshots,
+                )
+
+        # Stream landed; its progress journal is no longer needed for resume.
+        ProgressJournal.clear(destFilesystem, remoteHost or "")
 
         # Tag received snapshot with custom properties on the destination side.
         # ZFS send/receive does not propagate user properties, so we set them
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Striped multi-connection TCP transport for netcat replication.
+
+A single TCP flow rarely fills a high bandwidth-delay WAN link. This tool
+carries one byte stream (zfs send output) over N parallel connections to the
+same port: the sender cuts stdin into sequence-numbered frames that idle
+connections pick up, the receiver puts them back in order on stdout. Either
+side may listen; replication-script.py runs the listener on the remote host
+in place of `nc -l` and connects locally in place of `nc host port`.
+
+Wire format, per connection:
+  hello  MAGIC(4) session(16) index(u16) streams(u16)
+  frame  seq(u64) length(u32) payload
+A frame with length 0 marks the end of the stream (its seq is the frame
+count), sent once on every connection. A receiver that sees EOF without the
+end marker, a duplicate or a gap exits non-zero so `zfs recv` never gets a
+silently truncated stream.
+
+Examples (loopback):
+  replication-stripe.py recv --listen --port 31337 --streams 4 > out &
+  replication-stripe.py send --host 127.0.0.1 --port 31337 --streams 4 < in
+"""
+import argparse
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b"ZRS1"
+HELLO = struct.Struct(">4s16sHH")
+FRAME = struct.Struct(">QI")
+FRAME_SIZE = 1024 * 1024
+
+
+class StripeError(Exception):
+    pass
+
+
+class Activity:
+    """Last time any byte moved; a watchdog thread aborts the process when it
+    is older than the stall timeout (same semantics as the direct pipe)."""
+
+    def __init__(self):
+        self.last = time.monotonic()
+        self.bytes = 0
+
+    def touch(self, n):
+        self.bytes += n
+        self.last = time.monotonic()
+
+    def watch(self, stall_timeout, label):
+        if not stall_timeout or stall_timeout <= 0:
+            return
+
+        def _watchdog():
+            while True:
+                time.sleep(min(30.0, stall_timeout))
+                idle = time.monotonic() - self.last
+                if idle >= stall_timeout:
+                    sys.stderr.write(
+                        f"{label}: no data for {int(idle)}s (stall timeout {stall_timeout}s) "
+                        f"after {self.bytes} bytes; aborting\n"
+                    )
+                    sys.stderr.flush()
+                    os._exit(3)
+
+        threading.Thread(target=_watchdog, name="stripe-watchdog", daemon=True).start()
+
+
+def _recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = sock.recv_into(view[got:], n - got)
+        if r == 0:
+            if got == 0:
+                return None
+            raise StripeError(f"connection closed mid-frame ({got}/{n} bytes)")
+        got += r
+    return buf
+
+
+def _tune(sock, sockbuf):
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if sockbuf:
+        for opt in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, opt, sockbuf)
+            except OSError:
+                pass
+
+
+def open_connections(args):
+    """N connected sockets, whichever side listens. Connections from another
+    session (a stale sender, a port scanner) are dropped at the hello."""
+    if args.listen:
+        srv = socket.socket(socket.AF_INET6 if ":" in (args.bind or "") else socket.AF_INET)
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        srv.bind((args.bind or "", args.port))
+        srv.listen(args.streams * 2)
+        srv.settimeout(args.connect_timeout)
+        socks = [None] * args.streams
+        session = None
+        try:
+            while any(s is None for s in socks):
+                conn, _ = srv.accept()
+                conn.settimeout(args.connect_timeout)
+                try:
+                    hello = _recv_exact(conn, HELLO.size)
+                    magic, sid, index, streams = HELLO.unpack(hello) if hello else (None, None, 0, 0)
+                except (OSError, StripeError, struct.error):
+                    magic = None
+                if magic != MAGIC or streams != args.streams or index >= args.streams \
+                        or (session is not None and sid != session) or socks[index] is not None:
+                    conn.close()
+                    continue
+                session = sid
+                conn.settimeout(None)
+                _tune(conn, args.sockbuf)
+                socks[index] = conn
+        except socket.timeout:
+            raise StripeError(f"only {sum(s is not None for s in socks)}/{args.streams} connections "
+                              f"arrived within {args.connect_timeout}s")
+        finally:
+            srv.close()
+        return socks
+
+    session = os.urandom(16)
+    socks = []
+    deadline = time.monotonic() + args.connect_timeout
+    for index in range(args.streams):
+        while True:
+            try:
+                conn = socket.create_connection((args.host, args.port), timeout=10)
+                break
+            except OSError:
+                # The listener may still be starting on the other side.
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+        conn.sendall(HELLO.pack(MAGIC, session, index, args.streams))
+        conn.settimeout(None)
+        _tune(conn, args.sockbuf)
+        socks.append(conn)
+    return socks
+
+
+def send_stream(src_fd, socks, frame_size, activity):
+    """Stripe src_fd over socks. Frames go to whichever connection is free,
+    so a slow flow carries less instead of holding the others back."""
+    frames = queue.Queue(maxsize=len(socks) * 4)
+    errors = []
+
+    def _pump(sock):
+        try:
+            while True:
+                item = frames.get()
+                if item is None:
+                    return
+                seq, data = item
+                sock.sendall(FRAME.pack(seq, len(data)))
+                sock.sendall(data)
+                activity.touch(len(data))
+        except OSError as e:
+            errors.append(e)
+
+    def _put(item):
+        # A dead connection fails the whole stream; never block on it.
+        while not errors:
+            try:
+                frames.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                pass
+        raise StripeError(f"send failed: {errors[0]}")
+
+    pumps = [threading.Thread(target=_pump, args=(s,), daemon=True) for s in socks]
+    for t in pumps:
+        t.start()
+
+    seq = 0
+    while True:
+        data = os.read(src_fd, frame_size)
+        if not data:
+            break
+        # Pipes return short reads; fill a whole frame (or hit EOF) so the
+        # per-frame overhead stays small.
+        while len(data) < frame_size:
+            more = os.read(src_fd, frame_size - len(data))
+            if not more:
+                break
+            data += more
+        _put((seq, data))
+        seq += 1
+    for _ in pumps:
+        _put(None)
+    for t in pumps:
+        t.join()
+    if errors:
+        raise StripeError(f"send failed: {errors[0]}")
+    for s in socks:
+        s.sendall(FRAME.pack(seq, 0))
+        s.shutdown(socket.SHUT_WR)
+    # Wait for the receiver to close so the data is known to have arrived.
+    for s in socks:
+        s.settimeout(300)
+        try:
+            while s.recv(4096):
+                pass
+        except OSError:
+            pass
+        s.close()
+    return seq
+
+
+def recv_stream(dst_fd, socks, max_pending, activity):
+    """Reassemble frames from socks onto dst_fd in sequence order. At most
+    max_pending out-of-order frames are held; a reader whose frame is not
+    next waits, which back-pressures its connection."""
+    cond = threading.Condition()
+    pending = {}
+    state = {"next": 0, "end": None, "done": 0, "error": None}
+
+    def _reader(sock):
+        try:
+            while True:
+                header = _recv_exact(sock, FRAME.size)
+                if header is None:
+                    raise StripeError("connection closed before end of stream")
+                seq, length = FRAME.unpack(header)
+                if length == 0:
+                    with cond:
+                        if state["end"] not in (None, seq):
+                            raise StripeError(f"conflicting end markers {state['end']} and {seq}")
+                        state["end"] = seq
+                        cond.notify_all()
+                    return
+                data = _recv_exact(sock, length)
+                if data is None:
+                    raise StripeError("connection closed mid-frame")
+                activity.touch(length)
+                with cond:
+                    while (len(pending) >= max_pending and seq != state["next"]
+                           and state["error"] is None):
+                        cond.wait()
+                    if seq < state["next"] or seq in pending:
+                        raise StripeError(f"duplicate frame {seq}")
+                    pending[seq] = data
+                    cond.notify_all()
+        except (OSError, StripeError) as e:
+            with cond:
+                state["error"] = state["error"] or e
+                cond.notify_all()
+        finally:
+            with cond:
+                state["done"] += 1
+                cond.notify_all()
+
+    readers = [threading.Thread(target=_reader, args=(s,), daemon=True) for s in socks]
+    for t in readers:
+        t.start()
+
+    while True:
+        with cond:
+            while (state["next"] not in pending and state["error"] is None
+                   and state["end"] != state["next"]
+                   and state["done"] < len(socks)):
+                cond.wait()
+            if state["error"] is not None:
+                raise StripeError(str(state["error"]))
+            data = pending.pop(state["next"], None)
+            if data is None:
+                if state["end"] == state["next"]:
+                    break
+                raise StripeError(f"stream ended without frame {state['next']}")
+            state["next"] += 1
+            cond.notify_all()
+        view = memoryview(data)
+        while view:
+            view = view[os.write(dst_fd, view):]
+
+    for t in readers:
+        t.join()
+    if state["error"] is not None:
+        raise StripeError(str(state["error"]))
+    for s in socks:
+        s.close()
+    return state["next"]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Carry a byte stream over N parallel TCP connections.")
+    ap.add_argument("mode", choices=("send", "recv"), help="send: stdin -> network; recv: network -> stdout")
+    side = ap.add_mutually_exclusive_group(required=True)
+    side.add_argument("--listen", action="store_true", help="accept the connections")
+    side.add_argument("--host", help="connect to this host")
+    ap.add_argument("--port", type=int, required=True)
+    ap.add_argument("--bind", default="", help="listen address (default: all)")
+    ap.add_argument("--streams", type=int, default=4, help="parallel TCP connections")
+    ap.add_argument("--frame-size", type=int, default=FRAME_SIZE, help="bytes per frame")
+    ap.add_argument("--sockbuf", type=int, default=0, help="SO_SNDBUF/SO_RCVBUF bytes (0 = kernel autotuning)")
+    ap.add_argument("--max-pending", type=int, default=0, help="out-of-order frames held by recv (default 4 per stream)")
+    ap.add_argument("--connect-timeout", type=float, default=120.0, help="seconds to establish all connections")
+    ap.add_argument("--stall-timeout", type=float, default=0, help="abort after this many seconds without data (0 = off)")
+    args = ap.parse_args()
+    args.streams = max(1, min(args.streams, 64))
+
+    activity = Activity()
+    try:
+        socks = open_connections(args)
+        activity.touch(0)
+        activity.watch(args.stall_timeout, f"stripe {args.mode}")
+        if args.mode == "send":
+            send_stream(sys.stdin.fileno(), socks, max(4096, args.frame_size), activity)
+        else:
+            recv_stream(sys.stdout.fileno(), socks, args.max_pending or 4 * args.streams, activity)
+    except (OSError, StripeError) as e:
+        sys.stderr.write(f"stripe {args.mode}: {e}\n")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
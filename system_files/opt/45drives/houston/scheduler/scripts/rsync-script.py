@@ -1,11 +1,22 @@
+import collections
 import subprocess
 import sys
 import os
 import re
+import selectors
 import shlex
+import signal
+import shutil
+import tempfile
 import traceback
 import datetime as dt
+import time
 from notify import get_notifier
+from debuglog import get_debug_log
+from bandwidth import load_policy, format_rate
+from admission import admit, dataset_pool
+from rsync_partition import LocalTree, RemoteTree, partition
+import zfs_incremental
 
 
 class SafeStream:
@@ -43,15 +54,12 @@ notifier = get_notifier()
 DEBUG_LOG = os.environ.get("RSYNC_DEBUG_LOG", "/tmp/rsync_task_debug.log")
 DEBUG_ENABLED = os.environ.get("RSYNC_DEBUG", "1").strip().lower() in ("1", "true", "yes", "on")
 
+_debug_log = get_debug_log(DEBUG_LOG) if DEBUG_ENABLED else None
+
 def dbg(msg: str):
     if not DEBUG_ENABLED:
         return
-    try:
-        with open(DEBUG_LOG, "a") as f:
-            f.write(f"{dt.datetime.now().isoformat()} {msg}\n")
-    except Exception:
-        pass
-PROGRESS_RE = re.compile(r'(\d+)%')
+    _debug_log.write(f"{dt.datetime.now().isoformat()} {msg}")
 
 def shlex_join(argv):
     import shlex
@@ -134,8 +142,14 @@ def build_rsync_command(options):
         if options.get(key):
             command.append(flag)
 
-    if int(options['bandwidthLimit']) > 0:
-        command.append(f'--bwlimit={options["bandwidthLimit"]}')
+    # rsync cannot change its limit mid-run, so the scheduled rate in effect
+    # at start applies to the whole transfer; the task's limit caps it.
+    policy = load_policy(options['targetHost']).with_cap(int(options['bandwidthLimit']) * 1024)
+    rate = policy.rate_at()
+    if rate:
+        command.append(f'--bwlimit={max(1, rate // 1024)}')
+        if policy.rules:
+            print(f"Bandwidth schedule [{policy.source}]: {format_rate(rate)} for this run")
 
     if options['includePattern']:
         include_patterns = options['includePattern'].split(',')
@@ -204,106 +218,366 @@ def execute_command(command, src, dest, isParallel=False, parallelThreads=0, log
             print(f"WARNING: Failed to open log file {log_file_path}: {e}")
             log_fh = None
 
+    jobs = None
     if isParallel and int(parallelThreads) > 0:
-        # Parallel mode only supports local directory sources
-        if ':' in src:
-            print("Error: Parallel mode is not supported for remote sources.")
-            sys.exit(2)
-        if not os.path.isdir(src.rstrip('/')):
-            print("Error: Parallel mode requires the source to be a directory.")
-            sys.exit(2)
-        if '--delete' in command:
-            print("Error: Parallel mode is not compatible with --delete.")
-            sys.exit(2)
-            
-        print(f'Transferring using {parallelThreads} parallel threads from {src} to {dest}')
-
-        src_root = src.rstrip('/')
-        rsync_command = shlex_join(command)
-        parallel_command = (
-            f'find {shlex.quote(src_root)} -mindepth 1 -maxdepth 1 -print0 | '
-            f'xargs -0 -I {{}} -P {parallelThreads} -n 1 {rsync_command} "{{}}" {shlex.quote(dest)}'
-        )
-
-        print(f'Executing command: {parallel_command}')
-
-        process = subprocess.Popen(
-            parallel_command,
-            shell=True,
-            universal_newlines=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            bufsize=1,
-        )
-    else:
-        command.extend([src, dest])
-
-        
-        print("Executing rsync command:")
-        print("  " + shlex_join(command))
-
-        process = subprocess.Popen(
-            command,
-            universal_newlines=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            bufsize=1,
-        )
-
-    # Regex to detect rsync itemized-changes lines (e.g. ">f+++++++++ path/to/file")
-    ITEMIZE_RE = re.compile(r'^[<>ch.*][fdLDS][c.+?][s.+?][t.+?][p.+?][o.+?][g.+?][u.+?][a.+?][x.+?] ')
-
-    last_percent = None
+        jobs = plan_parallel(command, src, dest, int(parallelThreads))
+    list_dir = jobs.list_dir if jobs else None
 
     try:
-        assert process.stdout is not None
-        for line in process.stdout:
-            is_itemized = bool(ITEMIZE_RE.match(line))
-
-            # Always write to debug log (detailed)
-            dbg(line.rstrip('\n'))
-
-            # User log file: skip noisy itemized lines
-            if log_fh and not is_itemized:
-                try:
-                    log_fh.write(line)
-                except Exception as e:
-                    print(f"WARNING: Failed to write to log file {log_file_path}: {e}")
-                    log_fh = None
-
-            # Journal/stdout: skip noisy itemized lines
-            if not is_itemized:
-                sys.stdout.write(line)
-                sys.stdout.flush()
-
-            m = PROGRESS_RE.search(line)
-            if m:
-                pct = int(m.group(1))
-                if pct != last_percent:
-                    last_percent = pct
-                    notifier.notify(f"STATUS=Transferring… {pct:.1f}% complete")
-
-        process.wait()
+        if jobs:
+            codes = run_jobs(jobs.commands, jobs.weights, log_fh)
+            if not any(codes) and jobs.sweep:
+                notifier.notify("STATUS=Removing files deleted at the source…")
+                print("Executing delete pass:")
+                print("  " + shlex_join(jobs.sweep))
+                codes = run_jobs([jobs.sweep], [1], log_fh, report_progress=False)
+        else:
+            command.extend([src, dest])
+
+            print("Executing rsync command:")
+            print("  " + shlex_join(command))
+            codes = run_jobs([command], [1], log_fh)
     finally:
         if log_fh:
             try:
                 log_fh.close()
             except Exception:
                 pass
+        if list_dir:
+            shutil.rmtree(list_dir, ignore_errors=True)
 
-        if process.returncode == 0:
-            notifier.notify("STATUS=Finishing up…")
-        else:
-            notifier.notify("STATUS=Transfer failed")
+    returncode = next((c for c in codes if c), 0)
+    if returncode == 0:
+        notifier.notify("STATUS=Finishing up…")
+    else:
+        notifier.notify("STATUS=Transfer failed")
 
-    if process.returncode != 0:
-        print(f"Error: rsync exited with code {process.returncode}")
-        sys.exit(process.returncode)
+    if returncode != 0:
+        print(f"Error: rsync exited with code {returncode}")
+        sys.exit(returncode)
     else:
         print("Rsync task execution completed.")
 
 
+class ParallelJobs:
+    def __init__(self, commands, weights, sweep, list_dir):
+        self.commands = commands
+        self.weights = weights
+        self.sweep = sweep
+        self.list_dir = list_dir
+
+
+def _ssh_argv(command):
+    """The ssh invocation rsync itself will use (its -e value)."""
+    if '-e' in command:
+        return shlex.split(command[command.index('-e') + 1])
+    return ['ssh']
+
+
+# Short options whose value follows in the same bundle or the next argument.
+SHORT_OPTS_WITH_VALUE = set('BefTM@')
+
+
+def recursion_requested(command):
+    """Whether rsync will recurse: -r or -a (alone or bundled, e.g. -aHz),
+    --recursive or --archive, unless a later --no-r/--no-recursive turns it
+    off."""
+    recursive = False
+    skip_value = False
+    for arg in command[1:]:
+        if skip_value:
+            skip_value = False
+            continue
+        if arg == '--':
+            break
+        if arg.startswith('--'):
+            name = arg[2:].split('=', 1)[0]
+            if name in ('recursive', 'archive'):
+                recursive = True
+            elif name in ('no-recursive', 'no-r'):
+                recursive = False
+        elif arg.startswith('-') and len(arg) > 1:
+            bundle = arg[1:]
+            for i, flag in enumerate(bundle):
+                if flag in 'ar':
+                    recursive = True
+                if flag in SHORT_OPTS_WITH_VALUE:
+                    skip_value = i == len(bundle) - 1
+                    break
+    return recursive
+
+
+def plan_parallel(command, src, dest, threads):
+    """Split the source into `threads` balanced --files-from shards.
+
+    Returns None (with the reason printed) when the transfer should run as a
+    single rsync instead: a single-file source, a source that cannot be
+    listed, or one with nothing in it.
+    """
+    src_root = src.rstrip('/') or '/'
+    if ':' in src:
+        host, _, path = src_root.partition(':')
+        tree = RemoteTree(_ssh_argv(command) + ['-o', 'BatchMode=yes'], host, path)
+    else:
+        if not os.path.isdir(src_root):
+            print("Parallel mode needs a directory source; running a single rsync.")
+            return None
+        tree = LocalTree(src_root)
+
+    recursive = recursion_requested(command)
+    print(f'Partitioning {src} into {threads} shards…')
+    notifier.notify("STATUS=Scanning source for parallel transfer…")
+    list_dir = tempfile.mkdtemp(prefix='houston-rsync-shards-')
+    try:
+        shards = partition(tree, threads, recursive=recursive, directory=list_dir)
+    except (OSError, ValueError) as e:
+        shutil.rmtree(list_dir, ignore_errors=True)
+        print(f"WARNING: could not partition {src} ({e}); running a single rsync.")
+        return None
+    if not shards:
+        shutil.rmtree(list_dir, ignore_errors=True)
+        print("Nothing to partition; running a single rsync.")
+        return None
+
+    # Deletions are left to one pass over the whole tree once the shards are
+    # in, since a worker only sees the paths in its own list.
+    worker = [a for a in command if a != '--delete']
+    if recursive:
+        worker.append('-r')
+    commands = []
+    for shard in shards:
+        print(f'  shard {shard.index}: {len(shard.units)} entries, '
+              f'{shard.files} files, {shard.bytes / 1024 ** 3:.2f} GiB')
+        commands.append(worker + [f'--files-from={shard.list_path}', '--from0', src_root + '/', dest])
+    sweep = None
+    if '--delete' in command:
+        sweep = command + ['--existing', '--ignore-existing', src_root + '/', dest]
+
+    print(f'Transferring using {len(commands)} parallel rsync workers from {src} to {dest}')
+    for argv in commands:
+        dbg(f"worker: {shlex_join(argv)}")
+    return ParallelJobs(commands, [max(1, s.weight) for s in shards], sweep, list_dir)
+
+
+# Output is handled a chunk at a time: each pattern runs once over the
+# whole chunk instead of once per line.
+READ_SIZE = 256 * 1024
+# rsync itemized-changes lines (e.g. ">f+++++++++ path/to/file"); the first
+# two characters are the update type and the file type.
+ITEMIZE_RE = re.compile(
+    r'^([<>ch.*])([fdLDS])[c.+?][s.+?][t.+?][p.+?][o.+?][g.+?][u.+?][a.+?][x.+?] .*\n', re.M)
+# --info=progress2 lines: "1.23G  45%  110.50MB/s  0:01:23 (xfr#12, to-chk=3/40)".
+PROGRESS2_RE = re.compile(r'^ *([\d.,]+[KMGTP]?) +(\d+)% +(\S+/s) +(\d+:\d\d:\d\d)(.*)\n', re.M)
+BLANK_LINES_RE = re.compile(r'^\s*\n', re.M)
+# How often a changed rate/ETA is sent to systemd when the percent is not moving.
+STATUS_INTERVAL = 5.0
+
+ITEM_UPDATES = {'<': 'sent', '>': 'received', 'c': 'created', 'h': 'hard-linked', '.': 'unchanged', '*': 'other'}
+ITEM_TYPES = {'f': 'files', 'd': 'dirs', 'L': 'symlinks', 'D': 'devices', 'S': 'special files'}
+
+
+def _rate_bytes(rate):
+    """Bytes/s from an rsync rate such as '110.50MB/s' or '1,234.56kB/s'."""
+    m = re.match(r'([\d.,]+)([kKMGT]?)B/s', rate)
+    if not m:
+        return 0
+    scale = {'': 1, 'k': 1024, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}[m.group(2)]
+    return int(float(m.group(1).replace(',', '')) * scale)
+
+
+class RsyncOutput:
+    """Sorts rsync output from one or more workers. Itemized lines are
+    counted (they still go to the debug log), progress2 lines drive the
+    systemd status and reach the journal/log only when the percent moves,
+    and everything else is written through as it is."""
+
+    def __init__(self, weights, log_fh, report_progress=True):
+        self.weights = weights
+        self.total_weight = sum(weights)
+        self.percents = [0] * len(weights)
+        self.rates = [0] * len(weights)
+        self.log_fh = log_fh
+        self.report_progress = report_progress
+        self.items = collections.Counter()
+        self.last_percent = None
+        self.last_status = None
+        self.last_status_time = 0.0
+
+    def feed(self, index, data):
+        """Handle a run of complete lines (ending in \\n or \\r) from one worker."""
+        text = data.decode('utf-8', 'replace').replace('\r', '\n')
+        if DEBUG_ENABLED:
+            stamp = dt.datetime.now().isoformat() + ' '
+            _debug_log.write(stamp + text.rstrip('\n').replace('\n', '\n' + stamp))
+
+        self.items.update(ITEMIZE_RE.findall(text))
+        rest = ITEMIZE_RE.sub('', text)
+        last = None
+        for last in PROGRESS2_RE.finditer(rest):
+            pass
+        if last:
+            # Only the latest progress line counts; it keeps its place
+            # among the other lines of the chunk.
+            line = self._progress(index, last.groups()) or ''
+            rest = PROGRESS2_RE.sub('', rest[:last.start()]) + line + rest[last.end():]
+        rest = BLANK_LINES_RE.sub('', rest)
+        if rest:
+            self.write(rest)
+
+    def _progress(self, index, match):
+        """Update status from the worker's latest progress2 line; returns the
+        line to show when the overall percent changed."""
+        done, pct, rate, clock, tail = match
+        if not self.report_progress:
+            return None
+        self.percents[index] = int(pct)
+        overall = sum(p * w for p, w in zip(self.percents, self.weights)) / self.total_weight
+        if len(self.weights) > 1:
+            self.rates[index] = _rate_bytes(rate)
+            # format_rate() reads 0 as "no limit"; here it means stalled.
+            total = sum(self.rates)
+            detail = f"{format_rate(total) if total else '0B/s'} over {len(self.weights)} workers"
+        elif 'xfr#' in tail:
+            # rsync shows elapsed time at the end of a file, time left mid-file.
+            detail = rate
+        else:
+            detail = f"{rate}, ETA {clock}"
+        status = f"STATUS=Transferring… {overall:.1f}% complete ({detail})"
+        now = time.monotonic()
+        moved = int(overall) != self.last_percent
+        if moved or (status != self.last_status and now - self.last_status_time >= STATUS_INTERVAL):
+            notifier.notify(status)
+            self.last_status = status
+            self.last_status_time = now
+        if not moved:
+            return None
+        self.last_percent = int(overall)
+        return f"{done} {pct}% {rate} {clock}{tail}\n".lstrip()
+
+    def write(self, text):
+        if self.log_fh:
+            try:
+                self.log_fh.write(text)
+            except Exception as e:
+                print(f"WARNING: Failed to write to log file: {e}")
+                self.log_fh = None
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    def summary(self):
+        """One line totalling the itemized changes, e.g. '120 files sent'."""
+        parts = []
+        for (update, kind), count in sorted(self.items.items(), key=lambda kv: -kv[1]):
+            parts.append(f"{count} {ITEM_TYPES.get(kind, kind)} {ITEM_UPDATES.get(update, update)}")
+        return f"Itemized changes: {', '.join(parts)}\n" if parts else ''
+
+
+def run_jobs(commands, weights, log_fh, report_progress=True):
+    """Run rsync commands side by side, stream their output and send the
+    weighted overall progress to systemd. Returns their exit codes."""
+    processes = [
+        subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
+        for argv in commands
+    ]
+    output = RsyncOutput(weights, log_fh, report_progress)
+    pending = [b''] * len(processes)
+
+    with selectors.DefaultSelector() as selector:
+        for index, process in enumerate(processes):
+            selector.register(process.stdout, selectors.EVENT_READ, index)
+        try:
+            while selector.get_map():
+                for key, _ in selector.select():
+                    index = key.data
+                    chunk = os.read(key.fd, READ_SIZE)
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        if pending[index]:
+                            output.feed(index, pending[index] + b'\n')
+                            pending[index] = b''
+                        continue
+                    data = pending[index] + chunk
+                    cut = max(data.rfind(b'\n'), data.rfind(b'\r')) + 1
+                    if not cut and len(data) < READ_SIZE:
+                        pending[index] = data
+                        continue
+                    # No line break in a whole chunk: pass it on regardless.
+                    cut = cut or len(data)
+                    pending[index] = data[cut:]
+                    output.feed(index, data[:cut])
+        finally:
+            for process in processes:
+                process.wait()
+            if output.items:
+                output.write(output.summary())
+    return [process.returncode for process in processes]
+
+
+def _exit_on_sigterm(signum, frame):
+    # systemd stops the task with SIGTERM; unwind through the finally
+    # blocks so an interrupted incremental run drops its snapshot.
+    sys.exit(128 + signum)
+
+
+def begin_incremental(options, src, dest):
+    """Snapshot and `zfs diff` a local ZFS source (see zfs_incremental).
+    Returns None, with the reason printed, when the task runs a full scan."""
+    task_name = os.environ.get("taskName", "").strip()
+    if ':' in src or not task_name:
+        print("ZFS incremental mode needs a local source and a task name; scanning the full source.")
+        return None
+    try:
+        # A base sent elsewhere, or through other filters, says nothing
+        # about what this destination is missing.
+        target = {
+            'dest': dest,
+            'port': options['targetPort'],
+            'include': options['includePattern'],
+            'exclude': options['excludePattern'],
+            'customArgs': options['customArgs'],
+        }
+        run = zfs_incremental.begin(src, f"rsync-{task_name}", target=target)
+    except OSError as e:
+        print(f"WARNING: ZFS incremental mode unavailable ({e}); scanning the full source.")
+        return None
+    if run is None:
+        print(f"{src} is not on a mounted ZFS dataset; scanning the full source.")
+    elif run.full:
+        print(f"ZFS incremental: {run.full_reason}, full transfer from {run.snapshot}")
+    else:
+        print(f"ZFS incremental: {run.changed} changed and {run.removed} removed paths "
+              f"between {run.previous} and {run.snapshot}")
+    dbg(f"incremental run: {run.__dict__ if run else None}")
+    return run
+
+
+def apply_change_list(command, run):
+    """Restrict command to the run's changed paths. Returns False when there
+    is nothing to send."""
+    delete = '--delete' in command
+    if not run.changed and not (delete and run.removed):
+        return False
+    # The list is complete, so rsync must not recurse from the directories
+    # in it; with --delete, removed paths are listed as missing arguments
+    # (--force so a removed directory goes even while it still has files).
+    command[:] = [a for a in command if a not in ('--delete', '-r')]
+    if recursion_requested(command):
+        command.append('--no-recursive')
+    list_path = run.changed_list
+    if delete and run.removed:
+        list_path = os.path.join(run.workdir, 'files.list')
+        with open(list_path, 'wb') as out:
+            for part in (run.changed_list, run.removed_list):
+                with open(part, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+        command.extend(['--delete-missing-args', '--force'])
+    command.extend([f'--files-from={list_path}', '--from0'])
+    return True
+
+
 def execute_rsync(options):
+    run = None
+    ok = False
     try:
         command = build_rsync_command(options)
         src, dest = construct_paths(
@@ -314,8 +588,26 @@ def execute_rsync(options):
             options['targetUser'],
         )
         log_path = options.get('logFilePath') or None
-
-        if options['isParallel']:
+        isParallel = options['isParallel']
+
+        if options['zfsIncremental']:
+            signal.signal(signal.SIGTERM, _exit_on_sigterm)
+            run = begin_incremental(options, src, dest)
+        if run is not None:
+            # Read from the snapshot; keep rsync's trailing-slash meaning.
+            if not src.endswith('/'):
+                dest = dest.rstrip('/') + '/' + os.path.basename(src.rstrip('/'))
+            src = run.source
+            if not run.full:
+                if not apply_change_list(command, run):
+                    print("No changes since the last run.")
+                    ok = True
+                    return
+                if isParallel:
+                    print("Sending the change list with a single rsync.")
+                isParallel = False
+
+        if isParallel:
             execute_command(
                 command,
                 src,
@@ -333,9 +625,20 @@ def execute_rsync(options):
                 parallelThreads=0,
                 log_file_path=log_path,
             )
+        ok = True
     except Exception as e:
         print(f"send error: {e}")
         sys.exit(1)
+    finally:
+        if run is not None:
+            # A failed or dry run leaves the previous base in place.
+            try:
+                if ok and not any(a in ('-n', '--dry-run') for a in command):
+                    run.commit()
+                else:
+                    run.discard()
+            except OSError as e:
+                print(f"WARNING: could not record the ZFS incremental snapshot: {e}")
 
 
 def str_to_bool(value):
@@ -364,6 +667,7 @@ def parse_arguments():
         'excludePattern': os.environ.get('rsyncConfig_rsyncOptions_exclude_pattern', ''),
         'isParallel': str_to_bool(os.environ.get('rsyncConfig_rsyncOptions_parallel_flag', 'False')),
         'parallelThreads': int(os.environ.get('rsyncConfig_rsyncOptions_parallel_threads', 0)),
+        'zfsIncremental': str_to_bool(os.environ.get('rsyncConfig_rsyncOptions_zfs_diff_flag', 'False')),
         'customArgs': os.environ.get('rsyncConfig_rsyncOptions_custom_args', ''),
         'logFilePath': os.environ.get('rsyncConfig_rsyncOptions_log_file_path', ''),
     }
@@ -381,7 +685,14 @@ def main():
         options['localPath'] = normalize_local_source_path(options.get('localPath', ''))
         if not options.get('targetHost'):
             options['targetPath'] = normalize_dest_path_for_file_copy(options.get('targetPath', ''))
-            
+
+        # Wait for an rsync / pool slot; held until the task exits.
+        pools = [dataset_pool(options['localPath'])]
+        if not options.get('targetHost'):
+            pools.append(dataset_pool(options['targetPath']))
+        admit("rsync", pools, label=os.environ.get("taskName", "") or options['localPath'], notifier=notifier)
+        notifier.notify("STATUS=Running task…")
+
         execute_rsync(options)
         notifier.notify("STATUS=Finishing up…")
         dbg("=== rsync task completed ===")
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""Split an rsync source tree into balanced shards for parallel workers.
+
+Parallel mode used to hand each top-level entry of the source to its own
+rsync, so a tree with one huge subdirectory ran on one worker while the rest
+sat idle. Here the source is walked once (os.scandir locally, one `find`
+over ssh for a remote source) to total bytes and files per directory; any
+directory heavier than a fraction of a shard is replaced by its children,
+and the resulting units are packed onto the shards heaviest first, each
+unit going to the lightest shard. A unit's weight is its bytes plus
+HOUSTON_RSYNC_FILE_COST (default 64 KiB) per file, since many small files
+cost more than their size suggests.
+
+Each shard is written as a NUL-separated list for `rsync --files-from
+--from0`; directory units are listed as-is and copied recursively.
+"""
+import heapq
+import os
+import shlex
+import subprocess
+import tempfile
+
+
+def _env_int(name, default):
+    try:
+        return max(0, int(os.environ.get(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+FILE_COST = _env_int("HOUSTON_RSYNC_FILE_COST", 64 * 1024)
+# A directory heavier than this share of one shard is split into its children.
+SPLIT_FRACTION = 0.25
+# Rounds of splitting; each round goes one directory level deeper.
+MAX_ROUNDS = 32
+
+
+class Unit:
+    __slots__ = ("path", "is_dir", "bytes", "files")
+
+    def __init__(self, path, is_dir, nbytes, files):
+        self.path = path
+        self.is_dir = is_dir
+        self.bytes = nbytes
+        self.files = files
+
+    @property
+    def weight(self):
+        return self.bytes + self.files * FILE_COST
+
+
+class Shard:
+    __slots__ = ("index", "units", "bytes", "files", "list_path")
+
+    def __init__(self, index):
+        self.index = index
+        self.units = []
+        self.bytes = 0
+        self.files = 0
+        self.list_path = None
+
+    @property
+    def weight(self):
+        return self.bytes + self.files * FILE_COST
+
+
+def _join(parent, name):
+    return f"{parent}/{name}" if parent else name
+
+
+class LocalTree:
+    """Source tree on this machine; paths are relative to root."""
+
+    def __init__(self, root):
+        self.root = root.rstrip("/") or "/"
+
+    def _abs(self, rel):
+        return os.path.join(self.root, rel) if rel else self.root
+
+    def walk(self):
+        """(parent reldir, name, is_dir, size) for every entry below root."""
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            try:
+                with os.scandir(self._abs(rel)) as it:
+                    for entry in it:
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            size = 0 if is_dir else entry.stat(follow_symlinks=False).st_size
+                        except OSError:
+                            continue
+                        if is_dir:
+                            stack.append(_join(rel, entry.name))
+                        yield rel, entry.name, is_dir, size
+            except OSError:
+                continue
+
+    def list_dirs(self, rels):
+        """{reldir: [(name, is_dir, size)]} for the direct children of each."""
+        out = {}
+        for rel in rels:
+            children = out[rel] = []
+            try:
+                with os.scandir(self._abs(rel)) as it:
+                    for entry in it:
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            size = 0 if is_dir else entry.stat(follow_symlinks=False).st_size
+                        except OSError:
+                            continue
+                        children.append((entry.name, is_dir, size))
+            except OSError:
+                pass
+        return out
+
+
+class RemoteTree:
+    """Source tree behind ssh, listed with GNU find on the remote side."""
+
+    # Directories per find when listing many at once (keeps argv short).
+    LIST_BATCH = 200
+
+    def __init__(self, ssh_argv, host, root):
+        self.ssh_argv = list(ssh_argv)
+        self.host = host
+        self.root = root.rstrip("/") or "/"
+        self._prefix = self.root.rstrip("/") + "/"
+
+    def _find(self, paths, extra):
+        """(parent reldir, name, is_dir, size) for what find prints."""
+        quoted = " ".join(shlex.quote(p) for p in paths)
+        remote = f"find {quoted} -mindepth 1 {extra} -printf '%y\\t%s\\t%p\\0'"
+        proc = subprocess.Popen(self.ssh_argv + [self.host, remote],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        buf = b""
+        while True:
+            chunk = proc.stdout.read(1 << 20)
+            if not chunk:
+                break
+            records = (buf + chunk).split(b"\0")
+            buf = records.pop()
+            for rec in records:
+                kind, size, path = rec.split(b"\t", 2)
+                rel = os.fsdecode(path)[len(self._prefix):]
+                parent, _, name = rel.rpartition("/")
+                is_dir = kind == b"d"
+                yield parent, name, is_dir, 0 if is_dir else int(size)
+        if proc.wait() != 0:
+            raise OSError(f"remote listing of {self.host}:{self.root} failed (exit {proc.returncode})")
+
+    def walk(self):
+        return self._find([self.root], "")
+
+    def list_dirs(self, rels):
+        out = {rel: [] for rel in rels}
+        for i in range(0, len(rels), self.LIST_BATCH):
+            bases = [self._prefix + rel if rel else self.root for rel in rels[i:i + self.LIST_BATCH]]
+            for parent, name, is_dir, size in self._find(bases, "-maxdepth 1"):
+                out.setdefault(parent, []).append((name, is_dir, size))
+        return out
+
+
+def _subtree_totals(tree):
+    """{reldir: [bytes, files]} over whole subtrees, root included as ''."""
+    own = {"": [0, 0]}
+    for parent, name, is_dir, size in tree.walk():
+        if is_dir:
+            own.setdefault(_join(parent, name), [0, 0])
+        else:
+            totals = own.setdefault(parent, [0, 0])
+            totals[0] += size
+            totals[1] += 1
+    # Roll children into parents, deepest first.
+    for rel in sorted(own, key=lambda r: r.count("/") if r else -1, reverse=True):
+        if not rel:
+            continue
+        parent = rel.rpartition("/")[0]
+        up = own.setdefault(parent, [0, 0])
+        up[0] += own[rel][0]
+        up[1] += own[rel][1]
+    return own
+
+
+def plan_units(tree, shards, recursive=True):
+    """Units that together cover the tree, split finely enough that none
+    outweighs SPLIT_FRACTION of one shard (unless it is a single file)."""
+    if not recursive:
+        children = tree.list_dirs([""])[""]
+        return [Unit(name, False, size, 1) for name, is_dir, size in children if not is_dir]
+
+    totals = _subtree_totals(tree)
+    total_bytes, total_files = totals[""]
+    target = (total_bytes + total_files * FILE_COST) / max(1, shards)
+    limit = target * SPLIT_FRACTION
+
+    def unit_for(rel, is_dir, size):
+        if is_dir:
+            b, f = totals.get(rel, (0, 0))
+            return Unit(rel, True, b, f)
+        return Unit(rel, False, size, 1)
+
+    units = []
+    to_split = [""]
+    for _ in range(MAX_ROUNDS):
+        if not to_split:
+            break
+        listed = tree.list_dirs(to_split)
+        to_split = []
+        for parent, children in listed.items():
+            for name, is_dir, size in children:
+                unit = unit_for(_join(parent, name), is_dir, size)
+                if is_dir and unit.weight > limit and unit.files:
+                    to_split.append(unit.path)
+                else:
+                    units.append(unit)
+    # Anything still waiting after MAX_ROUNDS is copied whole.
+    units.extend(unit_for(rel, True, 0) for rel in to_split)
+    return units
+
+
+def pack(units, shards):
+    """Longest-processing-time packing: heaviest unit to lightest shard."""
+    bins = [Shard(i) for i in range(max(1, shards))]
+    heap = [(0, i) for i in range(len(bins))]
+    for unit in sorted(units, key=lambda u: u.weight, reverse=True):
+        _, i = heapq.heappop(heap)
+        shard = bins[i]
+        shard.units.append(unit)
+        shard.bytes += unit.bytes
+        shard.files += unit.files
+        heapq.heappush(heap, (shard.weight, i))
+    return [s for s in bins if s.units]
+
+
+def write_lists(shards, directory=None):
+    """Write each shard's --files-from list; returns the directory used."""
+    directory = directory or tempfile.mkdtemp(prefix="houston-rsync-shards-")
+    for shard in shards:
+        shard.list_path = os.path.join(directory, f"shard-{shard.index}.list")
+        with open(shard.list_path, "wb") as f:
+            for unit in shard.units:
+                f.write(os.fsencode(unit.path) + b"\0")
+    return directory
+
+
+def partition(tree, shards, recursive=True, directory=None):
+    """Balanced shards for the tree, their lists written to disk."""
+    packed = pack(plan_units(tree, shards, recursive), shards)
+    write_lists(packed, directory)
+    return packed
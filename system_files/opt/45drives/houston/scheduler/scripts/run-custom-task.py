@@ -16,6 +16,7 @@ import concurrent.futures
 import shlex
 
 from notify import get_notifier
+from debuglog import get_debug_log
 
 
 class SafeStream:
@@ -51,14 +52,12 @@ sys.stderr = SafeStream(sys.stderr)
 DEBUG_LOG = os.environ.get("CUSTOM_TASK_DEBUG_LOG", "/tmp/custom_task_debug.log")
 DEBUG_ENABLED = os.environ.get("CUSTOM_TASK_DEBUG", "1").strip().lower() in ("1", "true", "yes", "on")
 
+_debug_log = get_debug_log(DEBUG_LOG) if DEBUG_ENABLED else None
+
 def dbg(msg: str):
     if not DEBUG_ENABLED:
         return
-    try:
-        with open(DEBUG_LOG, "a") as f:
-            f.write(f"{dt.datetime.now().isoformat()} {msg}\n")
-    except Exception:
-        pass
+    _debug_log.write(f"{dt.datetime.now().isoformat()} {msg}")
 
 
 def run_single_command(command, notifier, label=""):
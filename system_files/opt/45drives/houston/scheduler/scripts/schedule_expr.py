@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""Compiled schedule intervals shared by the replication, autosnap and
+task-file-creation scripts.
+
+A schedule JSON holds `intervals`, each with systemd-calendar-like fields:
+
+    {"minute": {"value": "0/15"}, "hour": {"value": "8..18"},
+     "day": {"value": "*"}, "month": {"value": "*"}, "year": {"value": "*"},
+     "dayOfWeek": ["Mon", "Fri"]}
+
+Field values are `*`, `A`, `A..B`, `A/N`, `*/N`, `A..B/N` or a comma list of
+those. Each interval is compiled once into one bitmask per field, and a
+schedule into per-field "which intervals allow this value" masks, so
+match_tier() is a handful of ANDs however many intervals there are.
+Compiled schedules are cached by content.
+
+    python3 schedule_expr.py next schedule.json [-n 10]   # upcoming fires
+    python3 schedule_expr.py bench [--intervals 5000]     # match benchmark
+"""
+import argparse
+import datetime
+import json
+import random
+import sys
+import time
+
+DOW_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+# (low, high) per field; systemd calendars stop at 2199.
+FIELDS = {
+    "second": (0, 59),
+    "minute": (0, 59),
+    "hour": (0, 23),
+    "day": (1, 31),
+    "month": (1, 12),
+    "year": (1970, 2199),
+}
+MATCH_FIELDS = ("minute", "hour", "day", "month", "year")
+
+
+def _int(text):
+    return int(str(text).strip())
+
+
+def parse_field(pattern, low, high):
+    """Bitmask (bit v-low set when v matches) for one field pattern.
+    Returns None for `*`, 0 for a pattern that can never match."""
+    pattern = str(pattern).strip()
+    if pattern == "*":
+        return None
+    mask = 0
+    for item in pattern.split(","):
+        item = item.strip()
+        try:
+            step = 1
+            stepped = "/" in item
+            if stepped:
+                item, step_text = item.split("/", 1)
+                step = _int(step_text)
+                if step <= 0:
+                    continue
+            if item == "*":
+                a, b = low, high
+            elif ".." in item:
+                a_text, b_text = item.split("..", 1)
+                a, b = _int(a_text), _int(b_text)
+            else:
+                a = _int(item)
+                # A/N repeats to the end of the range; plain A is one value.
+                b = high if stepped else a
+        except ValueError:
+            continue
+        for v in range(max(a, low), min(b, high) + 1, step):
+            if (v - a) % step == 0:
+                mask |= 1 << (v - low)
+    return mask
+
+
+def parse_dow(values):
+    """Bitmask over Mon=0..Sun=6; None when unrestricted. Ints count from
+    Sunday=0, as on_calendar() reads them."""
+    if not values:
+        return None
+    mask = 0
+    for v in values:
+        if isinstance(v, int):
+            mask |= 1 << ((max(0, min(6, v)) - 1) % 7)
+            continue
+        name = str(v).strip()[:3].title()
+        if name in DOW_NAMES:
+            mask |= 1 << DOW_NAMES.index(name)
+    return mask
+
+
+def _value(interval, field, default="*"):
+    spec = interval.get(field, {})
+    if isinstance(spec, dict):
+        return spec.get("value", default)
+    return default
+
+
+def _bits(mask, low, high):
+    if mask is None:
+        return list(range(low, high + 1))
+    return [low + i for i in range(high - low + 1) if mask >> i & 1]
+
+
+class CompiledInterval:
+    __slots__ = ("index", "masks", "dow", "specificity", "_lists")
+
+    def __init__(self, interval, index=0):
+        self.index = index
+        self.masks = {}
+        for field, (low, high) in FIELDS.items():
+            default = "0" if field == "second" else "*"
+            self.masks[field] = parse_field(_value(interval, field, default), low, high)
+        self.dow = parse_dow(interval.get("dayOfWeek", []))
+        # Same rule as before: count fields that are not a bare `*`.
+        self.specificity = sum(
+            1 for field in MATCH_FIELDS if str(_value(interval, field)).strip() != "*"
+        ) + (1 if interval.get("dayOfWeek", []) else 0)
+        self._lists = None
+
+    def _allows(self, field, value):
+        mask = self.masks[field]
+        return mask is None or bool(mask >> (value - FIELDS[field][0]) & 1)
+
+    def matches(self, now):
+        """True when the interval covers now's minute."""
+        if self.dow is not None and not self.dow >> now.weekday() & 1:
+            return False
+        return all(self._allows(field, getattr(now, field)) for field in MATCH_FIELDS)
+
+    def _day_matches(self, day):
+        if self.dow is not None and not self.dow >> day.weekday() & 1:
+            return False
+        return all(self._allows(f, getattr(day, f)) for f in ("day", "month", "year"))
+
+    def fires(self, after, until=None):
+        """Fire times strictly after `after`, in order (until `until`)."""
+        if self._lists is None:
+            self._lists = {f: _bits(self.masks[f], *FIELDS[f]) for f in ("hour", "minute", "second")}
+        hours, minutes, seconds = self._lists["hour"], self._lists["minute"], self._lists["second"]
+        if not (hours and minutes and seconds):
+            return
+        years = _bits(self.masks["year"], *FIELDS["year"])
+        day = after.replace(hour=0, minute=0, second=0, microsecond=0)
+        last_day = datetime.datetime(years[-1], 12, 31) if years else day
+        if until is not None:
+            last_day = min(last_day, until)
+        while day <= last_day:
+            if self.masks["year"] is not None and not self._allows("year", day.year):
+                # Skip whole years the interval never fires in.
+                nxt = [y for y in years if y > day.year]
+                if not nxt:
+                    return
+                day = datetime.datetime(nxt[0], 1, 1)
+                continue
+            if self._day_matches(day):
+                for h in hours:
+                    for m in minutes:
+                        for s in seconds:
+                            t = day.replace(hour=h, minute=m, second=s)
+                            if t > after:
+                                if until is not None and t > until:
+                                    return
+                                yield t
+            day += datetime.timedelta(days=1)
+
+
+class CompiledSchedule:
+    """All intervals of a schedule. Bit r of the per-value masks stands for
+    the interval ranked r-th by (specificity desc, index asc), so the lowest
+    set bit of the AND is the tier that wins."""
+
+    def __init__(self, intervals):
+        self.intervals = [CompiledInterval(iv, i) for i, iv in enumerate(intervals or [])]
+        ranked = sorted(self.intervals, key=lambda c: (-c.specificity, c.index))
+        self._rank_to_index = [c.index for c in ranked]
+        self._tables = {}
+        for field in MATCH_FIELDS:
+            low, high = FIELDS[field]
+            table = [0] * (high - low + 1)
+            for rank, c in enumerate(ranked):
+                for v in _bits(c.masks[field], low, high):
+                    table[v - low] |= 1 << rank
+            self._tables[field] = table
+        self._dow_table = [0] * 7
+        for rank, c in enumerate(ranked):
+            for d in range(7):
+                if c.dow is None or c.dow >> d & 1:
+                    self._dow_table[d] |= 1 << rank
+
+    def _candidates(self, now):
+        hit = self._dow_table[now.weekday()]
+        for field in MATCH_FIELDS:
+            low, high = FIELDS[field]
+            value = getattr(now, field)
+            if not low <= value <= high:
+                return 0
+            hit &= self._tables[field][value - low]
+            if not hit:
+                return 0
+        return hit
+
+    def matching(self, now):
+        """Indexes of every interval covering now, best tier first."""
+        hit = self._candidates(now)
+        out = []
+        while hit:
+            low_bit = hit & -hit
+            out.append(self._rank_to_index[low_bit.bit_length() - 1])
+            hit ^= low_bit
+        return out
+
+    def match_tier(self, now):
+        """Index of the most specific interval covering now (lowest index on
+        a tie); 0 when none does."""
+        hit = self._candidates(now)
+        if not hit:
+            return 0
+        return self._rank_to_index[(hit & -hit).bit_length() - 1]
+
+    def next_fires(self, after=None, count=10, until=None):
+        """The next `count` (time, [interval indexes]) fire events after
+        `after`; several indexes means those intervals fire together."""
+        import heapq
+        after = after or datetime.datetime.now()
+        gens = [(c.index, c.fires(after, until)) for c in self.intervals]
+        heap = []
+        for index, gen in gens:
+            t = next(gen, None)
+            if t is not None:
+                heap.append((t, index, gen))
+        heapq.heapify(heap)
+        events = []
+        while heap and len(events) < count:
+            t, index, gen = heapq.heappop(heap)
+            if events and events[-1][0] == t:
+                events[-1][1].append(index)
+            else:
+                events.append((t, [index]))
+            nxt = next(gen, None)
+            if nxt is not None:
+                heapq.heappush(heap, (nxt, index, gen))
+        # The last event may still be missing intervals that fire at the same time.
+        while heap and events and heap[0][0] == events[-1][0]:
+            _, index, _ = heapq.heappop(heap)
+            events[-1][1].append(index)
+        return events
+
+    def overlaps(self, after=None, count=1000, until=None):
+        """Fire events (within the next `count`) where intervals coincide."""
+        return [e for e in self.next_fires(after, count, until) if len(e[1]) > 1]
+
+
+_cache = {}
+_CACHE_MAX = 64
+
+
+def compile_schedule(intervals):
+    """CompiledSchedule for an interval list, cached by content."""
+    key = json.dumps(intervals or [], sort_keys=True, default=str)
+    compiled = _cache.get(key)
+    if compiled is None:
+        if len(_cache) >= _CACHE_MAX:
+            _cache.pop(next(iter(_cache)))
+        compiled = _cache[key] = CompiledSchedule(intervals)
+    return compiled
+
+
+def match_current_tier(intervals, now):
+    """Index of the most specific interval matching now; 0 if none does."""
+    return compile_schedule(intervals).match_tier(now)
+
+
+def on_calendar(interval):
+    """systemd OnCalendar= value for one interval."""
+    parts = []
+
+    if 'dayOfWeek' in interval and interval['dayOfWeek']:
+        dow_names = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+        normalized = []
+        for v in interval['dayOfWeek']:
+            if isinstance(v, int):
+                normalized.append(dow_names[max(0, min(6, v))])
+            else:
+                normalized.append(str(v)[:3].title())
+        parts.append(','.join(normalized))
+
+    year_part = interval.get('year', {}).get('value', '*')
+    month_part = interval.get('month', {}).get('value', '*')
+    day_part = interval.get('day', {}).get('value', '*')
+
+    # A step needs a concrete base: the 1st for days, 0 for hours/minutes.
+    if '/' in day_part:
+        base, step = day_part.split('/')
+        if base == '*':
+            base = '1'
+        day_part = f'{base}/{step}'
+
+    parts.append(f'{year_part}-{month_part}-{day_part}')
+
+    hour = interval.get('hour', {}).get('value', '*')
+    minute = interval.get('minute', {}).get('value', '*')
+    second = interval.get('second', {}).get('value', '0')
+
+    if '/' in hour:
+        base, step = hour.split('/')
+        if base == '*':
+            base = '0'
+        hour = f'{base}/{step}'
+
+    if '/' in minute:
+        base, step = minute.split('/')
+        if base == '*':
+            base = '0'
+        minute = f'{base}/{step}'
+
+    parts.append(f'{hour}:{minute}:{second}')
+    return ' '.join(parts)
+
+
+# --- command line -------------------------------------------------------------
+
+def _random_interval(rng):
+    def pick(low, high):
+        r = rng.random()
+        if r < 0.4:
+            return "*"
+        if r < 0.6:
+            return str(rng.randint(low, high))
+        if r < 0.75:
+            a = rng.randint(low, high)
+            return f"{a}..{rng.randint(a, high)}"
+        if r < 0.9:
+            return f"{rng.randint(low, low + 5)}/{rng.randint(2, 15)}"
+        return ",".join(str(rng.randint(low, high)) for _ in range(3))
+
+    interval = {
+        "minute": {"value": pick(0, 59)},
+        "hour": {"value": pick(0, 23)},
+        "day": {"value": pick(1, 28)},
+        "month": {"value": pick(1, 12)},
+        "year": {"value": "*"},
+    }
+    if rng.random() < 0.3:
+        interval["dayOfWeek"] = rng.sample(DOW_NAMES, rng.randint(1, 3))
+    return interval
+
+
+def _bench(args):
+    rng = random.Random(args.seed)
+    intervals = [_random_interval(rng) for _ in range(args.intervals)]
+    start = datetime.datetime(2026, 1, 1)
+    queries = [start + datetime.timedelta(minutes=rng.randint(0, 525600)) for _ in range(args.queries)]
+
+    t = time.perf_counter()
+    compiled = CompiledSchedule(intervals)
+    compile_s = time.perf_counter() - t
+
+    t = time.perf_counter()
+    fast = [compiled.match_tier(q) for q in queries]
+    fast_s = time.perf_counter() - t
+
+    # The old approach: test every interval in turn, keep the most specific.
+    def linear_tier(now):
+        best = None
+        for c in compiled.intervals:
+            if c.matches(now) and (best is None or c.specificity > best.specificity):
+                best = c
+        return best.index if best else 0
+
+    slow_queries = queries[:max(1, args.queries // 20)]
+    t = time.perf_counter()
+    slow = [linear_tier(q) for q in slow_queries]
+    slow_s = (time.perf_counter() - t) * len(queries) / len(slow_queries)
+    assert slow == fast[:len(slow)], "compiled and linear tiers disagree"
+
+    t = time.perf_counter()
+    events = compiled.next_fires(start, count=args.fires)
+    fires_s = time.perf_counter() - t
+
+    print(json.dumps({
+        "intervals": args.intervals,
+        "queries": args.queries,
+        "compile_ms": round(compile_s * 1000, 1),
+        "match_us_per_query": round(fast_s / len(queries) * 1e6, 2),
+        "linear_us_per_query": round(slow_s / len(queries) * 1e6, 1),
+        "speedup": round(slow_s / fast_s, 1) if fast_s else None,
+        "next_fires": len(events),
+        "next_fires_ms": round(fires_s * 1000, 1),
+    }, indent=2))
+
+
+def _next(args):
+    with open(args.schedule) as f:
+        data = json.load(f)
+    intervals = data.get("intervals", []) if isinstance(data, dict) else data
+    after = datetime.datetime.fromisoformat(args.after) if args.after else None
+    compiled = compile_schedule(intervals)
+    events = compiled.next_fires(after, args.count)
+    print(json.dumps([{"time": t.isoformat(), "intervals": idx} for t, idx in events], indent=2))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Schedule interval tools.")
+    sub = ap.add_subparsers(dest="cmd")
+    nx = sub.add_parser("next", help="print upcoming fire times of a schedule JSON")
+    nx.add_argument("schedule")
+    nx.add_argument("-n", "--count", type=int, default=10)
+    nx.add_argument("--after", help="ISO time to start from (default: now)")
+    bn = sub.add_parser("bench", help="tier matching benchmark")
+    bn.add_argument("--intervals", type=int, default=5000)
+    bn.add_argument("--queries", type=int, default=20000)
+    bn.add_argument("--fires", type=int, default=1000)
+    bn.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args(argv)
+    if args.cmd == "next":
+        _next(args)
+    elif args.cmd == "bench":
+        _bench(args)
+    else:
+        ap.print_help()
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
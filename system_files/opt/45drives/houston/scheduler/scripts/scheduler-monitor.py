@@ -8,19 +8,43 @@ alert notifications via the houston-notify D-Bus CLI.
 Sends a "Failed — Retrying" notification on first failure when systemd
 schedules a retry, then a final "Task Failed" notification when systemd
 gives up retrying.
+
+The journal is read with one UNIT= match per scheduler unit (the set is
+refreshed when task units are added or removed), so unrelated units are
+never parsed. The position (journal cursor), the retry bookkeeping and any
+notification still being delivered are kept in a state file, so a restart
+resumes exactly where the previous run stopped. Final notifications are
+sent from a small worker pool so a burst of completions does not queue
+behind each other's systemctl/journalctl/houston-notify calls.
 """
 
 import subprocess
 import json
 import sys
 import os
+import glob
+import select
 import signal
+import threading
 import time
 import socket
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
+try:
+    # Optional dependency: read the journal in-process when available.
+    from systemd import journal as sd_journal  # type: ignore
+    _sd_journal_available = True
+except Exception:
+    _sd_journal_available = False
+
 UNIT_PREFIX = "houston_scheduler_"
+UNIT_DIR = "/etc/systemd/system"
 DBUS_SCRIPT = "/opt/45drives/houston/houston-notify"
+STATE_PATH = os.environ.get("HOUSTON_MONITOR_STATE", "/var/lib/houston/scheduler/monitor-state.json")
+NOTIFY_WORKERS = max(1, int(os.environ.get("HOUSTON_MONITOR_WORKERS", "4")))
+# Seconds between checks of UNIT_DIR for added or removed tasks.
+RESCAN_INTERVAL = 2.0
 
 # All task types now use the monitor for scheduler_task_failure/success notifications.
 SELF_NOTIFYING_TYPES = set()
@@ -38,6 +62,7 @@ TASK_TYPE_LABELS = {
 # Track units currently in a failure/retry cycle.
 # unit -> {"retrying_notified": bool, "retry_count": int}
 # Present in dict = we saw "Failed with result" and are waiting for outcome.
+# Persisted in the state file.
 _pending_failures = {}
 
 # Units recently finalized — prevents duplicate notifications from the
@@ -46,9 +71,18 @@ _pending_failures = {}
 # unit -> monotonic timestamp when finalized
 _recently_finalized = {}
 
+_server_identity = None
+
 
 def _get_server_identity():
-    """Return (hostname, ip) for email context."""
+    """Return (hostname, ip) for email context (looked up once)."""
+    global _server_identity
+    if _server_identity is None:
+        _server_identity = _lookup_server_identity()
+    return _server_identity
+
+
+def _lookup_server_identity():
     hostname = socket.getfqdn()
     try:
         ip = socket.gethostbyname(hostname)
@@ -196,104 +230,289 @@ def send_retrying_notification(unit):
     print(f"[scheduler-monitor] Task retrying: {task_name} ({type_label})", flush=True)
 
 
-def main():
-    print("[scheduler-monitor] Starting Task Scheduler monitor daemon", flush=True)
-
-    def _shutdown(signum, frame):
-        print("[scheduler-monitor] Shutting down", flush=True)
-        sys.exit(0)
+class MonitorState:
+    """Journal cursor, pending failures and undelivered final notifications,
+    written atomically to STATE_PATH after every change."""
 
-    signal.signal(signal.SIGTERM, _shutdown)
-    signal.signal(signal.SIGINT, _shutdown)
+    def __init__(self, path):
+        self.path = path
+        self.cursor = None
+        self.outbox = {}
+        self._lock = threading.Lock()
 
-    proc = subprocess.Popen(
-        [
-            "journalctl", "-f", "-o", "json", "--no-pager",
-            "SYSLOG_IDENTIFIER=systemd",
-        ],
-        stdout=subprocess.PIPE,
-        universal_newlines=True,
+    @classmethod
+    def load(cls, path):
+        state = cls(path)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return state
+        except (OSError, ValueError) as e:
+            print(f"[scheduler-monitor] Ignoring unreadable state {path}: {e}", file=sys.stderr, flush=True)
+            return state
+        state.cursor = data.get("cursor") or None
+        state.outbox = dict(data.get("outbox") or {})
+        _pending_failures.update(data.get("pending") or {})
+        return state
+
+    def save(self):
+        with self._lock:
+            data = {
+                "cursor": self.cursor,
+                # dict() copies atomically; the main thread may be updating it.
+                "pending": dict(_pending_failures),
+                "outbox": dict(self.outbox),
+            }
+            tmp = f"{self.path}.tmp"
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(tmp, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print(f"[scheduler-monitor] Could not save state: {e}", file=sys.stderr, flush=True)
+
+    def add_job(self, job_id, unit, retry_count):
+        with self._lock:
+            self.outbox[job_id] = {"unit": unit, "retry_count": retry_count}
+        self.save()
+
+    def finish_job(self, job_id):
+        with self._lock:
+            self.outbox.pop(job_id, None)
+        self.save()
+
+
+def scheduler_units():
+    """Task service units currently installed."""
+    return sorted(
+        os.path.basename(p)
+        for p in glob.glob(os.path.join(UNIT_DIR, f"{UNIT_PREFIX}*.service"))
     )
 
-    try:
-        for line in proc.stdout:
+
+class SdJournalSource:
+    """Journal entries for `units` after `cursor` (or from now on), read
+    in-process via python-systemd."""
+
+    def __init__(self, units, cursor):
+        self._reader = sd_journal.Reader()
+        for unit in units:
+            # Matches on the same field are ORed.
+            self._reader.add_match(UNIT=unit)
+        positioned = False
+        if cursor:
             try:
-                entry = json.loads(line)
-            except (json.JSONDecodeError, ValueError):
+                self._reader.seek_cursor(cursor)
+                # Lands on the cursor entry itself when it still exists.
+                if self._reader.get_next() and not self._reader.test_cursor(cursor):
+                    self._reader.get_previous()
+                positioned = True
+            except Exception as e:
+                print(f"[scheduler-monitor] Saved cursor unusable ({e}); starting at the end", flush=True)
+        if not positioned:
+            self._reader.seek_tail()
+            self._reader.get_previous()
+
+    def read(self, timeout):
+        entries = []
+        while True:
+            entry = self._reader.get_next()
+            if not entry:
+                break
+            entries.append(entry)
+        if not entries:
+            self._reader.wait(timeout)
+        return entries
+
+    def close(self):
+        self._reader.close()
+
+
+class JournalctlSource:
+    """Same as SdJournalSource, via `journalctl -f -o json` with the unit
+    matches on its command line."""
+
+    def __init__(self, units, cursor):
+        cmd = ["journalctl", "-f", "-o", "json", "--no-pager"]
+        if cursor:
+            cmd += [f"--after-cursor={cursor}", "--no-tail"]
+        else:
+            cmd += ["-n", "0"]
+        cmd += [f"UNIT={unit}" for unit in units]
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        self._buf = b""
+
+    def read(self, timeout):
+        fd = self._proc.stdout.fileno()
+        ready, _, _ = select.select([fd], [], [], timeout)
+        if not ready:
+            return []
+        chunk = os.read(fd, 1 << 16)
+        if not chunk:
+            raise RuntimeError(f"journalctl exited with status {self._proc.wait()}")
+        lines = (self._buf + chunk).split(b"\n")
+        self._buf = lines.pop()
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
                 continue
+        return entries
+
+    def close(self):
+        self._proc.terminate()
+        try:
+            self._proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            self._proc.wait()
 
-            unit = entry.get("UNIT", "")
-            message = entry.get("MESSAGE", "")
 
-            if not unit.startswith(UNIT_PREFIX):
-                continue
-            if not unit.endswith(".service"):
-                continue
+def open_source(units, cursor):
+    if _sd_journal_available:
+        return SdJournalSource(units, cursor)
+    return JournalctlSource(units, cursor)
+
+
+def _deliver(state, job_id):
+    job = state.outbox.get(job_id)
+    if job is None:
+        return
+    try:
+        # Give systemd a moment to publish the unit's final Result.
+        time.sleep(0.5)
+        send_final_notification(job["unit"], retry_count=job.get("retry_count", 0))
+    except Exception as e:
+        print(f"[scheduler-monitor] Error handling {job['unit']}: {e}",
+              file=sys.stderr, flush=True)
+    finally:
+        state.finish_job(job_id)
+
 
-            # --- Success: task completed normally ---
-            if "Deactivated successfully" in message or "Succeeded." in message:
-                _pending_failures.pop(unit, None)
-                _recently_finalized[unit] = time.monotonic()
-                time.sleep(0.5)
+def handle_entry(entry, state, pool):
+    """Advance the retry state machine for one journal entry."""
+    unit = entry.get("UNIT", "")
+    message = entry.get("MESSAGE", "")
+    if isinstance(message, list):
+        # journalctl -o json encodes non-UTF-8 messages as byte arrays.
+        message = bytes(message).decode("utf-8", "replace")
+
+    if not unit.startswith(UNIT_PREFIX) or not unit.endswith(".service"):
+        return
+
+    def _finalize(retry_count):
+        _recently_finalized[unit] = time.monotonic()
+        job_id = entry.get("__CURSOR") or f"{unit}@{time.time()}"
+        state.add_job(job_id, unit, retry_count)
+        pool.submit(_deliver, state, job_id)
+
+    # --- Success: task completed normally ---
+    if "Deactivated successfully" in message or "Succeeded." in message:
+        _pending_failures.pop(unit, None)
+        _finalize(0)
+        return
+
+    # --- Process failed (emitted on EVERY failure exit) ---
+    if "Failed with result" in message:
+        # Skip if this unit was just finalized (systemd emits multiple
+        # messages in a burst when giving up on retries)
+        finalized_at = _recently_finalized.get(unit, 0)
+        if time.monotonic() - finalized_at < 5:
+            return
+        # Just record that this unit has failed. Don't send anything yet.
+        if unit not in _pending_failures:
+            _pending_failures[unit] = {"retrying_notified": False, "retry_count": 0}
+        return
+
+    # --- Systemd is scheduling a retry ---
+    if "Scheduled restart job" in message:
+        state_entry = _pending_failures.get(unit)
+        if state_entry:
+            state_entry["retry_count"] = state_entry.get("retry_count", 0) + 1
+            if not state_entry["retrying_notified"]:
+                state_entry["retrying_notified"] = True
                 try:
-                    send_final_notification(unit)
+                    send_retrying_notification(unit)
                 except Exception as e:
-                    print(f"[scheduler-monitor] Error handling {unit}: {e}",
+                    print(f"[scheduler-monitor] Error sending retry notif for {unit}: {e}",
                           file=sys.stderr, flush=True)
-                continue
+        return
+
+    # --- Systemd gave up retrying (final failure) ---
+    if "Start request repeated too quickly" in message or "Failed to start" in message:
+        # Only send if we have pending state (prevents duplicates from
+        # the burst of messages systemd emits)
+        if unit not in _pending_failures:
+            return
+        retry_count = _pending_failures.pop(unit).get("retry_count", 0)
+        _finalize(retry_count)
 
-            # --- Process failed (emitted on EVERY failure exit) ---
-            if "Failed with result" in message:
-                # Skip if this unit was just finalized (systemd emits multiple
-                # messages in a burst when giving up on retries)
-                finalized_at = _recently_finalized.get(unit, 0)
-                if time.monotonic() - finalized_at < 5:
-                    continue
-                # Just record that this unit has failed. Don't send anything yet.
-                if unit not in _pending_failures:
-                    _pending_failures[unit] = {"retrying_notified": False, "retry_count": 0}
-                continue
 
-            # --- Systemd is scheduling a retry ---
-            if "Scheduled restart job" in message:
-                state = _pending_failures.get(unit)
-                if state:
-                    state["retry_count"] = state.get("retry_count", 0) + 1
-                    if not state["retrying_notified"]:
-                        state["retrying_notified"] = True
-                        try:
-                            send_retrying_notification(unit)
-                        except Exception as e:
-                            print(f"[scheduler-monitor] Error sending retry notif for {unit}: {e}",
-                                  file=sys.stderr, flush=True)
+def main():
+    print("[scheduler-monitor] Starting Task Scheduler monitor daemon", flush=True)
+
+    def _shutdown(signum, frame):
+        print("[scheduler-monitor] Shutting down", flush=True)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    state = MonitorState.load(STATE_PATH)
+    pool = ThreadPoolExecutor(max_workers=NOTIFY_WORKERS, thread_name_prefix="notify")
+    # Notifications a previous run had not finished delivering.
+    for job_id in list(state.outbox):
+        pool.submit(_deliver, state, job_id)
+
+    source = None
+    units = None
+    unit_dir_mtime = None
+    try:
+        while True:
+            try:
+                mtime = os.stat(UNIT_DIR).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != unit_dir_mtime or source is None:
+                unit_dir_mtime = mtime
+                current = scheduler_units()
+                if current != units or source is None:
+                    if source is not None:
+                        source.close()
+                        source = None
+                    units = current
+                    if units:
+                        source = open_source(units, state.cursor)
+                        print(f"[scheduler-monitor] Watching {len(units)} task units", flush=True)
+            if source is None:
+                time.sleep(RESCAN_INTERVAL)
                 continue
 
-            # --- Systemd gave up retrying (final failure) ---
-            if "Start request repeated too quickly" in message or "Failed to start" in message:
-                # Only send if we have pending state (prevents duplicates from
-                # the burst of messages systemd emits)
-                if unit not in _pending_failures:
-                    continue
-                retry_count = _pending_failures[unit].get("retry_count", 0)
-                _pending_failures.pop(unit, None)
-                _recently_finalized[unit] = time.monotonic()
-                time.sleep(0.5)
-                try:
-                    send_final_notification(unit, retry_count=retry_count)
-                except Exception as e:
-                    print(f"[scheduler-monitor] Error handling final failure {unit}: {e}",
-                          file=sys.stderr, flush=True)
+            try:
+                entries = source.read(RESCAN_INTERVAL)
+            except Exception as e:
+                print(f"[scheduler-monitor] Journal read failed: {e}; reopening", file=sys.stderr, flush=True)
+                source.close()
+                source = None
+                time.sleep(RESCAN_INTERVAL)
                 continue
 
+            for entry in entries:
+                handle_entry(entry, state, pool)
+                state.cursor = entry.get("__CURSOR") or state.cursor
+                # Only lifecycle messages of task units get here, so saving
+                # after each one is cheap and a restart never replays one.
+                state.save()
     except KeyboardInterrupt:
         pass
     finally:
-        proc.terminate()
-        try:
-            proc.wait(timeout=10)
-        except subprocess.TimeoutExpired:
-            proc.kill()
-            proc.wait()
+        state.save()
+        if source is not None:
+            source.close()
+        pool.shutdown(wait=True)
 
 
 if __name__ == "__main__":
@@ -8,6 +8,8 @@ import traceback
 import datetime as dt
 
 from notify import get_notifier
+from debuglog import get_debug_log
+from admission import admit
 
 
 class SafeStream:
@@ -45,14 +47,12 @@ notifier = get_notifier()
 DEBUG_LOG = os.environ.get("SCRUB_DEBUG_LOG", "/tmp/scrub_debug.log")
 DEBUG_ENABLED = os.environ.get("SCRUB_DEBUG", "1").strip().lower() in ("1", "true", "yes", "on")
 
+_debug_log = get_debug_log(DEBUG_LOG) if DEBUG_ENABLED else None
+
 def dbg(msg: str):
     if not DEBUG_ENABLED:
         return
-    try:
-        with open(DEBUG_LOG, "a") as f:
-            f.write(f"{dt.datetime.now().isoformat()} {msg}\n")
-    except Exception:
-        pass
+    _debug_log.write(f"{dt.datetime.now().isoformat()} {msg}")
 SCAN_RE = re.compile(r"scan:\s+(?P<state>[\w\s]+)\s+(?P<rest>.*)", re.IGNORECASE)
 PCT_RE = re.compile(r"(\d+(?:\.\d+)?)%")
 
@@ -123,6 +123,9 @@ def main():
 
         notifier.notify("STATUS=Starting scrub task…")
         notifier.notify("READY=1")
+
+        # Wait for a scrub / pool slot; held until the scrub finishes.
+        admit("scrub", [pool], label=f"scrub of {pool}", notifier=notifier)
         notifier.notify("STATUS=Triggering scrub…")
 
         start_scrub(pool)
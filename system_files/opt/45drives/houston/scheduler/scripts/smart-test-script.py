@@ -4,6 +4,7 @@ import os
 import traceback
 import datetime as dt
 from notify import get_notifier
+from debuglog import get_debug_log
 
 
 class SafeStream:
@@ -41,14 +42,12 @@ notifier = get_notifier()
 DEBUG_LOG = os.environ.get("SMART_DEBUG_LOG", "/tmp/smart_test_debug.log")
 DEBUG_ENABLED = os.environ.get("SMART_DEBUG", "1").strip().lower() in ("1", "true", "yes", "on")
 
+_debug_log = get_debug_log(DEBUG_LOG) if DEBUG_ENABLED else None
+
 def dbg(msg: str):
     if not DEBUG_ENABLED:
         return
-    try:
-        with open(DEBUG_LOG, "a") as f:
-            f.write(f"{dt.datetime.now().isoformat()} {msg}\n")
-    except Exception:
-        pass
+    _debug_log.write(f"{dt.datetime.now().isoformat()} {msg}")
 
 def run_smartctl_test(diskPathList, testType):
     valid_test_types = ['offline', 'short', 'long', 'conveyance']
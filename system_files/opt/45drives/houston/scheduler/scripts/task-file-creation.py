@@ -6,6 +6,8 @@ import json
 import os
 import logging
 
+from schedule_expr import on_calendar
+
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 SCHEDULER_CONF_PATH = "/opt/45drives/houston/scheduler/scheduler.conf"
@@ -97,55 +99,7 @@ def read_schedule_json(file_path):
 
 def interval_to_on_calendar(interval):
     logging.debug(f'Converting interval to OnCalendar format: {interval}')
-    parts = []
-    
-    if 'dayOfWeek' in interval and interval['dayOfWeek']:
-        DOW_NAMES = ['Sun','Mon','Tue','Wed','Thu','Fri','Sat']
-        normalized = []
-        for v in interval['dayOfWeek']:
-            if isinstance(v, int):
-                normalized.append(DOW_NAMES[max(0, min(6, v))])
-            else:
-                normalized.append(str(v)[:3].title())
-        parts.append(','.join(normalized))
-    
-    year_part = interval.get('year', {}).get('value', '*')
-    month_part = interval.get('month', {}).get('value', '*')
-    day_part = interval.get('day', {}).get('value', '*')
-    
-    # Modify the parts if they contain a slash and the base is not an asterisk
-    if '/' in day_part:
-        base, step = day_part.split('/')
-        if base == '*':
-            base = '1'  # Default to starting from the 1st day if base is '*'
-        day_part = f'{base}/{step}'
-    
-    date_part = f'{year_part}-{month_part}-{day_part}'
-    parts.append(date_part)
-    
-    hour = interval.get('hour', {}).get('value', '*')
-    minute = interval.get('minute', {}).get('value', '*')
-    second = interval.get('second', {}).get('value', '0')
-    
-    # Modify the parts if they contain a slash
-    if '/' in hour:
-        base, step = hour.split('/')
-        if base == '*':
-            base = '0'  # Default to starting from 0 if base is '*'
-        hour = f'{base}/{step}'
-    
-    if '/' in minute:
-        base, step = minute.split('/')
-        if base == '*':
-            base = '0'  # Default to starting from 0 if base is '*'
-        minute = f'{base}/{step}'
-    
-    time_part = f'{hour}:{minute}:{second}'
-    parts.append(time_part)
-    
-    on_calendar_value = ' '.join(parts)
-    
-    return 'OnCalendar=' + on_calendar_value
+    return 'OnCalendar=' + on_calendar(interval)
 
 def replace_placeholders(template_content, parameters):
     logging.debug('Replacing placeholders in the template')
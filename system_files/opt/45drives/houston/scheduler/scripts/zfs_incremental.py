@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""Changed-path lists for rsync and cloud sync tasks from `zfs diff`.
+
+rsync and rclone find what to send by scanning and stat()ing the whole
+source on every run, which on a share with tens of millions of files is
+most of the runtime even when little changed. When the source is on ZFS,
+begin() snapshots the dataset, diffs that snapshot against the one kept
+from the last successful run, and writes the paths that were added,
+modified or renamed (and those removed) as lists for rsync or rclone
+`--files-from`. The transfer reads from the snapshot under .zfs/snapshot,
+so it sees one consistent point in time.
+
+The first run, or one whose base snapshot is gone, is a full transfer from
+the new snapshot. So is a run whose target (destination, filters, custom
+arguments) differs from the one the base was sent to: the diff only says
+what changed since the last send to the old target. commit() makes the new
+snapshot the base for next time and destroys the old one; discard() drops
+the new snapshot so the next run diffs from the same base again. A run
+killed before either leaves its snapshot behind; the next begin() destroys
+such leftovers for the task.
+
+Sources with child datasets mounted below them are refused: those files are
+neither in the parent's snapshot nor in its diff.
+
+Base snapshots are recorded in HOUSTON_INCREMENTAL_DIR (default
+/var/lib/houston/scheduler/incremental), one JSON file per task.
+"""
+import datetime
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+STATE_DIR = os.environ.get("HOUSTON_INCREMENTAL_DIR", "/var/lib/houston/scheduler/incremental")
+SNAPSHOT_PREFIX = "houston-inc"
+
+# zfs diff writes bytes outside printable ASCII (and spaces) as \0NNN octal.
+_ESCAPE_RE = re.compile(rb"\\0([0-7]{3})")
+
+
+def _zfs(*args, check=True):
+    return subprocess.run(["zfs"] + list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=check)
+
+
+def _unescape(raw):
+    return os.fsdecode(_ESCAPE_RE.sub(lambda m: bytes([int(m.group(1), 8)]), raw))
+
+
+def _state_path(key):
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", key)
+    return os.path.join(STATE_DIR, f"{safe}.json")
+
+
+def _load_state(key):
+    try:
+        with open(_state_path(key)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _snapshot_exists(snapshot):
+    return _zfs("list", "-H", "-t", "snapshot", "-o", "name", snapshot, check=False).returncode == 0
+
+
+def _destroy_leftovers(dataset, tag, keep):
+    """Destroy this task's snapshots on *dataset* other than *keep*: ones
+    left by runs that were killed before commit() or discard()."""
+    p = _zfs("list", "-H", "-d", "1", "-t", "snapshot", "-o", "name", dataset, check=False)
+    if p.returncode != 0:
+        return
+    ours = re.compile(re.escape(f"{dataset}@{SNAPSHOT_PREFIX}-{tag}-") + r"\d{14}$")
+    for name in p.stdout.split():
+        if name != keep and ours.match(name):
+            _zfs("destroy", name, check=False)
+
+
+def _child_mounts(dataset, path):
+    """Descendant datasets of *dataset* mounted at or below *path*."""
+    p = _zfs("list", "-H", "-r", "-o", "name,mountpoint,mounted", dataset, check=False)
+    if p.returncode != 0:
+        raise OSError(f"zfs list -r {dataset} failed: {p.stderr.strip()}")
+    prefix = path.rstrip("/") + "/"
+    children = []
+    for line in p.stdout.splitlines():
+        fields = line.split("\t")
+        if len(fields) < 3 or fields[0] == dataset or fields[2] != "yes":
+            continue
+        mountpoint = fields[1]
+        if mountpoint == path or mountpoint.startswith(prefix):
+            children.append(fields[0])
+    return children
+
+
+def _dataset_for(path):
+    """(dataset, mountpoint) holding a local path, or None if not on ZFS."""
+    try:
+        p = _zfs("list", "-H", "-o", "name,mountpoint", path, check=False)
+    except OSError:
+        return None
+    if p.returncode != 0 or not p.stdout.strip():
+        return None
+    name, mountpoint = p.stdout.strip().splitlines()[0].split("\t")
+    if not mountpoint.startswith("/"):
+        return None
+    return name, mountpoint
+
+
+class IncrementalRun:
+    """One run's snapshot and, unless it is a full run, its change lists."""
+
+    def __init__(self, key, dataset, mountpoint, subdir, snapshot, previous, workdir, replaces=None,
+                 target=None, full_reason=""):
+        self.key = key
+        self.dataset = dataset
+        self.mountpoint = mountpoint
+        self.subdir = subdir
+        self.snapshot = snapshot
+        self.previous = previous
+        self.workdir = workdir
+        # The base recorded for this task, which commit() supersedes.
+        self.replaces = replaces
+        self.target = target
+        # Why this is a full run (when it is one).
+        self.full_reason = full_reason
+        self.changed_list = None
+        self.removed_list = None
+        self.changed = 0
+        self.removed = 0
+
+    @property
+    def full(self):
+        return self.changed_list is None
+
+    def _snapshot_dir(self, snapshot):
+        root = os.path.join(self.mountpoint, ".zfs", "snapshot", snapshot.split("@", 1)[1])
+        return os.path.join(root, self.subdir, "") if self.subdir else root + "/"
+
+    @property
+    def source(self):
+        """The task's source directory inside the new snapshot (with /)."""
+        return self._snapshot_dir(self.snapshot)
+
+    def commit(self):
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp = _state_path(self.key) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"dataset": self.dataset, "subdir": self.subdir, "snapshot": self.snapshot,
+                       "target": self.target, "time": datetime.datetime.now().isoformat()}, f)
+        os.replace(tmp, _state_path(self.key))
+        if self.replaces and self.replaces != self.snapshot:
+            _zfs("destroy", self.replaces, check=False)
+        self._cleanup()
+
+    def discard(self):
+        _zfs("destroy", self.snapshot, check=False)
+        self._cleanup()
+
+    def _cleanup(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _diff(self, include_dirs, sep):
+        """Write the change lists from `zfs diff previous snapshot`."""
+        if sep == b"\n":
+            # A newline-separated list cannot hold such a name; it is skipped.
+            def keep(path):
+                return "\n" not in path
+        else:
+            def keep(path):
+                return True
+        prefix = os.path.join(self.mountpoint, self.subdir).rstrip("/") + "/"
+        source = self.source
+        previous_source = self._snapshot_dir(self.previous)
+        self.changed_list = os.path.join(self.workdir, "changed.list")
+        self.removed_list = os.path.join(self.workdir, "removed.list")
+
+        def rel(raw):
+            path = _unescape(raw)
+            return path[len(prefix):] if path.startswith(prefix) else None
+
+        proc = subprocess.Popen(["zfs", "diff", "-H", "-F", self.previous, self.snapshot],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with open(self.changed_list, "wb") as changed, open(self.removed_list, "wb") as removed:
+            def add(path, is_dir):
+                if path and (include_dirs or not is_dir) and keep(path):
+                    changed.write(os.fsencode(path) + sep)
+                    self.changed += 1
+
+            def drop(path, is_dir):
+                if path and (include_dirs or not is_dir) and keep(path):
+                    removed.write(os.fsencode(path) + sep)
+                    self.removed += 1
+
+            def walk(root, path, record):
+                # A renamed directory shows up as one entry, so its contents
+                # are listed from the snapshot that has them: new paths from
+                # the new snapshot, gone paths from the previous one (which
+                # also covers a removed directory's contents).
+                if not path:
+                    return
+                record(path, True)
+                stack = [path]
+                while stack:
+                    d = stack.pop()
+                    try:
+                        with os.scandir(os.path.join(root, d)) as it:
+                            for entry in it:
+                                child = f"{d}/{entry.name}"
+                                is_dir = entry.is_dir(follow_symlinks=False)
+                                if is_dir:
+                                    stack.append(child)
+                                record(child, is_dir)
+                    except OSError:
+                        continue
+
+            for line in proc.stdout:
+                fields = line.rstrip(b"\n").split(b"\t")
+                if len(fields) < 3:
+                    continue
+                change, kind = fields[0], fields[1]
+                is_dir = kind == b"/"
+                path = rel(fields[2])
+                if change in (b"+", b"M"):
+                    add(path, is_dir)
+                elif change == b"-":
+                    if is_dir:
+                        walk(previous_source, path, drop)
+                    else:
+                        drop(path, False)
+                elif change == b"R" and len(fields) > 3:
+                    new = rel(fields[3])
+                    if is_dir:
+                        walk(previous_source, path, drop)
+                        walk(source, new, add)
+                    else:
+                        drop(path, False)
+                        add(new, False)
+        err = proc.stderr.read().decode(errors="replace").strip()
+        if proc.wait() != 0:
+            raise OSError(f"zfs diff {self.previous} {self.snapshot} failed: {err}")
+
+
+def begin(source_path, key, include_dirs=True, sep=b"\0", target=None):
+    """Snapshot the dataset holding source_path and list what changed since
+    the last committed run, one path per `sep` (directories only when
+    include_dirs). *target* (JSON-serialisable) describes where and what
+    the task sends; a base recorded for another target is not diffed from.
+    Returns None when the source is not a directory on a mounted ZFS
+    dataset (the caller then runs as usual); raises OSError when it cannot
+    be used, e.g. with child datasets mounted below it."""
+    source_path = os.path.realpath(source_path)
+    if not os.path.isdir(source_path):
+        return None
+    found = _dataset_for(source_path)
+    if not found:
+        return None
+    dataset, mountpoint = found
+    subdir = os.path.relpath(source_path, mountpoint)
+    subdir = "" if subdir == "." else subdir
+    children = _child_mounts(dataset, source_path)
+    if children:
+        raise OSError(f"{source_path} has child datasets mounted below it ({', '.join(children[:5])}"
+                      f"{', …' if len(children) > 5 else ''}), which its snapshots do not include")
+
+    state = _load_state(key)
+    replaces = previous = state.get("snapshot")
+    tag = re.sub(r"[^A-Za-z0-9_.:-]", "_", key)
+    _destroy_leftovers(dataset, tag, previous)
+    stamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    snapshot = f"{dataset}@{SNAPSHOT_PREFIX}-{tag}-{stamp}"
+    p = _zfs("snapshot", snapshot, check=False)
+    if p.returncode != 0:
+        raise OSError(f"zfs snapshot {snapshot} failed: {p.stderr.strip()}")
+
+    reason = ""
+    if not previous:
+        reason = "no previous snapshot"
+    elif state.get("dataset") != dataset or state.get("subdir") != subdir:
+        reason = "source changed since the previous snapshot"
+    elif state.get("target") != target:
+        reason = "destination or filters changed since the previous snapshot"
+    elif not _snapshot_exists(previous):
+        reason = f"previous snapshot {previous} is gone"
+    if reason:
+        previous = None
+
+    run = IncrementalRun(key, dataset, mountpoint, subdir, snapshot, previous,
+                         tempfile.mkdtemp(prefix="houston-zfs-diff-"), replaces,
+                         target=target, full_reason=reason)
+    if previous:
+        try:
+            run._diff(include_dirs, sep)
+        except OSError:
+            run.discard()
+            raise
+    return run
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Stream `zfs list` output line by line straight from a Popen pipe.
+
+Used by the replication and autosnap scripts to walk snapshot listings that
+can run to hundreds of thousands of lines: records are parsed and handed to
+the caller as they arrive, so neither the raw output nor a full list of
+records has to be held in memory.
+"""
+import threading
+from collections import deque
+
+# Dataset-missing errors, which callers treat as "no snapshots" rather than
+# a failure.
+_MISSING_MARKERS = ("dataset does not exist", "cannot open")
+
+
+class ZfsListStream:
+    """Iterate parse(line) for each line a `zfs list` process prints.
+
+    Lines for which parse returns None are skipped. Once exhausted (or
+    closed early), returncode, timed_out, missing and stderr_text() report
+    how the listing ended. A watchdog kills the process after *timeout*s.
+    """
+
+    def __init__(self, proc, parse, timeout=None):
+        self._proc = proc
+        self._parse = parse
+        self._stderr = deque(maxlen=200)
+        self._stderr_thread = threading.Thread(target=self._read_stderr, daemon=True)
+        self._stderr_thread.start()
+        self._timer = None
+        self.timed_out = False
+        self.returncode = None
+        if timeout:
+            self._timer = threading.Timer(timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _read_stderr(self):
+        try:
+            for line in iter(self._proc.stderr.readline, b""):
+                self._stderr.append(line)
+        except Exception:
+            pass
+
+    def _expire(self):
+        self.timed_out = True
+        try:
+            self._proc.kill()
+        except Exception:
+            pass
+
+    def __iter__(self):
+        parse = self._parse
+        try:
+            for raw_line in self._proc.stdout:
+                rec = parse(raw_line.decode(errors="replace"))
+                if rec is not None:
+                    yield rec
+        finally:
+            self.close()
+
+    def close(self):
+        if self.returncode is not None:
+            return
+        try:
+            self._proc.stdout.close()
+        except Exception:
+            pass
+        self.returncode = self._proc.wait()
+        if self._timer:
+            self._timer.cancel()
+        self._stderr_thread.join(5)
+
+    @property
+    def missing(self):
+        """True when the listing failed because the dataset does not exist."""
+        if not self.returncode:
+            return False
+        err = self.stderr_text().lower()
+        return any(marker in err for marker in _MISSING_MARKERS)
+
+    def stderr_text(self):
+        return b"".join(self._stderr).decode(errors="replace")